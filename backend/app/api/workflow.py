@@ -1,11 +1,37 @@
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import JSONResponse, StreamingResponse
-from app.models.workflow import WorkflowRequest, WorkflowResponse
+from typing import List, Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from app.core.config import settings
+from app.core.metrics import metrics_registry
+from app.models.workflow import (
+    ApiOperation,
+    BatchResponseFormat,
+    BatchWorkflowRequest,
+    OpenApiRegistration,
+    Recipe,
+    RecipeReplayRequest,
+    RunInfo,
+    RunStatus,
+    RunSubmission,
+    WorkflowRequest,
+    WorkflowResponse,
+)
+from app.services.openapi_index import SpecError
+from app.services.run_queue import RunQueueFull
+from app.services.run_registry import RunAlreadyActive
 from app.services.workflow_service import WorkflowService
 
 router = APIRouter()
 
 
+async def _check_workspace(workspace: Optional[str]) -> None:
+    if workspace and not await WorkflowService.has_openapi_spec(workspace):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Workspace '{workspace}' has no registered OpenAPI spec",
+        )
+
+
 @router.post("/execute-stream", tags=["Workflow"])
 async def execute_workflow_stream(request: WorkflowRequest):
     """
@@ -16,10 +42,35 @@ async def execute_workflow_stream(request: WorkflowRequest):
 
     Events you can listen for on the client:
     - **plan_created**: The initial plan is generated.
-    - **api_call_completed**: An API call step has finished.
+    - **api_call_completed**: An API call step has finished. `retries` and
+      `hedges` count the repeated and duplicate requests it needed; `cache`
+      is `hit`, `revalidated` or `miss` for calls eligible for the HTTP cache
+      (opt out per workflow with `http_cache: false`).
+    - **for_each_item_completed**: One element of a `for_each` step has finished.
+    - **for_each_completed**: A `for_each` step has finished, with every response.
     - **data_extracted**: Data has been extracted from an API response.
+      `extracted_data_patch` holds the JSON Patch (RFC 6902) operations
+      turning the data of the previous `data_extracted` event (or `{}`) into
+      the data extracted so far.
     - **error**: An error occurred.
+    - **recipe_compiled**: The run was saved as a replayable recipe (only when `compile` is set).
     - **end**: The workflow has successfully completed.
+
+    Every event carries `elapsed_ms` since the start of the run; node events
+    also carry a `timing` record (offset, duration, LLM tokens, HTTP status and
+    response size) for drawing a waterfall. Event ids number the events of
+    the run from 1, and a `: keep-alive` comment is sent while the run is
+    silent for `SSE_HEARTBEAT_SECONDS`.
+
+    The run executes in the background and is checkpointed after every step.
+    Its id is returned in the `X-Run-Id` header (and in `plan_created`), for
+    re-attaching with `/runs/{run_id}/events` or resuming with
+    `/runs/{run_id}/resume`. Once no client follows it anymore, the run is
+    cancelled along with its in-flight LLM and API calls, and checkpointed
+    as `cancelled`.
+
+    With a `workspace` whose OpenAPI spec is registered, the LLM builds the
+    calls from the spec's operations most relevant to each step.
     """
     try:
         validation = await WorkflowService.validate_workflow_request(request.prompt)
@@ -28,10 +79,15 @@ async def execute_workflow_stream(request: WorkflowRequest):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=validation["error"],
             )
+        await _check_workspace(request.workspace)
 
-        event_generator = await WorkflowService.execute_workflow_stream(request)
+        run_id, event_generator = await WorkflowService.execute_workflow_stream(request)
 
-        return StreamingResponse(event_generator, media_type="text/event-stream")
+        return StreamingResponse(
+            event_generator,
+            media_type="text/event-stream",
+            headers={"X-Run-Id": run_id},
+        )
 
     except HTTPException:
         raise
@@ -42,6 +98,284 @@ async def execute_workflow_stream(request: WorkflowRequest):
         )
 
 
+@router.post("/execute-batch", tags=["Workflow"])
+async def execute_workflow_batch(request: BatchWorkflowRequest):
+    """
+    Execute a batch of workflows concurrently on a single stream.
+
+    Up to `max_parallelism` workflows run at once. Every event carries the
+    `workflow_id` (the workflow's index in the request) it belongs to. The
+    response is an SSE stream, or NDJSON when `format` is `ndjson`.
+
+    Extracted data is sent as patches as in `/execute-stream`, each relative to
+    the previous `data_extracted` event of the same workflow.
+
+    Events, in addition to the per-workflow ones of `/execute-stream`:
+    - **batch_summary**: Sent last, with per-workflow status and latency.
+    """
+    if len(request.workflows) > settings.BATCH_MAX_WORKFLOWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch can hold at most {settings.BATCH_MAX_WORKFLOWS} workflows.",
+        )
+
+    for index, workflow in enumerate(request.workflows):
+        validation = await WorkflowService.validate_workflow_request(workflow.prompt)
+        if not validation["valid"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Workflow {index}: {validation['error']}",
+            )
+        await _check_workspace(workflow.workspace)
+
+    try:
+        event_generator = await WorkflowService.execute_workflow_batch(request)
+        media_type = (
+            "application/x-ndjson"
+            if request.format == BatchResponseFormat.NDJSON
+            else "text/event-stream"
+        )
+        return StreamingResponse(event_generator, media_type=media_type)
+
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to execute workflow batch: {str(e)}",
+        )
+
+
+@router.post(
+    "/runs",
+    response_model=RunSubmission,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Workflow"],
+)
+async def submit_run(request: WorkflowRequest):
+    """
+    Queue a workflow and return its run id at once.
+
+    A pool of `RUN_QUEUE_WORKERS` workers executes queued runs in submission
+    order; the run does not depend on any client connection. Poll
+    `/runs/{run_id}` for its status, or follow `/runs/{run_id}/events` at any
+    time (events are replayed from the start). Once `RUN_QUEUE_MAX_SIZE` runs
+    wait, submissions are rejected with 429 until the queue drains.
+    """
+    validation = await WorkflowService.validate_workflow_request(request.prompt)
+    if not validation["valid"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=validation["error"],
+        )
+    await _check_workspace(request.workspace)
+
+    try:
+        submission = await WorkflowService.submit_run(request)
+    except RunQueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+        )
+    return submission
+
+
+@router.get("/runs/{run_id}", response_model=RunInfo, tags=["Workflow"])
+async def get_run(run_id: str):
+    """
+    Get the status and progress of a run from its last checkpoint, and its
+    position in the run queue while it waits for a worker.
+    """
+    run = await WorkflowService.get_run(run_id)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Run '{run_id}' not found",
+        )
+    return run
+
+
+@router.get("/runs/{run_id}/events", tags=["Workflow"])
+async def attach_to_run(
+    run_id: str,
+    after: int = 0,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Re-attach to a running (or recently finished) run and stream its events.
+
+    Events are replayed from index `after` on, so a client that lost its
+    connection passes the number of events it already received, which is
+    the id of the last one. A `Last-Event-ID` header, as sent by a
+    reconnecting EventSource, takes precedence over `after`.
+    """
+    if last_event_id is not None and last_event_id.isdigit():
+        after = int(last_event_id)
+    event_generator = WorkflowService.attach_to_run(run_id, after)
+    if event_generator is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Run '{run_id}' is not running on this server",
+        )
+    return StreamingResponse(event_generator, media_type="text/event-stream")
+
+
+@router.post("/runs/{run_id}/resume", tags=["Workflow"])
+async def resume_run(run_id: str):
+    """
+    Resume an interrupted, failed or cancelled run from its last checkpoint.
+
+    Steps that already succeeded are not run again; failed steps are retried.
+    The response is the same event stream as `/execute-stream`.
+    """
+    run = await WorkflowService.get_run(run_id)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Run '{run_id}' not found",
+        )
+    if run.active or run.status == RunStatus.COMPLETED:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Run '{run_id}' is {'still running' if run.active else 'already completed'}",
+        )
+
+    try:
+        resumed = await WorkflowService.resume_run(run_id)
+    except RunAlreadyActive:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Run '{run_id}' is still running",
+        )
+    if resumed is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Run '{run_id}' not found",
+        )
+    return StreamingResponse(
+        WorkflowService.attach_to_run(resumed.run_id),
+        media_type="text/event-stream",
+        headers={"X-Run-Id": resumed.run_id},
+    )
+
+
+@router.post(
+    "/runs/{run_id}/cancel",
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Workflow"],
+)
+async def cancel_run(run_id: str):
+    """
+    Cancel a queued run, or one executing on this server, along with its
+    in-flight LLM and API calls. The run is checkpointed as `cancelled` and
+    can be resumed.
+    """
+    if not await WorkflowService.cancel_run(run_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Run '{run_id}' is not queued or running on this server",
+        )
+    return {"run_id": run_id, "status": RunStatus.CANCELLED}
+
+
+@router.get("/bodies/{body_id}", tags=["Workflow"])
+async def get_response_body(body_id: str):
+    """
+    Download the full body of a large API response.
+
+    Responses above `RESPONSE_SPILL_THRESHOLD_BYTES` are not included in
+    events or run state; their response data is a reference instead, with
+    `body_ref`, `size`, `content_type` and a `preview` of the body.
+    """
+    body = WorkflowService.get_response_body(body_id)
+    if body is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Response body '{body_id}' not found",
+        )
+    path, content_type = body
+    return FileResponse(path, media_type=content_type)
+
+
+@router.get("/recipes/{recipe_id}", response_model=Recipe, tags=["Workflow"])
+async def get_recipe(recipe_id: str):
+    """
+    Get a recipe compiled from a successful run.
+    """
+    recipe = await WorkflowService.get_recipe(recipe_id)
+    if recipe is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Recipe '{recipe_id}' not found",
+        )
+    return recipe
+
+
+@router.post(
+    "/recipes/{recipe_id}/replay", response_model=WorkflowResponse, tags=["Workflow"]
+)
+async def replay_recipe(recipe_id: str, request: RecipeReplayRequest):
+    """
+    Replay a compiled recipe with new parameter values.
+
+    Only the recorded HTTP calls are made; no LLM is involved, so a replay
+    takes about as long as the API calls themselves.
+    """
+    recipe = await WorkflowService.get_recipe(recipe_id)
+    if recipe is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Recipe '{recipe_id}' not found",
+        )
+    try:
+        return await WorkflowService.replay_recipe(recipe, request.parameters)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to replay recipe: {str(e)}",
+        )
+
+
+@router.put(
+    "/workspaces/{workspace}/openapi",
+    response_model=OpenApiRegistration,
+    tags=["Workflow"],
+)
+async def register_openapi_spec(
+    workspace: str, request: Request, base_url: Optional[str] = None
+):
+    """
+    Register the OpenAPI 3 or Swagger 2 spec (JSON or YAML request body) of
+    the API a workspace's workflows call, replacing any previous one.
+
+    The spec is indexed once and the index persisted. Workflows that name the
+    workspace are shown only the operations most relevant to each prompt and
+    step, however large the spec is. `base_url` overrides the spec's server.
+    """
+    spec_text = (await request.body()).decode("utf-8", errors="replace")
+    try:
+        return await WorkflowService.register_openapi_spec(workspace, spec_text, base_url)
+    except SpecError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+
+@router.get(
+    "/workspaces/{workspace}/openapi/operations",
+    response_model=List[ApiOperation],
+    tags=["Workflow"],
+)
+async def search_openapi_operations(
+    workspace: str, q: str, k: Optional[int] = Query(None, ge=1, le=100)
+):
+    """
+    Search a workspace's registered spec for the operations the LLM would be
+    shown for a prompt or step description.
+    """
+    await _check_workspace(workspace)
+    return await WorkflowService.search_operations(workspace, q, k)
+
+
 @router.post("/validate", tags=["Workflow"])
 async def validate_workflow_prompt(request: WorkflowRequest):
     """
@@ -73,3 +407,14 @@ async def workflow_health_check():
         "service": "workflow",
         "message": "Workflow service is running"
     }
+
+
+@router.get("/metrics", tags=["Workflow"], response_class=PlainTextResponse)
+async def workflow_metrics():
+    """
+    Metrics of the workflow service in the Prometheus text exposition format:
+    per-node latency, LLM token usage, and target API status and body sizes.
+    """
+    return PlainTextResponse(
+        metrics_registry.render(), media_type="text/plain; version=0.0.4"
+    )
@@ -1,8 +1,151 @@
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     GEMINI_API_KEY: str
     CORS_ORIGIN: str = "*"
+
+    # LLM models; overrides map a chain name (plan, one_shot_plan, api_call, for_each_call, extract_data) to a model
+    LLM_MODEL: str = "gemini-1.5-flash-8b"
+    LLM_MODEL_OVERRIDES: Dict[str, str] = {}
+    # re-read system_prompts.py when it changes on disk
+    PROMPT_HOT_RELOAD: bool = False
+    # default planning mode: "stepwise" or "one_shot" (whole plan with API
+    # call templates in a single LLM call, per-step calls only as a fallback)
+    PLANNING_MODE: str = "stepwise"
+
+    # Outgoing HTTP client used for workflow API calls
+    HTTP_TIMEOUT: float = 10.0
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_MAX_CONNECTIONS: int = 200
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    # attempts per method, retries included (methods not listed are sent
+    # once); network errors and these statuses are retried with jittered
+    # exponential backoff, or after the response's Retry-After
+    HTTP_RETRY_MAX_ATTEMPTS: Dict[str, int] = {"GET": 3, "HEAD": 3, "OPTIONS": 3}
+    HTTP_RETRY_STATUSES: List[int] = [408, 429, 502, 503, 504]
+    HTTP_RETRY_BASE_DELAY: float = 0.2
+    HTTP_RETRY_MAX_DELAY: float = 5.0
+    # send a duplicate of an idempotent call still unanswered after the
+    # host's HTTP_HEDGE_PERCENTILE latency; the first answer wins
+    HTTP_HEDGE_ENABLED: bool = False
+    HTTP_HEDGE_METHODS: List[str] = ["GET", "HEAD"]
+    HTTP_HEDGE_PERCENTILE: float = 0.95
+    HTTP_HEDGE_MIN_SAMPLES: int = 20
+    # consecutive failures (network errors, 5xx) after which a host is
+    # skipped for HTTP_CIRCUIT_RESET_SECONDS (0 disables the breaker)
+    HTTP_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    HTTP_CIRCUIT_RESET_SECONDS: float = 30.0
+    # Cache of GET and HEAD responses following their Cache-Control, ETag
+    # and Last-Modified headers; kept in memory and, with HTTP_CACHE_DB_PATH,
+    # in a SQLite file shared between workers
+    HTTP_CACHE_ENABLED: bool = True
+    HTTP_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    HTTP_CACHE_MAX_ENTRY_BYTES: int = 4 * 1024 * 1024
+    HTTP_CACHE_DB_PATH: Optional[str] = None
+    HTTP_CACHE_DISK_MAX_BYTES: int = 512 * 1024 * 1024
+    # Response bodies above the threshold are streamed to a content-addressed
+    # store (BODY_STORE_DIR, a temp directory by default) and only referenced
+    # from the run's state and events, with a preview; extraction rules still
+    # see bodies up to RESPONSE_SPILL_PARSE_MAX_BYTES
+    RESPONSE_SPILL_THRESHOLD_BYTES: int = 1024 * 1024
+    RESPONSE_PREVIEW_BYTES: int = 2048
+    RESPONSE_SPILL_PARSE_MAX_BYTES: int = 32 * 1024 * 1024
+    BODY_STORE_DIR: Optional[str] = None
+    BODY_STORE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    BODY_STORE_TTL_SECONDS: float = 24 * 3600
+
+    # Plan cache in front of the planning LLM call
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_MAX_ENTRIES: int = 1024
+    PLAN_CACHE_TTL_SECONDS: float = 24 * 60 * 60
+    PLAN_CACHE_DB_PATH: Optional[str] = None
+
+    # Compiled recipes held in memory (least recently used evicted first),
+    # and an optional SQLite file persisting them all
+    RECIPE_MAX_ENTRIES: int = 1024
+    RECIPE_DB_PATH: Optional[str] = None
+
+    # Reuse of the plans of past successful runs for similarly worded prompts,
+    # matched by the Jaccard similarity of their word shingles (MinHash/LSH).
+    # Above the reuse threshold the plan is served without the LLM; above the
+    # suggest threshold it is shown to the planning LLM as a reference.
+    SIMILAR_PLANS_ENABLED: bool = True
+    SIMILAR_PLAN_REUSE_THRESHOLD: float = 0.75
+    SIMILAR_PLAN_SUGGEST_THRESHOLD: float = 0.4
+    SIMILAR_PLANS_MAX_ENTRIES: int = 2048
+    SIMILAR_PLANS_TTL_SECONDS: float = 7 * 24 * 60 * 60
+
+    # OpenAPI specs registered per workspace, indexed once and persisted to
+    # OPENAPI_INDEX_DB_PATH (in memory only when unset); only the operations
+    # most relevant to a prompt or step are shown to the LLM
+    OPENAPI_INDEX_DB_PATH: Optional[str] = "openapi_index.db"
+    OPENAPI_TOP_K: int = 8
+
+    # Workflow graph execution
+    MAX_PARALLEL_STEPS: int = 4
+    GRAPH_RECURSION_LIMIT: int = 100
+    # generate the API calls of the steps a running call unblocks while its
+    # HTTP request is in flight
+    SPECULATIVE_PREFETCH: bool = True
+    # for_each steps: requests in flight per step, and the longest list accepted
+    FOR_EACH_MAX_CONCURRENCY: int = 16
+    FOR_EACH_MAX_ITEMS: int = 5000
+
+    # LLM call budget shared by every workflow
+    LLM_MAX_CONCURRENCY: int = 16
+    # provider quotas enforced client-side with token buckets (0 disables one)
+    LLM_REQUESTS_PER_MINUTE: int = 1000
+    LLM_TOKENS_PER_MINUTE: int = 1_000_000
+    # output tokens assumed per call when debiting the token bucket up front
+    LLM_ESTIMATED_OUTPUT_TOKENS: int = 512
+    # API responses shown to the extraction LLM are compacted to about this
+    # many tokens (long arrays sampled, long strings cut, unrelated keys
+    # dropped); 0 sends them whole
+    EXTRACT_RESPONSE_TOKEN_BUDGET: int = 4000
+    # retries of rate-limited or unavailable calls, honouring Retry-After
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_DELAY: float = 1.0
+    LLM_RETRY_MAX_DELAY: float = 60.0
+
+    # Single-flight coalescing of identical concurrent LLM calls and plans
+    SINGLE_FLIGHT_ENABLED: bool = True
+    # also coalesce identical concurrent GET/HEAD steps (opt-in: only safe
+    # when the target API's GETs are idempotent and not per-caller)
+    HTTP_COALESCE_GETS: bool = False
+
+    # Run checkpoints, for resuming runs after a crash or redeploy: Postgres
+    # when DATABASE_URL is set, a local SQLite file otherwise
+    RUN_CHECKPOINTS_ENABLED: bool = True
+    DATABASE_URL: Optional[str] = None
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 10
+    RUN_CHECKPOINT_SQLITE_PATH: str = "runs.db"
+    # how long a finished run's events can still be re-attached to
+    RUN_EVENTS_RETENTION_SECONDS: float = 300
+    # cancel a run, with its in-flight LLM and HTTP calls, once its last
+    # client disconnected and nobody re-attached within the grace period;
+    # the run is checkpointed as cancelled and can be resumed
+    RUN_CANCEL_ON_DISCONNECT: bool = True
+    RUN_DISCONNECT_GRACE_SECONDS: float = 0
+    # SSE heartbeat comment sent after this long without an event, so proxies
+    # keep idle streams open during long LLM calls (0 disables it)
+    SSE_HEARTBEAT_SECONDS: float = 15
+
+    # Run queue of POST /runs: workers executing queued runs (and so the most
+    # runs, with their LLM and HTTP calls, in flight at once) and the most
+    # runs that may wait for a worker before submissions are rejected
+    RUN_QUEUE_WORKERS: int = 8
+    RUN_QUEUE_MAX_SIZE: int = 1000
+
+    # Batch execution
+    BATCH_MAX_WORKFLOWS: int = 500
+    BATCH_MAX_PARALLELISM: int = 8
+    # fraction of LLM_MAX_CONCURRENCY all running batches may occupy together
+    BATCH_LLM_SHARE: float = 0.5
+
     model_config = SettingsConfigDict(env_file=".env")
 
 settings = Settings()
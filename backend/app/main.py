@@ -1,12 +1,31 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.router import api_router
 from app.core.config import settings
+from app.services.agents.chains import chain_registry
+from app.services.http_client import http_client_pool
+from app.services.run_queue import run_queue
+from app.services.run_registry import run_registry
+from app.services.run_store import run_store
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    chain_registry.build_all()
+    yield
+    await run_queue.aclose()
+    # runs checkpoint their cancellation, so they stop before the store closes
+    await run_registry.aclose()
+    await http_client_pool.aclose()
+    await run_store.aclose()
+
 
 app = FastAPI(
     title="ApiFlow API",
     description="A natural language interface for testing API workflows.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
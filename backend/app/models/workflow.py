@@ -13,10 +13,21 @@ class ActionType(str, Enum):
     """Defines the type of action to be performed in a plan step."""
     API_CALL = "api_call"
     DATA_EXTRACTION = "data_extraction"
+    FOR_EACH = "for_each"
+
+class ExtractionRule(BaseModel):
+    """Deterministically extracts one variable from an API response."""
+    variable: str = Field(..., description="The snake_case name the extracted value is stored under, e.g. auth_token.")
+    path: str = Field(..., description="A JSONPath ($.data.token) or dotted path (data.token) locating the value in the JSON response.")
 
 class PlanStep(BaseModel):
     description: str = Field(..., description="A clear, human-readable summary of what this step accomplishes.")
     action_type: ActionType = Field(..., description="The type of action to be performed in this step.")
+    extraction_rules: Optional[List[ExtractionRule]] = Field(None, description="Optional rules extracting values from this step's (or, for data_extraction, the previous step's) API response, when the response shape is known.")
+    consumes: Optional[List[str]] = Field(None, description="snake_case names of the variables produced by earlier steps that this step needs. Use an empty list when it needs nothing from earlier steps.")
+    produces: Optional[List[str]] = Field(None, description="snake_case names of the variables later steps need from this step, e.g. auth_token.")
+    api_template: Optional["ApiDetails"] = Field(None, description="For api_call and for_each steps in one-shot planning: the complete API call, with {placeholders} named after the consumed variables.")
+    iterate_over: Optional[str] = Field(None, description="For for_each steps: the snake_case name of the list, produced by an earlier step, whose elements the step's API call is made for. The element is available as {item}, and its fields as {item[field]}.")
 
 class Plan(BaseModel):
     """A root model to hold the list of plan steps."""
@@ -39,6 +50,10 @@ class ApiDetails(BaseModel):
     method: HttpMethod = Field(..., description="The HTTP method for the request.")
     body: Optional[Dict[str, Any]] = Field(None, description="The JSON body for POST/PUT requests. Use placeholders for dynamic data.")
     headers: Optional[Dict[str, str]] = Field(None, description="Request headers. Use placeholders for dynamic values like auth tokens.")
+    extraction_rules: Optional[List[ExtractionRule]] = Field(None, description="Rules extracting values later steps need from this call's JSON response, when its shape is known.")
+
+PlanStep.model_rebuild()
+Plan.model_rebuild()
 
 '''
     NODE 3 DATA EXTRACTION NODE MODELS
@@ -49,8 +64,29 @@ class ExtractedData(RootModel[Dict[str, Any]]):
 '''
     WORKFLOW REQUEST AND RESPONSE MODELS
 '''
+class PlanningMode(str, Enum):
+    """Defines how a workflow is planned."""
+    # a plan of step descriptions; each API call is generated when its step runs
+    STEPWISE = "stepwise"
+    # one call plans every step with its API call template and extraction rules
+    ONE_SHOT = "one_shot"
+
 class WorkflowRequest(BaseModel):
     prompt: str
+    workspace: Optional[str] = Field(None, description="The workspace whose registered OpenAPI spec grounds the generated API calls.")
+    compile: bool = Field(False, description="Save a successful run as a recipe that can be replayed without LLM calls.")
+    planning_mode: Optional[PlanningMode] = Field(None, description="How the workflow is planned. Defaults to PLANNING_MODE.")
+    http_cache: bool = Field(True, description="Serve GET and HEAD calls from the HTTP response cache when their Cache-Control headers allow.")
+
+class BatchResponseFormat(str, Enum):
+    """Defines how batch results are streamed back."""
+    SSE = "sse"
+    NDJSON = "ndjson"
+
+class BatchWorkflowRequest(BaseModel):
+    workflows: List[WorkflowRequest] = Field(..., min_length=1)
+    max_parallelism: Optional[int] = Field(None, ge=1, description="How many workflows of the batch run at once. Defaults to BATCH_MAX_PARALLELISM.")
+    format: BatchResponseFormat = BatchResponseFormat.SSE
 
 class WorkflowStepResponse(BaseModel):
     step_title: str
@@ -61,6 +97,76 @@ class WorkflowStepResponse(BaseModel):
 class WorkflowResponse(BaseModel):
     results: List[WorkflowStepResponse]
     plan: Optional[Plan]
+    extracted_data: Dict[str, Any] = Field(default_factory=dict)
+    error: Optional[str] = None
+
+'''
+    RECIPE MODELS
+'''
+class RecipeStep(BaseModel):
+    step_index: int
+    action_type: ActionType
+    api_details: Optional[ApiDetails] = Field(None, description="The API call template, with {placeholders} for extracted data and prompt parameters.")
+    extraction_rules: List[ExtractionRule] = Field(default_factory=list)
+
+class Recipe(BaseModel):
+    """A successful run compiled into deterministic, LLM-free steps."""
+    recipe_id: str
+    prompt: str
+    plan: Plan
+    steps: List[RecipeStep]
+    parameters: Dict[str, Any] = Field(default_factory=dict, description="The default value of each prompt parameter placeholder.")
+
+class RecipeReplayRequest(BaseModel):
+    parameters: Dict[str, Any] = Field(default_factory=dict, description="Values overriding the recipe's default parameters.")
+
+
 
 
+'''
+    WORKSPACE MODELS
+'''
+class ApiOperation(BaseModel):
+    """One operation of a registered OpenAPI spec, as offered to the LLM."""
+    method: str
+    url: str = Field(..., description="The server URL joined with the operation's path, with path parameters as <name>.")
+    operation_id: Optional[str] = None
+    summary: Optional[str] = None
+    parameters: List[str] = Field(default_factory=list, description="Parameters as 'name (in, type, required)'.")
+    body: Optional[Dict[str, Any]] = Field(None, description="The request body's properties, mapped to their types.")
+
+class OpenApiRegistration(BaseModel):
+    workspace: str
+    operations: int
+    version: str = Field(..., description="Hash of the registered spec.")
 
+'''
+    RUN MODELS
+'''
+class RunStatus(str, Enum):
+    """Defines the lifecycle states of a workflow run."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class RunInfo(BaseModel):
+    """The last checkpoint of a workflow run."""
+    run_id: str
+    status: RunStatus
+    request: WorkflowRequest
+    plan: Optional[Plan] = None
+    completed_steps: List[int] = Field(default_factory=list)
+    extracted_data: Dict[str, Any] = Field(default_factory=dict)
+    error: Optional[str] = None
+    active: bool = Field(False, description="Whether the run is executing in this server process and can be attached to.")
+    queue_position: Optional[int] = Field(None, description="The run's position in the run queue (1 is next), while it waits for a worker.")
+    created_at: float
+    updated_at: float
+
+class RunSubmission(BaseModel):
+    """A run accepted into the run queue."""
+    run_id: str
+    status: RunStatus = RunStatus.QUEUED
+    queue_position: int
@@ -0,0 +1,168 @@
+import importlib
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Type
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+from langchain_google_genai import ChatGoogleGenerativeAI
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.models.workflow import ApiDetails, Plan
+from app.services.agents import system_prompts
+from app.services.instrumentation import token_usage_callback
+
+
+class ChainSpec:
+    """Describes how a chain is built: its prompt messages and output schema."""
+
+    def __init__(
+        self,
+        messages: Callable[[], List[Tuple[str, str]]],
+        schema: Optional[Type[BaseModel]] = None,
+    ) -> None:
+        # messages are read lazily so a prompt reload is picked up on rebuild
+        self.messages = messages
+        self.schema = schema
+
+
+CHAIN_SPECS: Dict[str, ChainSpec] = {
+    "plan": ChainSpec(
+        lambda: [
+            ("system", system_prompts.WORKFLOW_PLAN_SYSTEM_PROMPT),
+            ("human", system_prompts.WORKFLOW_PLAN_HUMAN_PROMPT),
+        ],
+        Plan,
+    ),
+    "one_shot_plan": ChainSpec(
+        lambda: [
+            ("system", system_prompts.ONE_SHOT_PLAN_SYSTEM_PROMPT),
+            ("human", system_prompts.WORKFLOW_PLAN_HUMAN_PROMPT),
+        ],
+        Plan,
+    ),
+    "api_call": ChainSpec(
+        lambda: [
+            ("system", system_prompts.API_CALL_SYSTEM_PROMPT),
+            ("human", system_prompts.API_CALL_HUMAN_PROMPT),
+        ],
+        ApiDetails,
+    ),
+    "for_each_call": ChainSpec(
+        lambda: [
+            ("system", system_prompts.FOR_EACH_CALL_SYSTEM_PROMPT),
+            ("human", system_prompts.FOR_EACH_CALL_HUMAN_PROMPT),
+        ],
+        ApiDetails,
+    ),
+    "extract_data": ChainSpec(
+        lambda: [
+            ("system", system_prompts.EXTRACT_DATA_SYSTEM_PROMPT),
+            ("human", system_prompts.EXTRACT_DATA_HUMAN_PROMPT),
+        ],
+    ),
+}
+
+
+def create_llm(model: str) -> BaseChatModel:
+    """Creates the chat model used for a model name."""
+    return ChatGoogleGenerativeAI(
+        model=model,
+        temperature=0.1,
+        api_key=settings.GEMINI_API_KEY,
+    )
+
+
+def _prompts_mtime() -> float:
+    try:
+        return os.path.getmtime(system_prompts.__file__)
+    except OSError:
+        return 0.0
+
+
+class ChainRegistry:
+    """
+    Builds every prompt template, structured-output model and chain once and
+    hands out the cached instances, so the nodes do not rebuild them on each
+    step.
+
+    Chains are cached per (chain name, model), which allows per-chain model
+    overrides through `LLM_MODEL_OVERRIDES`. With `PROMPT_HOT_RELOAD` set,
+    edits to `system_prompts.py` are picked up on the next lookup.
+    """
+
+    def __init__(self, llm_factory: Callable[[str], BaseChatModel] = create_llm) -> None:
+        self._llm_factory = llm_factory
+        self._llms: Dict[str, BaseChatModel] = {}
+        self._chains: Dict[Tuple[str, str], Runnable] = {}
+        self._prompts_mtime = _prompts_mtime()
+        self._lock = threading.Lock()
+
+    def model_for(self, name: str) -> str:
+        return settings.LLM_MODEL_OVERRIDES.get(name, settings.LLM_MODEL)
+
+    def llm(self, model: Optional[str] = None) -> BaseChatModel:
+        """Returns the shared chat model instance for a model name."""
+        model = model or settings.LLM_MODEL
+        if model not in self._llms:
+            self._llms[model] = self._llm_factory(model)
+        return self._llms[model]
+
+    def _build(self, name: str, model: str) -> Runnable:
+        spec = CHAIN_SPECS[name]
+        prompt_template = ChatPromptTemplate.from_messages(spec.messages())
+        llm = self.llm(model)
+        if spec.schema is not None:
+            chain = prompt_template | llm.with_structured_output(spec.schema)
+        else:
+            chain = prompt_template | llm
+        return chain.with_config(callbacks=[token_usage_callback])
+
+    def get(self, name: str, model: Optional[str] = None) -> Runnable:
+        """
+        Returns the cached chain for a name, building it on first use.
+
+        Args:
+            name: One of the names in CHAIN_SPECS
+            model: Optional model variant; defaults to the chain's configured model
+        """
+        if settings.PROMPT_HOT_RELOAD:
+            self._reload_if_changed()
+        key = (name, model or self.model_for(name))
+        chain = self._chains.get(key)
+        if chain is None:
+            with self._lock:
+                chain = self._chains.get(key) or self._build(*key)
+                self._chains[key] = chain
+        return chain
+
+    def build_all(self) -> None:
+        """Builds every chain for its configured model, e.g. at startup."""
+        for name in CHAIN_SPECS:
+            self.get(name)
+
+    def _reload_if_changed(self) -> None:
+        mtime = _prompts_mtime()
+        if mtime != self._prompts_mtime:
+            self._prompts_mtime = mtime
+            self.reload_prompts()
+
+    def reload_prompts(self) -> None:
+        """Re-imports `system_prompts.py` and drops every built chain."""
+        with self._lock:
+            importlib.reload(system_prompts)
+            self._chains.clear()
+        logging.info("Reloaded system prompts")
+
+    def use_llm_factory(self, llm_factory: Callable[[str], BaseChatModel]) -> None:
+        """Swaps the chat model factory, e.g. for a scripted model in benchmarks."""
+        with self._lock:
+            self._llm_factory = llm_factory
+            self._llms.clear()
+            self._chains.clear()
+
+
+chain_registry = ChainRegistry()
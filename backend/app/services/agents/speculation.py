@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app.core.metrics import metrics_registry
+from app.models.workflow import ApiDetails
+from app.services.instrumentation import add_timing, new_timing, use_timing
+from app.services.templates import template_placeholders
+
+
+SPECULATIONS = metrics_registry.counter(
+    "workflow_speculations_total",
+    "Speculatively generated API calls by outcome: hit (used), miss (discarded "
+    "and regenerated), failed, or unused (the run ended first).",
+    ["outcome"],
+)
+TIME_SAVED = metrics_registry.counter(
+    "workflow_speculation_saved_seconds_total",
+    "LLM time taken off the critical path by speculative API call generation.",
+)
+
+
+async def _generate_detached(
+    generate: Callable[[], Awaitable[ApiDetails]], timing: Dict[str, Any]
+) -> ApiDetails:
+    # the task's copy of the context points at the starting step's timing
+    # record, which is published when that step ends, likely before this call
+    use_timing(timing)
+    return await generate()
+
+
+class _Speculation:
+    __slots__ = ("task", "timing", "started", "finished")
+
+    def __init__(self, task: asyncio.Task, timing: Dict[str, Any]) -> None:
+        self.task = task
+        self.timing = timing
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        task.add_done_callback(self._done)
+
+    def _done(self, task: asyncio.Task) -> None:
+        self.finished = time.perf_counter()
+        # marks the error retrieved: a speculation that failed is only
+        # awaited, and the error logged, if its step takes it
+        if not task.cancelled():
+            task.exception()
+
+
+class Speculator:
+    """
+    Holds API call templates generated ahead of time for steps that are still
+    waiting on another step.
+
+    While a step's HTTP request is in flight, the templates of the steps it
+    unblocks are generated with placeholders for the values it will produce.
+    When such a step runs it takes its template from here; a template that
+    references values which never appeared is discarded and the step
+    generates its call as usual. The LLM usage of a speculation is counted
+    in the timing of the step that takes it.
+    """
+
+    def __init__(self) -> None:
+        self._speculations: Dict[Tuple[str, int], _Speculation] = {}
+
+    def start(
+        self,
+        run_id: str,
+        step_index: int,
+        generate: Callable[[], Awaitable[ApiDetails]],
+    ) -> None:
+        """Starts generating the template of a step unless it is already underway."""
+        key = (run_id, step_index)
+        if key not in self._speculations:
+            timing = new_timing("make_api_call", step_index)
+            self._speculations[key] = _Speculation(
+                asyncio.ensure_future(_generate_detached(generate, timing)), timing
+            )
+
+    async def take(
+        self, run_id: str, step_index: int, available: Set[str]
+    ) -> Optional[ApiDetails]:
+        """
+        Returns the speculated template of a step if there is one and every
+        placeholder in it can be filled from the `available` variables.
+        """
+        speculation = self._speculations.pop((run_id, step_index), None)
+        if speculation is None:
+            return None
+
+        requested = time.perf_counter()
+        try:
+            template = await speculation.task
+        except Exception as e:
+            logging.warning(f"Speculative API call for step {step_index} failed: {e}")
+            SPECULATIONS.inc(outcome="failed")
+            return None
+        finally:
+            add_timing(speculation.timing)
+
+        missing = template_placeholders(
+            template.model_dump(exclude={"extraction_rules"})
+        ) - available
+        if missing:
+            logging.info(
+                f"Discarding speculative API call for step {step_index}: "
+                f"{sorted(missing)} never became available"
+            )
+            SPECULATIONS.inc(outcome="miss")
+            return None
+
+        # Without speculation the call would have started now and taken as long
+        finished = speculation.finished or time.perf_counter()
+        generation_time = finished - speculation.started
+        waited = max(0.0, finished - requested)
+        SPECULATIONS.inc(outcome="hit")
+        TIME_SAVED.inc(max(0.0, generation_time - waited))
+        return template
+
+    def discard_run(self, run_id: str) -> None:
+        """Cancels the speculations a finished run never used."""
+        for key in [key for key in self._speculations if key[0] == run_id]:
+            self._speculations.pop(key).task.cancel()
+            SPECULATIONS.inc(outcome="unused")
+
+
+speculator = Speculator()
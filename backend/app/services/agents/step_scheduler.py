@@ -0,0 +1,122 @@
+from typing import Iterable, List, Optional, Set
+
+from app.models.workflow import ActionType, Plan
+
+
+def _produced_variables(plan: Plan, index: int) -> Set[str]:
+    step = plan.steps[index]
+    variables = set(step.produces or [])
+    variables.update(rule.variable for rule in step.extraction_rules or [])
+    return variables
+
+
+# steps that make HTTP requests; a data_extraction step parses the response
+# of the latest one before it (for for_each, the list of responses)
+REQUEST_ACTIONS = {ActionType.API_CALL, ActionType.FOR_EACH}
+
+
+def source_api_step(plan: Plan, index: int) -> Optional[int]:
+    """Returns the API call step whose response a data_extraction step parses."""
+    return next(
+        (
+            i
+            for i in range(index - 1, -1, -1)
+            if plan.steps[i].action_type in REQUEST_ACTIONS
+        ),
+        None,
+    )
+
+
+def _finisher(plan: Plan, index: int) -> int:
+    """
+    Returns the step after which the output of `index` is fully available.
+
+    An API call's data is only in `extracted_data` once the data_extraction
+    steps directly following it have run, so consumers wait for those too.
+    """
+    last = index
+    while (
+        last + 1 < len(plan.steps)
+        and plan.steps[last + 1].action_type == ActionType.DATA_EXTRACTION
+    ):
+        last += 1
+    return last
+
+
+def step_dependencies(plan: Plan) -> List[Set[int]]:
+    """
+    Computes, for every step, the indices of the earlier steps it waits for.
+
+    A step depends on the latest earlier step producing each variable it
+    consumes. API calls that do not declare `consumes`, or consume a variable
+    no earlier step declares, conservatively wait for every earlier step. A
+    data_extraction step always waits for the API call whose response it
+    parses.
+    """
+    dependencies: List[Set[int]] = []
+    for index, step in enumerate(plan.steps):
+        depends_on: Set[int] = set()
+
+        if step.action_type == ActionType.DATA_EXTRACTION:
+            source = source_api_step(plan, index)
+            if source is not None:
+                depends_on.add(source)
+
+        if step.consumes is None:
+            # A data_extraction step only reads its source response.
+            if step.action_type != ActionType.DATA_EXTRACTION:
+                depends_on.update(range(index))
+        else:
+            for variable in step.consumes:
+                producer = next(
+                    (
+                        i
+                        for i in range(index - 1, -1, -1)
+                        if variable in _produced_variables(plan, i)
+                    ),
+                    None,
+                )
+                if producer is None:
+                    depends_on.update(range(index))
+                    break
+                finisher = _finisher(plan, producer)
+                depends_on.add(finisher if finisher < index else producer)
+
+        dependencies.append(depends_on)
+    return dependencies
+
+
+def ready_steps(plan: Plan, completed: Iterable[int]) -> List[int]:
+    """Returns the not yet completed steps whose dependencies have all completed."""
+    done = set(completed)
+    return [
+        index
+        for index, depends_on in enumerate(step_dependencies(plan))
+        if index not in done and depends_on <= done
+    ]
+
+
+def unblocked_by(plan: Plan, index: int, completed: Iterable[int]) -> List[int]:
+    """
+    Returns the API call steps that become ready once `index` and the
+    data_extraction steps directly following it have completed.
+    """
+    done = set(completed)
+    pending = set(range(index, _finisher(plan, index) + 1))
+    return [
+        later
+        for later, depends_on in enumerate(step_dependencies(plan))
+        if later > index
+        and later not in done
+        and plan.steps[later].action_type == ActionType.API_CALL
+        and depends_on & pending
+        and depends_on <= done | pending
+    ]
+
+
+def pending_variables(plan: Plan, index: int) -> Set[str]:
+    """The variables `index` and its data_extraction steps will produce."""
+    variables: Set[str] = set()
+    for step in range(index, _finisher(plan, index) + 1):
+        variables |= _produced_variables(plan, step)
+    return variables
@@ -21,10 +21,18 @@ You must generate a JSON object with the following structure. Do NOT add any ext
   }},
   "headers": {{
     "key": "value"
-  }}
+  }},
+  "extraction_rules": [
+    {{ "variable": "snake_case_name", "path": "$.json.path.to.value" }}
+  ]
 }}
 ```
 
+**REGISTERED OPERATIONS:**
+`api_operations` lists the operations of the target API's OpenAPI spec that best match this step (it is empty when no spec is registered). When one of them fits, build the call from it: its method, its URL with every `<name>` path parameter replaced by the actual value, and a body following its body fields. Do not invent endpoints the spec does not list.
+
+`extraction_rules` is optional. When you know the shape of this endpoint's JSON response and a later step needs a value from it (a token, an id, ...), add one rule per value with a JSONPath (`$.data.token`, `$.items[0].id`) or dotted path (`data.token`). These rules are evaluated locally, which is far faster than another extraction pass.
+
 **EXAMPLE:**
 **PROVIDED CONTEXT:**
 - user_prompt: "Log me in with user 'admin' and pass 'pass123', then get my profile details using the token."
@@ -66,10 +74,18 @@ You must generate a JSON object with the following structure. Do NOT add any ext
   }},
   "headers": {{
     "key": "value"
-  }}
+  }},
+  "extraction_rules": [
+    {{ "variable": "snake_case_name", "path": "$.json.path.to.value" }}
+  ]
 }}
 ```
 
+**REGISTERED OPERATIONS:**
+`api_operations` lists the operations of the target API's OpenAPI spec that best match this step (it is empty when no spec is registered). When one of them fits, build the call from it: its method, its URL with every `<name>` path parameter replaced by the actual value, and a body following its body fields. Do not invent endpoints the spec does not list.
+
+`extraction_rules` is optional. When you know the shape of this endpoint's JSON response and a later step needs a value from it (a token, an id, ...), add one rule per value with a JSONPath (`$.data.token`, `$.items[0].id`) or dotted path (`data.token`). These rules are evaluated locally, which is far faster than another extraction pass.
+
 **EXAMPLE:**
 **PROVIDED CONTEXT:**
 - user_prompt: "Log me in with user 'admin' and pass 'pass123', then get my profile details using the token."
@@ -108,6 +124,10 @@ Example Format: `["First step description", "Second step description", ...]`
 2. **State Dependencies:** If a step requires information from a previous step (e.g., an authentication token, a user ID), you MUST explicitly state this dependency in the step's description.
 3. **Stay High-Level:** Do NOT include implementation details like specific API URLs, HTTP methods, or JSON body structures. Focus only on *what* needs to be done.
 4. **Logical Order:** The steps must be in the correct logical sequence for the workflow to succeed.
+5. **Declare Data Flow:** For each step, list in `produces` the snake_case names of the values later steps need from it (e.g. `auth_token`), and in `consumes` the names it needs from earlier steps. Give steps that need nothing from earlier steps an empty `consumes` list: independent steps are executed in parallel.
+6. **Use the Registered API:** When `api_operations` lists operations of the target API's spec, phrase each step around the operation it needs (e.g. "Call createOrder to place an order"). The list is empty when no spec is registered.
+7. **Adapt Similar Plans:** When a plan of a similar past request is given, it worked for a differently worded request. Start from it, adapting its steps and literal values to this request, and drop or add steps where the requests differ.
+8. **Iterate Over Lists:** When the same call must be made for every element of a list an earlier step produced (e.g. "fetch the details of each order"), use a single step with `action_type` `"for_each"` and set `iterate_over` to the list's name (e.g. `order_ids`). Never write one step per element.
 
 **Example:**
 **User Prompt:**
@@ -120,6 +140,67 @@ Example Format: `["First step description", "Second step description", ...]`
 ]
 """
 
+ONE_SHOT_PLAN_SYSTEM_PROMPT = """
+You are an expert API Workflow Architect. Your task is to turn a user's request into a complete, executable plan in a single pass: every step together with the exact API call it makes and the values it extracts for later steps.
+
+**Input:**
+You will receive the `user_prompt`.
+
+**Output Format:**
+You MUST output a JSON object with a `steps` array. Each step has:
+- `description`: A clear, human-readable summary of the step.
+- `action_type`: `"api_call"` for steps that call an API, or `"for_each"` for a call made once for every element of a list an earlier step produced. Do not add separate extraction steps; extract values with `extraction_rules` instead.
+- `iterate_over`: For `for_each` steps only, the name of the list to iterate over. In its `api_template`, `{{item}}` is the current element and `{{item[field]}}` a field of it.
+- `consumes`: snake_case names of the values this step needs from earlier steps (an empty list when it needs nothing; independent steps run in parallel).
+- `produces`: snake_case names of the values later steps need from this step.
+- `api_template`: The complete API call, following the `ApiDetails` schema:
+  - `url`, `method` (GET, POST, PUT, PATCH, DELETE), and optional `headers` and `body`.
+  - Insert values from earlier steps as `{{placeholder}}` markers named exactly after the consumed variable, e.g. `"Authorization": "Bearer {{auth_token}}"`. Never invent their values.
+  - `extraction_rules`: One rule per produced value, with a JSONPath (`$.data.token`, `$.items[0].id`) or dotted path locating it in this call's JSON response.
+
+**Key Rules:**
+1. **Preserve All Details:** Literal values from the user prompt (usernames, ids, ...) go verbatim into the URL, headers or body.
+2. **Only Use Declared Data:** Every `{{placeholder}}` in a template must be produced by an earlier step's `extraction_rules`.
+3. **Logical Order:** Steps must be in the order the workflow needs them.
+4. **Use the Registered API:** When `api_operations` lists operations of the target API's spec, build each call from the matching operation, replacing every `<name>` path parameter with its value. Do not invent endpoints the spec does not list.
+5. **Adapt Similar Plans:** When a plan of a similar past request is given, it worked for a differently worded request. Start from it, adapting its steps, templates and literal values to this request.
+
+**Example:**
+**User Prompt:**
+"Log in to https://api.example.com with username 'test_user' and password 'secret123', then fetch the profile for user ID '456'."
+
+**Your Generated Plan:**
+```json
+{{
+  "steps": [
+    {{
+      "description": "Log in with username 'test_user' and password 'secret123'.",
+      "action_type": "api_call",
+      "consumes": [],
+      "produces": ["auth_token"],
+      "api_template": {{
+        "url": "https://api.example.com/login",
+        "method": "POST",
+        "body": {{ "username": "test_user", "password": "secret123" }},
+        "extraction_rules": [{{ "variable": "auth_token", "path": "$.token" }}]
+      }}
+    }},
+    {{
+      "description": "Fetch the profile for user ID '456' using the auth token.",
+      "action_type": "api_call",
+      "consumes": ["auth_token"],
+      "produces": [],
+      "api_template": {{
+        "url": "https://api.example.com/users/456",
+        "method": "GET",
+        "headers": {{ "Authorization": "Bearer {{auth_token}}" }}
+      }}
+    }}
+  ]
+}}
+```
+"""
+
 EXTRACT_DATA_SYSTEM_PROMPT = """
 You are a highly intelligent and precise Data Extraction Specialist. Your sole purpose is to analyze a raw API response and extract only the essential pieces of data required to perform the *next* step in a workflow.
 
@@ -162,3 +243,61 @@ Look at the API response and pull out the specific values that the next step say
   }}
 }}
 ```"""
+
+
+FOR_EACH_CALL_SYSTEM_PROMPT = """
+You are an expert API Construction Specialist. You write ONE API call template that will be executed once for every element of a list, without consulting you again.
+
+**CONTEXT FOR YOUR TASK:**
+1. `user_prompt`: The original, full request from the user.
+2. `step_description`: The instruction to perform for each element of the list.
+3. `extracted_data`: Values extracted from previous API calls (the list itself is left out).
+4. `sample_item`: One element of the list, showing its shape.
+
+**YOUR TASK:**
+Generate a single JSON object following the `ApiDetails` schema (`url`, `method`, optional `headers`, `body` and `extraction_rules`). Refer to the current element as `{{item}}` and to its fields as `{{item[field]}}`, e.g. `https://api.example.com/orders/{{item[id]}}`. Never copy the values of `sample_item` into the template. When `api_operations` (the matching operations of the target API's spec, empty when none is registered) has a fitting operation, use its method and URL, with `<name>` path parameters replaced by values or placeholders. Values from `extracted_data` can be inlined or referenced as `{{name}}`. Extraction rules are applied to each element's response and collect one value per element.
+
+**EXAMPLE:**
+- step_description: "Fetch the details of each order using the auth token."
+- extracted_data: {{ "auth_token": "xyz789-abc" }}
+- sample_item: {{ "id": 17, "status": "open" }}
+
+**YOUR GENERATED JSON OUTPUT:**
+```json
+{{
+  "url": "https://api.example.com/orders/{{item[id]}}",
+  "method": "GET",
+  "headers": {{ "Authorization": "Bearer {{auth_token}}" }}
+}}
+```
+"""
+
+
+WORKFLOW_PLAN_HUMAN_PROMPT = """
+            User's request: {prompt}
+            Registered API Operations: {api_operations}
+            Plan Of A Similar Past Request: {similar_plan}
+            """
+
+API_CALL_HUMAN_PROMPT = """
+            CONTEXT FOR THIS TASK:
+            - Original User Prompt: {user_prompt}
+            - Current Step Description: {step_description}
+            - Previously Extracted Data: {extracted_data}
+            - Registered API Operations: {api_operations}
+            """
+
+FOR_EACH_CALL_HUMAN_PROMPT = """
+            CONTEXT FOR THIS TASK:
+            - Original User Prompt: {user_prompt}
+            - Step To Perform For Each Element: {step_description}
+            - Previously Extracted Data: {extracted_data}
+            - Sample Element: {sample_item}
+            - Registered API Operations: {api_operations}
+            """
+
+EXTRACT_DATA_HUMAN_PROMPT = """
+                CONTEXT FOR THIS TASK:
+                - API Response to parse: {api_response}
+                - Description of the next step that needs this data: {next_step_description}
+                """
@@ -1,25 +1,61 @@
 from enum import Enum
-from typing import Any, AsyncGenerator, Dict, List, TypedDict, cast, Optional
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Annotated, Any, AsyncGenerator, Dict, List, Tuple, TypedDict, cast, Optional
 from app.models.workflow import (
     ActionType,
     ApiDetails,
+    ApiOperation,
+    ExtractionRule,
     Plan,
+    PlanningMode,
+    PlanStep,
+    RunStatus,
     WorkflowRequest,
     WorkflowResponse,
     WorkflowStepResponse,
 )
-from langchain_core.prompts import ChatPromptTemplate
+from langgraph.config import get_stream_writer
 from langgraph.graph import END, START, StateGraph
+from langgraph.types import Send
 from app.core.config import settings
-from app.services.agents.system_prompts import (
-    API_CALL_SYSTEM_PROMPT,
-    EXTRACT_DATA_SYSTEM_PROMPT,
-    WORKFLOW_PLAN_SYSTEM_PROMPT,
+from app.services.agents.chains import chain_registry
+from app.services.agents.speculation import speculator
+from app.services.agents.step_scheduler import (
+    REQUEST_ACTIONS,
+    pending_variables,
+    ready_steps,
+    source_api_step,
+    unblocked_by,
 )
-import requests
+from app.services.body_store import body_store
+from app.services.compaction import compact_response
+from app.services.event_stream import SSE_HEARTBEAT, format_sse_event, json_patch
+from app.services.extraction import apply_extraction_rules
+from app.services.http_client import execute_api_request
+from app.services.instrumentation import (
+    instrument_node,
+    node_http_cache,
+    record_compaction,
+)
+from app.services.llm_limiter import Priority, llm_limiter
+from app.services.openapi_index import OperationIndex, openapi_index
+from app.services.plan_cache import plan_cache
+from app.services.recipes import compile_recipe, recipe_store
+from app.services.run_registry import ActiveRun, run_registry
+from app.services.run_store import run_store
+from app.services.similar_plans import similar_plans
+from app.services.single_flight import SingleFlight
+from app.services.templates import (
+    compile_template,
+    format_recursively,
+    template_placeholders,
+)
+import asyncio
 import logging
 import json
+import operator
+import re
+import time
+import uuid
 
 
 logging.basicConfig(
@@ -27,205 +63,573 @@ logging.basicConfig(
 )
 
 
+def _merge_dicts(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    return {**left, **right}
+
+
+def _first_error(left: Optional[str], right: Optional[str]) -> Optional[str]:
+    return left or right
+
+
 class AgentState(TypedDict):
+    # identifies this run of the workflow
+    run_id: str
+
     # this would be the user prompt that initiated the agent's workflow
     user_prompt: str
 
+    # the workspace whose registered OpenAPI spec grounds the API calls
+    workspace: Optional[str]
+
+    # whether GET and HEAD responses may be served from the HTTP cache
+    http_cache: bool
+
     plan: Plan
 
+    # how the plan is generated, see PlanningMode
+    planning_mode: PlanningMode
+
+    # whether the plan was served from the plan cache instead of the LLM
+    plan_cache_hit: bool
+
+    # whether the plan came from an identical workflow planning concurrently
+    plan_coalesced: bool
+
+    # the past plan found for a similarly worded prompt (entry_id, similarity)
+    # and whether it was reused as is or only shown to the planning LLM
+    similar_plan: Optional[Dict[str, Any]]
+
+    # the step a node is executing; set per task when the step is dispatched
     step_index: int
 
+    # the steps that have finished, in completion order
+    completed_steps: Annotated[List[int], operator.add]
+
     # this would be the data extracted from each api call
-    extracted_data: Dict[str, Any]
+    extracted_data: Annotated[Dict[str, Any], _merge_dicts]
 
     # this would be the history of requests made by the agent
-    request_history: List[Dict[str, Any]]
+    request_history: Annotated[List[Dict[str, Any]], operator.add]
 
-    current_response: Optional[Dict[str, Any]]
     # A flag to indicate a workflow-halting error has occurred
-    error: Optional[str]
+    error: Annotated[Optional[str], _first_error]
 
+    # per-node timing records (wall time, LLM tokens, HTTP status and size)
+    timings: Annotated[List[Dict[str, Any]], operator.add]
+
+
+# Identical prompts planning at the same time share one plan
+_plans = SingleFlight("plan")
+
+
+# planning modes other than the default keep their own plan cache entries
+_PLAN_CACHE_VARIANTS = {PlanningMode.STEPWISE: "", PlanningMode.ONE_SHOT: "one_shot"}
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-1.5-flash-8b",
-    temperature=0.1,
-    api_key=settings.GEMINI_API_KEY,
-)
 
+def _render_operations(operations: List[ApiOperation]) -> str:
+    return json.dumps([operation.model_dump(exclude_none=True) for operation in operations])
 
-def create_plan_node(state: AgentState) -> AgentState:
+
+async def _relevant_operations(workspace: Optional[str], query: str) -> str:
     """
-    This function creates a plan node based on the user prompt of the agent.
+    Renders the operations of the workspace's registered spec that best match
+    the query, for a prompt; an empty list when there is no spec.
     """
+    if not workspace:
+        return "[]"
+    return _render_operations(await openapi_index.search(workspace, query))
 
-    logging.info("PLAN NODE")
-    prompt_template = ChatPromptTemplate(
-        [
-            ("system", WORKFLOW_PLAN_SYSTEM_PROMPT),
-            ("human", "User's request: {prompt}"),
-        ]
-    )
 
-    llm_structured = llm.with_structured_output(Plan)
+async def _plan_variant(
+    planning_mode: PlanningMode, workspace: Optional[str]
+) -> Tuple[str, Optional[OperationIndex]]:
+    """
+    The variant stored plans are kept under, and the workspace's spec index.
+    """
+    cache_variant = _PLAN_CACHE_VARIANTS[planning_mode]
+    index = await openapi_index.get(workspace) if workspace else None
+    if index is not None:
+        # a plan grounded in a spec is only reused for that version of the spec
+        cache_variant = f"{cache_variant}@{workspace}:{index.version}"
+    return cache_variant, index
+
 
-    chain = prompt_template | llm_structured
+async def _generate_plan(
+    user_prompt: str, planning_mode: PlanningMode, workspace: Optional[str] = None
+) -> Tuple[Plan, bool, Optional[Dict[str, Any]]]:
+    """
+    Plans a prompt, returning the plan, whether it came from the plan cache
+    and the similar past plan that was reused or suggested, if any.
+    """
+    cache_variant, index = await _plan_variant(planning_mode, workspace)
+    if settings.PLAN_CACHE_ENABLED:
+        cached_plan = await plan_cache.get(user_prompt, cache_variant)
+        if cached_plan is not None:
+            logging.info("PLAN CACHE HIT: %s", cached_plan)
+            return cached_plan, True, None
+
+    similar, reusable = None, False
+    if settings.SIMILAR_PLANS_ENABLED:
+        similar, reusable = similar_plans.lookup(user_prompt, cache_variant)
+    similar_info = None
+    if similar is not None:
+        similar_info = {
+            "entry_id": similar.entry_id,
+            "similarity": similar.similarity,
+            "reused": reusable,
+        }
+    if reusable:
+        logging.info("SIMILAR PLAN REUSED (%s): %s", similar.similarity, similar.plan)
+        return similar.plan, False, similar_info
 
-    input_for_chain = {"prompt": state["user_prompt"]}
+    chain = chain_registry.get(
+        "one_shot_plan" if planning_mode == PlanningMode.ONE_SHOT else "plan"
+    )
 
-    structured_plan_output = chain.invoke(input_for_chain)
+    input_for_chain = {
+        "prompt": user_prompt,
+        "api_operations": _render_operations(
+            index.search(user_prompt, settings.OPENAPI_TOP_K) if index else []
+        ),
+        "similar_plan": similar.plan.model_dump_json(exclude_none=True)
+        if similar
+        else "None",
+    }
+
+    structured_plan_output = await llm_limiter.invoke(
+        chain, input_for_chain, priority=Priority.PLAN
+    )
 
     logging.info("PLAN OUTPUT: %s", structured_plan_output)
 
-    state["plan"] = cast(Plan, structured_plan_output)
+    plan = cast(Plan, structured_plan_output)
 
-    logging.info("UPDATED STATE: %s", state)
+    if settings.PLAN_CACHE_ENABLED and plan.steps:
+        await plan_cache.put(user_prompt, plan, cache_variant)
 
-    return state
+    return plan, False, similar_info
 
 
-def _format_recursively(data: Any, format_with: Dict[str, Any]) -> Any:
-    """Recursively formats strings with placeholders in a nested structure."""
-    if isinstance(data, str):
-        try:
-            return data.format(**format_with)
-        except KeyError:
-            return data
-    if isinstance(data, dict):
-        return {k: _format_recursively(v, format_with) for k, v in data.items()}
-    if isinstance(data, list):
-        return [_format_recursively(i, format_with) for i in data]
-    return data
+@instrument_node("create_plan")
+async def create_plan_node(state: AgentState) -> Dict[str, Any]:
+    """
+    This function creates a plan node based on the user prompt of the agent.
 
+    Plans for previously seen prompts are served from the plan cache, with
+    the prompt's quoted literals re-bound, instead of calling the LLM again.
+    Concurrent workflows with the same prompt wait for a single plan.
 
-def make_api_call_node(state: AgentState) -> AgentState:
+    Otherwise the plan of a past successful run with a similarly worded
+    prompt is reused when it is close enough, or shown to the LLM as a
+    reference.
+
+    In one-shot mode the plan also carries every step's API call template
+    and extraction rules, so steps usually run without further LLM calls.
+
+    When the run has a workspace with a registered OpenAPI spec, only the
+    spec's operations most relevant to the prompt are shown to the LLM.
+    """
+
+    logging.info("PLAN NODE")
+    user_prompt = state["user_prompt"]
+    planning_mode = state["planning_mode"]
+    workspace = state["workspace"]
+    coalesced = False
+    if settings.SINGLE_FLIGHT_ENABLED:
+        (plan, cache_hit, similar), coalesced = await _plans.do(
+            (planning_mode, workspace, user_prompt),
+            lambda: _generate_plan(user_prompt, planning_mode, workspace),
+        )
+    else:
+        plan, cache_hit, similar = await _generate_plan(
+            user_prompt, planning_mode, workspace
+        )
+
+    return {
+        "plan": plan,
+        "plan_cache_hit": cache_hit,
+        "plan_coalesced": coalesced,
+        "similar_plan": similar,
+    }
+
+
+def _planned_template(
+    step: PlanStep, extracted_data: Dict[str, Any]
+) -> Optional[ApiDetails]:
+    """
+    Returns the API call template a one-shot plan gave the step, if every
+    placeholder in it can be filled from the extracted data.
+    """
+    if step.api_template is None:
+        return None
+    missing = template_placeholders(
+        step.api_template.model_dump(exclude={"extraction_rules"})
+    ) - set(extracted_data)
+    if missing:
+        logging.info(
+            f"Planned template needs unavailable values {sorted(missing)}; "
+            "generating the API call instead."
+        )
+        return None
+    return step.api_template
+
+
+async def _generate_api_details(
+    input_for_chain: Dict[str, Any],
+    workspace: Optional[str],
+    priority: Priority = Priority.STEP,
+) -> ApiDetails:
+    chain = chain_registry.get("api_call")
+    input_for_chain = {
+        **input_for_chain,
+        "api_operations": await _relevant_operations(
+            workspace, input_for_chain["step_description"]
+        ),
+    }
+    return cast(
+        ApiDetails, await llm_limiter.invoke(chain, input_for_chain, priority=priority)
+    )
+
+
+def _speculate_unblocked_steps(
+    state: AgentState, extraction_rules: List[ExtractionRule]
+) -> None:
+    """
+    Starts generating the API calls of the steps this call unblocks while its
+    request is in flight, with placeholders for the values it will produce.
+    """
+    plan = state["plan"]
+    index = state["step_index"]
+    pending = pending_variables(plan, index)
+    pending.update(rule.variable for rule in extraction_rules)
+    if not pending:
+        # without names for the coming values the LLM could only guess them
+        return
+
+    placeholders = {name: "{" + name + "}" for name in pending}
+    for later in unblocked_by(plan, index, state["completed_steps"]):
+        step = plan.steps[later]
+        if step.api_template is not None:
+            continue
+        input_for_chain = {
+            "user_prompt": state["user_prompt"],
+            "step_description": step.description,
+            "extracted_data": {**state["extracted_data"], **placeholders},
+        }
+        speculator.start(
+            state["run_id"],
+            later,
+            lambda input_for_chain=input_for_chain: _generate_api_details(
+                input_for_chain, state["workspace"], Priority.SPECULATIVE
+            ),
+        )
+
+
+@instrument_node("make_api_call")
+async def make_api_call_node(state: AgentState) -> Dict[str, Any]:
     """
     Constructs and executes an API call based on the current plan step,
     handling dynamic data and errors robustly.
+
+    A template planned in one-shot mode, or generated speculatively while an
+    earlier step was running, is used as is; the LLM is only asked for the
+    call when there is no usable template. While the request is in flight,
+    the calls of the steps it unblocks are generated speculatively. The
+    request is sent over the shared async connection pool, so the event loop
+    stays free while the target API responds. With a registered OpenAPI spec,
+    the LLM sees the spec's operations most relevant to the step.
     """
     current_task = state["plan"].steps[state["step_index"]]
     logging.info(f"Executing step {state['step_index']}: {current_task.description}")
 
-    prompt_template = ChatPromptTemplate(
-        [
-            ("system", API_CALL_SYSTEM_PROMPT),
-            (
-                "human",
-                """
-            CONTEXT FOR THIS TASK:
-            - Original User Prompt: {user_prompt}
-            - Current Step Description: {step_description}
-            - Previously Extracted Data: {extracted_data}
-            """,
-            ),
-        ]
+    api_details_template = _planned_template(current_task, state["extracted_data"])
+    template_source = "plan"
+    if api_details_template is None and settings.SPECULATIVE_PREFETCH:
+        api_details_template = await speculator.take(
+            state["run_id"], state["step_index"], set(state["extracted_data"])
+        )
+        template_source = "speculation"
+    if api_details_template is None:
+        template_source = "llm"
+        input_for_chain = {
+            "user_prompt": state["user_prompt"],
+            "step_description": current_task.description,
+            "extracted_data": state["extracted_data"],
+        }
+
+        try:
+            api_details_template = await _generate_api_details(
+                input_for_chain, state["workspace"]
+            )
+        except Exception as e:
+            logging.error(f"LLM failed to generate valid ApiDetails: {e}")
+            return {
+                "completed_steps": [state["step_index"]],
+                "error": "LLM failed to structure the API call details.",
+            }
+
+    api_details = format_recursively(
+        api_details_template.model_dump(exclude={"extraction_rules"}),
+        state["extracted_data"],
+    )
+    logging.info(f"Formatted API Details: {api_details}")
+    extraction_rules = (current_task.extraction_rules or []) + (
+        api_details_template.extraction_rules or []
     )
-    llm_structured = llm.with_structured_output(ApiDetails)
-    chain = prompt_template | llm_structured
 
-    input_for_chain = {
-        "user_prompt": state["user_prompt"],
-        "step_description": current_task.description,
-        "extracted_data": state["extracted_data"],
-    }
+    if settings.SPECULATIVE_PREFETCH:
+        _speculate_unblocked_steps(state, extraction_rules)
 
-    try:
-        api_details_template: ApiDetails = cast(
-            ApiDetails, chain.invoke(input_for_chain)
+    response_data, error = await execute_api_request(api_details, state["http_cache"])
+
+    rule_data = {}
+    if extraction_rules and not error:
+        rule_data = apply_extraction_rules(
+            extraction_rules, await body_store.resolve(response_data)
         )
-    except Exception as e:
-        logging.error(f"LLM failed to generate valid ApiDetails: {e}")
-        state["error"] = "LLM failed to structure the API call details."
-        return state
+        logging.info(f"Extracted with rules: {rule_data}")
 
-    api_details = _format_recursively(
-        api_details_template.model_dump(), state["extracted_data"]
-    )
-    logging.info(f"Formatted API Details: {api_details}")
+    return {
+        "completed_steps": [state["step_index"]],
+        "extracted_data": rule_data,
+        "request_history": [
+            {
+                "step_index": state["step_index"],
+                "api_details_template": api_details_template.model_dump(mode="json"),
+                "template_source": template_source,
+                "api_details": api_details,
+                "extraction_rules": [rule.model_dump() for rule in extraction_rules],
+                "response_data": response_data,
+                "cache": node_http_cache(),
+                "error": error,
+            }
+        ],
+        "error": error,
+    }
 
-    response_data = None
-    try:
-        response = requests.request(
-            method=api_details["method"],
-            url=api_details["url"],
-            json=api_details.get("body"),
-            headers=api_details.get("headers"),
-            timeout=10,  # Add a timeout for robustness
+
+@instrument_node("for_each")
+async def for_each_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Makes the step's API call once for every element of the list it iterates
+    over.
+
+    The call template is generated once (or taken from a one-shot plan) with
+    `{item}` placeholders and then executed concurrently over the shared
+    connection pool, at most `FOR_EACH_MAX_CONCURRENCY` requests at a time,
+    so a list of any length costs a single LLM call. Each element's
+    completion is streamed as a custom event; the responses are aggregated
+    into a list, and extraction rules collect one value per element.
+    """
+    step_index = state["step_index"]
+    current_task = state["plan"].steps[step_index]
+    logging.info(f"Executing for_each step {step_index}: {current_task.description}")
+
+    def failed(error: str) -> Dict[str, Any]:
+        return {"completed_steps": [step_index], "error": error}
+
+    items = state["extracted_data"].get(current_task.iterate_over or "")
+    if not isinstance(items, list):
+        return failed(
+            f"Step {step_index + 1} iterates over '{current_task.iterate_over}', "
+            "which is not a list of extracted data."
+        )
+    if len(items) > settings.FOR_EACH_MAX_ITEMS:
+        return failed(
+            f"Step {step_index + 1} would make {len(items)} API calls; "
+            f"at most {settings.FOR_EACH_MAX_ITEMS} are allowed."
         )
-        response.raise_for_status()
 
+    # the list itself is left out of the prompt; one element shows its shape
+    extracted_data = {
+        name: value
+        for name, value in state["extracted_data"].items()
+        if name != current_task.iterate_over
+    }
+    api_details_template = _planned_template(
+        current_task, {**extracted_data, "item": None}
+    )
+    template_source = "plan"
+    if api_details_template is None:
+        template_source = "llm"
+        chain = chain_registry.get("for_each_call")
+        input_for_chain = {
+            "user_prompt": state["user_prompt"],
+            "step_description": current_task.description,
+            "extracted_data": extracted_data,
+            "sample_item": items[0] if items else None,
+            "api_operations": await _relevant_operations(
+                state["workspace"], current_task.description
+            ),
+        }
         try:
-            response_data = response.json()
-            logging.info(f"API Response Data: {response_data}")
-        except ValueError:
-            logging.warning("API response was not valid JSON. Storing raw text.")
-            response_data = {"raw_content": response.text}
-
-    except requests.exceptions.HTTPError as e:
-        logging.error(f"HTTP Error: {e.response.status_code} {e.response.reason}")
-        state["error"] = (
-            f"API call failed with status {e.response.status_code}: {e.response.reason}"
+            api_details_template = cast(
+                ApiDetails, await llm_limiter.invoke(chain, input_for_chain)
+            )
+        except Exception as e:
+            logging.error(f"LLM failed to generate valid ApiDetails: {e}")
+            return failed("LLM failed to structure the API call details.")
+
+    template = api_details_template.model_dump(exclude={"extraction_rules"})
+    # compiled once, every element only pays for the substitution
+    compiled_template = compile_template(template)
+    extraction_rules = (current_task.extraction_rules or []) + (
+        api_details_template.extraction_rules or []
+    )
+    write_event = get_stream_writer()
+    limit = asyncio.Semaphore(settings.FOR_EACH_MAX_CONCURRENCY)
+    completed = 0
+
+    async def run_item(item_index: int, item: Any) -> Dict[str, Any]:
+        nonlocal completed
+        api_details = compiled_template.render({**state["extracted_data"], "item": item})
+        async with limit:
+            response_data, error = await execute_api_request(
+                api_details, state["http_cache"]
+            )
+        completed += 1
+        write_event(
+            {
+                "event": "for_each_item_completed",
+                "data": {
+                    "step_index": step_index,
+                    "item_index": item_index,
+                    "completed": completed,
+                    "total": len(items),
+                    "request_details": api_details,
+                    "response_details": response_data,
+                    "error": error,
+                },
+            }
         )
-        response_data = {"error": state["error"], "content": e.response.text}
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Request Exception: {e}")
-        state["error"] = f"API call failed due to a network error: {e}"
-        response_data = {"error": state["error"]}
-
-    state["current_response"] = response_data
-    state["request_history"].append(
-        {
-            "step_index": state["step_index"],
+        return {
+            "item_index": item_index,
             "api_details": api_details,
             "response_data": response_data,
-            "error": state["error"],
+            "error": error,
         }
+
+    results = await asyncio.gather(
+        *(run_item(item_index, item) for item_index, item in enumerate(items))
     )
+    failures = [result for result in results if result["error"]]
 
-    return state
+    rule_data: Dict[str, Any] = {}
+    if extraction_rules:
+        per_item = [
+            apply_extraction_rules(
+                extraction_rules, await body_store.resolve(result["response_data"])
+            )
+            if not result["error"]
+            else {}
+            for result in results
+        ]
+        rule_data = {
+            rule.variable: [values.get(rule.variable) for values in per_item]
+            for rule in extraction_rules
+        }
+        logging.info(f"Extracted with rules from {len(results)} responses")
+
+    # the step only halts the workflow when no element succeeded
+    error = None
+    if results and len(failures) == len(results):
+        error = f"All {len(results)} API calls of step {step_index + 1} failed: {failures[0]['error']}"
 
+    return {
+        "completed_steps": [step_index],
+        "extracted_data": rule_data,
+        "request_history": [
+            {
+                "step_index": step_index,
+                "api_details_template": api_details_template.model_dump(mode="json"),
+                "template_source": template_source,
+                "api_details": template,
+                "extraction_rules": [rule.model_dump() for rule in extraction_rules],
+                "response_data": [result["response_data"] for result in results],
+                "items": [
+                    {
+                        "item_index": result["item_index"],
+                        "api_details": result["api_details"],
+                        "error": result["error"],
+                    }
+                    for result in results
+                ],
+                "failed_items": len(failures),
+                "error": error,
+            }
+        ],
+        "error": error,
+    }
 
-def extract_data_node(state: AgentState) -> AgentState:
+
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+@instrument_node("extract_data")
+async def extract_data_node(state: AgentState) -> Dict[str, Any]:
     """
-    Looks at the most recent API response and extracts data needed
-    for the next step in the plan.
+    Looks at the response of the API call this step follows and extracts
+    data needed for the next step in the plan.
+
+    Extraction rules declared on this step or on the API call that produced
+    the response are evaluated locally first; the LLM is only asked when no
+    rule matches.
     """
     logging.info("EXTRACT DATA NODE")
-
-    if state["current_response"] is None or state["error"]:
+    step_index = state["step_index"]
+    update: Dict[str, Any] = {"completed_steps": [step_index]}
+
+    source_index = source_api_step(state["plan"], step_index)
+    source_request = next(
+        (
+            entry
+            for entry in reversed(state["request_history"])
+            if entry["step_index"] == source_index
+        ),
+        None,
+    )
+    if source_request is None or source_request["error"]:
         logging.warning(
             "Skipping data extraction due to missing response or prior error."
         )
-        return state
+        return update
 
-    if state["step_index"] >= len(state["plan"].steps) - 1:
+    if step_index >= len(state["plan"].steps) - 1:
         logging.info("Last step reached. No further data extraction needed.")
-        return state
-
-    next_step_description = state["plan"].steps[state["step_index"] + 1].description
-    api_response = state["current_response"]
-
-    prompt_template = ChatPromptTemplate.from_messages(
-        [
-            ("system", EXTRACT_DATA_SYSTEM_PROMPT),
-            (
-                "human",
-                """
-                CONTEXT FOR THIS TASK:
-                - API Response to parse: {api_response}
-                - Description of the next step that needs this data: {next_step_description}
-                """,
-            ),
-        ]
+        return update
+
+    next_step_description = state["plan"].steps[step_index + 1].description
+    api_response = source_request["response_data"]
+
+    rules = list(state["plan"].steps[step_index].extraction_rules or [])
+    rules += [
+        ExtractionRule.model_validate(rule)
+        for rule in source_request.get("extraction_rules", [])
+    ]
+    api_response = await body_store.resolve(api_response)
+    rule_data = apply_extraction_rules(rules, api_response)
+    if rule_data:
+        logging.info("Extracted with rules, skipping LLM: %s", rule_data)
+        update["extracted_data"] = rule_data
+        return update
+
+    chain = chain_registry.get("extract_data")
+    # large responses take a while to compact, so it runs off the event loop
+    compaction = await asyncio.to_thread(
+        compact_response,
+        api_response,
+        settings.EXTRACT_RESPONSE_TOKEN_BUDGET,
+        next_step_description,
     )
-
-    chain = prompt_template | llm
+    record_compaction(compaction.original_tokens, compaction.tokens)
 
     try:
-        ai_message = chain.invoke(
+        ai_message = await llm_limiter.invoke(
+            chain,
             {
-                "api_response": api_response,
+                "api_response": compaction.data,
                 "next_step_description": next_step_description,
-            }
+            },
         )
         logging.info(f"Raw LLM Output: {ai_message}")
 
@@ -238,11 +642,8 @@ def extract_data_node(state: AgentState) -> AgentState:
                 "LLM output is not a string or does not have 'content' attribute."
             )
 
-
-        if "```json" in llm_output_str:
-            cleaned_str = llm_output_str.split("```json\n")[1].split("\n```")[0]
-        else:
-            cleaned_str = llm_output_str
+        fenced = _JSON_FENCE.search(llm_output_str)
+        cleaned_str = fenced.group(1) if fenced else llm_output_str.strip()
 
         newly_extracted_data = {}
         if cleaned_str:
@@ -253,76 +654,106 @@ def extract_data_node(state: AgentState) -> AgentState:
             "Parsed LLM output as JSON: %s", newly_extracted_data
         )
 
-        state["extracted_data"].update(newly_extracted_data)
+        update["extracted_data"] = newly_extracted_data
 
     except (json.JSONDecodeError, IndexError, AttributeError) as e:
         logging.error(f"LLM failed during data extraction or parsing: {e}")
     except Exception as e:
         logging.error(f"An unexpected error occurred during data extraction: {e}")
 
-    return state
+    return update
 
 
-def increment_step_index(state: AgentState) -> AgentState:
-    """
-    This function increments the step index in the agent's state.
-    """
-    state["step_index"] += 1
-    return state
+STEP_NODES = {
+    ActionType.API_CALL: "make_api_call",
+    ActionType.DATA_EXTRACTION: "extract_data",
+    ActionType.FOR_EACH: "for_each",
+}
+_STEP_FUNCTIONS = {
+    "make_api_call": make_api_call_node,
+    "extract_data": extract_data_node,
+    "for_each": for_each_node,
+}
 
 
-def should_proceed(state: AgentState) -> bool:
+async def execute_steps_node(state: AgentState) -> Dict[str, Any]:
     """
-    This function checks if there are more steps in the plan to execute.
+    Runs the plan's steps, each as soon as the steps it depends on have
+    completed, so independent steps run concurrently and the workflow takes
+    as long as its critical path: a step unblocked by a fast sibling does
+    not wait for the slower ones. At most `MAX_PARALLEL_STEPS` steps run at
+    once, and no step starts after one reported an error.
+
+    Each step's update is streamed as it completes, as a custom event with
+    the step node's name; the graph's state is not updated.
     """
-    return state["step_index"] < len(state["plan"].steps)
+    write_event = get_stream_writer()
+    state = cast(AgentState, dict(state))
+    running: Dict[asyncio.Task, int] = {}
 
-from langgraph.graph import END
+    def node_of(index: int) -> str:
+        return STEP_NODES[state["plan"].steps[index].action_type]
 
-def route_action(state: AgentState) -> str:
+    try:
+        while True:
+            if not state["error"]:
+                for index in ready_steps(state["plan"], state["completed_steps"]):
+                    if len(running) >= settings.MAX_PARALLEL_STEPS:
+                        break
+                    if index in running.values():
+                        continue
+                    step_function = _STEP_FUNCTIONS[node_of(index)]
+                    task = asyncio.create_task(step_function({**state, "step_index": index}))
+                    running[task] = index
+            if not running:
+                return {}
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = running.pop(task)
+                update = task.result() or {}
+                _apply_update(state, update)
+                write_event({"node": node_of(index), "update": update})
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.wait(running)
+
+
+def route_start(state: AgentState) -> Any:
     """
-    Checks if the workflow should continue and, if so,
-    routes to the correct node based on the current step's action_type.
+    Plans new runs; a resumed run already has its plan and continues with
+    the steps that have not completed yet.
     """
-    if not should_proceed(state):
-        return END
+    if state["plan"].steps:
+        return "execute_steps"
+    return "create_plan"
 
-    current_step = state["plan"].steps[state["step_index"]]
-    
-    return current_step.action_type.value
+
+def route_plan(state: AgentState) -> Any:
+    """Executes the plan, unless planning failed or produced no steps."""
+    if state["error"] or not state["plan"].steps:
+        return END
+    return "execute_steps"
 
 
 workflow_graph = StateGraph(AgentState)
 
 workflow_graph.add_node("create_plan", create_plan_node)
-workflow_graph.add_node("make_api_call", make_api_call_node)
-workflow_graph.add_node("extract_data", extract_data_node)
-workflow_graph.add_node("increment_step", increment_step_index)
-
-workflow_graph.add_edge(START, "create_plan")
+workflow_graph.add_node("execute_steps", execute_steps_node)
 
 workflow_graph.add_conditional_edges(
-    "create_plan",
-    route_action,
-    {
-        "api_call": "make_api_call",
-        "data_extraction": "extract_data",
-        END: END, 
-    },
+    START,
+    route_start,
+    ["create_plan", "execute_steps"],
 )
-
-workflow_graph.add_edge("make_api_call", "increment_step")
-workflow_graph.add_edge("extract_data", "increment_step")
-
 workflow_graph.add_conditional_edges(
-    "increment_step",
-    route_action,
-    {
-        "api_call": "make_api_call",
-        "data_extraction": "extract_data",
-        END: END,
-    },
+    "create_plan",
+    route_plan,
+    ["execute_steps", END],
 )
+workflow_graph.add_edge("execute_steps", END)
 
 graph = workflow_graph.compile()
 
@@ -332,44 +763,195 @@ class StreamEvent(TypedDict):
     event: str
     data: Dict[str, Any]
 
-async def stream_workflow_graph(
-    request: WorkflowRequest,
-) -> AsyncGenerator[str, None]:
+
+def _http_counts(timing: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    How often a node's target API calls were retried and hedged, and how many
+    were answered from the HTTP cache.
     """
-    Initializes and runs the workflow graph, yielding real-time events
-    formatted as Server-Sent Events (SSE).
+    timing = timing or {}
+    return {
+        "retries": timing.get("http_retries", 0),
+        "hedges": timing.get("http_hedges", 0),
+        "cache_hits": timing.get("http_cache_hits", 0),
+    }
+
+
+def _apply_update(state: AgentState, update: Dict[str, Any]) -> None:
+    """Applies a node's update to the state the way the graph's reducers do."""
+    for key, value in update.items():
+        if key in ("completed_steps", "request_history", "timings"):
+            state[key] = state[key] + value
+        elif key == "extracted_data":
+            state[key] = _merge_dicts(state[key], value)
+        elif key == "error":
+            state[key] = _first_error(state[key], value)
+        else:
+            state[key] = value
+
+
+def snapshot_state(state: AgentState) -> Dict[str, Any]:
+    """The JSON-serializable checkpoint of a run's state."""
+    return {
+        **state,
+        "plan": state["plan"].model_dump(mode="json"),
+        "planning_mode": state["planning_mode"].value,
+    }
+
+
+def restore_state(snapshot: Dict[str, Any]) -> AgentState:
     """
-    initial_state: AgentState = {
+    Rebuilds the state of a checkpointed run for resuming it. Steps that
+    failed are dropped from the completed steps so they run again.
+    """
+    plan = Plan.model_validate(snapshot["plan"])
+    request_history = [
+        entry for entry in snapshot["request_history"] if not entry["error"]
+    ]
+    succeeded = {entry["step_index"] for entry in request_history}
+    completed_steps = [
+        index
+        for index in snapshot["completed_steps"]
+        if plan.steps[index].action_type not in REQUEST_ACTIONS or index in succeeded
+    ]
+    return cast(
+        AgentState,
+        {
+            **snapshot,
+            "workspace": snapshot.get("workspace"),
+            "http_cache": snapshot.get("http_cache", True),
+            "plan": plan,
+            "planning_mode": PlanningMode(snapshot["planning_mode"]),
+            "completed_steps": completed_steps,
+            "request_history": request_history,
+            "error": None,
+        },
+    )
+
+
+def initial_state(request: WorkflowRequest, run_id: Optional[str] = None) -> AgentState:
+    """The state a new run of a request starts from."""
+    return {
+        "run_id": run_id or uuid.uuid4().hex,
         "user_prompt": request.prompt,
+        "workspace": request.workspace,
+        "http_cache": request.http_cache,
         "plan": Plan(steps=[]),
+        "planning_mode": request.planning_mode
+        or PlanningMode(settings.PLANNING_MODE),
+        "plan_cache_hit": False,
+        "plan_coalesced": False,
+        "similar_plan": None,
         "step_index": 0,
+        "completed_steps": [],
         "extracted_data": {},
         "request_history": [],
-        "current_response": None,
         "error": None,
+        "timings": [],
     }
 
-    def create_sse_event(event_name: str, data: Dict[str, Any]) -> str:
-        """Formats a dictionary into an SSE message string."""
-        json_data = json.dumps({"event": event_name, "data": data})
-        return f"data: {json_data}\n\n"
+
+async def iter_workflow_events(
+    request: WorkflowRequest,
+    run_id: Optional[str] = None,
+    resume_from: Optional[AgentState] = None,
+) -> AsyncGenerator[StreamEvent, None]:
+    """
+    Initializes and runs the workflow graph, yielding a stream event as each
+    node finishes.
+
+    The run's state is checkpointed after every node, so a run interrupted by
+    a crash or redeploy can be resumed from its last completed step by
+    passing its restored state as `resume_from`.
+    """
+    # Nodes only stream the keys they changed; the full state is tracked here
+    # for checkpoints and for the events that report cumulative data.
+    state: AgentState = resume_from or initial_state(request, run_id)
+    run_id = state["run_id"]
+    run_started = time.time() * 1000
+    # the extracted data as of the last data_extracted event; each event only
+    # carries the patch from there
+    streamed_data: Dict[str, Any] = {}
+
+    def create_event(
+        event_name: str,
+        data: Dict[str, Any],
+        timing: Optional[Dict[str, Any]] = None,
+    ) -> StreamEvent:
+        # every event carries its offset from the start of the run; node
+        # events also carry the node's timing so clients can draw a waterfall
+        data["elapsed_ms"] = round(time.time() * 1000 - run_started, 2)
+        if timing is not None:
+            data["timing"] = {
+                **timing,
+                "offset_ms": round(timing["started_at"] - run_started, 2),
+            }
+        return {"event": event_name, "data": data}
+
+    async def checkpoint(status: RunStatus) -> None:
+        await run_store.save(run_id, status, request, snapshot_state(state))
+
+    failed = False
+    config = {
+        "max_concurrency": settings.MAX_PARALLEL_STEPS,
+        "recursion_limit": settings.GRAPH_RECURSION_LIMIT,
+    }
+
+    await checkpoint(RunStatus.RUNNING)
+    if resume_from is not None:
+        yield create_event(
+            "plan_created",
+            {
+                **state["plan"].model_dump(),
+                "run_id": run_id,
+                "cache_hit": False,
+                "resumed": True,
+                "completed_steps": sorted(state["completed_steps"]),
+                "planning_mode": state["planning_mode"].value,
+            },
+        )
 
     try:
-        async for state_update in graph.astream(initial_state):
+        async for stream_mode, state_update in graph.astream(
+            state, config=config, stream_mode=["updates", "custom"]
+        ):
+            if stream_mode == "custom":
+                if "node" in state_update:
+                    # a step completed within execute_steps
+                    state_update = {state_update["node"]: state_update["update"]}
+                else:
+                    # progress a node streams while it runs, e.g. for_each items
+                    yield create_event(state_update["event"], state_update["data"])
+                    continue
+
             node_name = list(state_update.keys())[0]
-            current_state = state_update[node_name]
+            if node_name == "execute_steps":
+                # its steps' updates were already streamed one by one
+                continue
+            current_state = state_update[node_name] or {}
+            _apply_update(state, current_state)
+            await checkpoint(RunStatus.RUNNING)
+            plan = state["plan"]
+            timing = next(iter(current_state.get("timings", [])), None)
 
             if node_name == "create_plan":
-                yield create_sse_event(
-                    "plan_created", current_state["plan"].model_dump()
+                yield create_event(
+                    "plan_created",
+                    {
+                        **plan.model_dump(),
+                        "run_id": run_id,
+                        "cache_hit": current_state["plan_cache_hit"],
+                        "coalesced": current_state["plan_coalesced"],
+                        "similar_plan": current_state["similar_plan"],
+                        "planning_mode": state["planning_mode"].value,
+                    },
+                    timing,
                 )
 
-            elif node_name == "make_api_call":
+            elif node_name == "make_api_call" and current_state.get("request_history"):
                 last_request = current_state["request_history"][-1]
                 current_step_index = last_request["step_index"]
-                step_description = current_state["plan"].steps[
-                    current_step_index
-                ].description
+                step_description = plan.steps[current_step_index].description
 
                 step_response = WorkflowStepResponse(
                     step_title=f"Step {current_step_index + 1}: {step_description}",
@@ -377,24 +959,154 @@ async def stream_workflow_graph(
                     response_details=last_request.get("response_data", {}),
                     extracted_data=None,
                 )
-                yield create_sse_event("api_call_completed", step_response.model_dump())
+                yield create_event(
+                    "api_call_completed",
+                    {
+                        **step_response.model_dump(),
+                        "cache": last_request.get("cache"),
+                        **_http_counts(timing),
+                    },
+                    timing,
+                )
+
+            elif node_name == "for_each" and current_state.get("request_history"):
+                last_request = current_state["request_history"][-1]
+                current_step_index = last_request["step_index"]
+                step_description = plan.steps[current_step_index].description
+                yield create_event(
+                    "for_each_completed",
+                    {
+                        "step_title": f"Step {current_step_index + 1}: {step_description}",
+                        "request_details": last_request["api_details"],
+                        "response_details": last_request["response_data"],
+                        "total": len(last_request["items"]),
+                        "failed": last_request["failed_items"],
+                        **_http_counts(timing),
+                    },
+                    timing,
+                )
 
             elif node_name == "extract_data":
-                prev_step_index = current_state["step_index"] - 1
-                step_description = current_state["plan"].steps[prev_step_index].description
+                source_index = source_api_step(plan, current_state["completed_steps"][0])
+                step_description = (
+                    plan.steps[source_index].description
+                    if source_index is not None
+                    else ""
+                )
 
+                extracted_data = dict(state["extracted_data"])
                 extraction_details = {
                     "step_title": f"Data Extraction after: {step_description}",
-                    "extracted_data": current_state["extracted_data"]
+                    "extracted_data_patch": json_patch(streamed_data, extracted_data),
                 }
-                yield create_sse_event("data_extracted", extraction_details)
+                streamed_data = extracted_data
+                yield create_event("data_extracted", extraction_details, timing)
 
             if error := current_state.get("error"):
-                yield create_sse_event("error", {"detail": error})
+                failed = True
+                yield create_event("error", {"detail": error}, timing)
                 break # Stop the stream on error
 
+    except (asyncio.CancelledError, GeneratorExit):
+        # the client went away (or the server is shutting down): in-flight
+        # nodes are cancelled with their LLM and HTTP calls
+        await checkpoint(RunStatus.CANCELLED)
+        raise
     except Exception as e:
+        failed = True
         logging.error(f"Error during graph stream: {e}", exc_info=True)
-        yield create_sse_event("error", {"detail": f"An unexpected error occurred: {str(e)}"})
+        yield create_event("error", {"detail": f"An unexpected error occurred: {str(e)}"})
+    finally:
+        speculator.discard_run(run_id)
+
+    await checkpoint(RunStatus.FAILED if failed else RunStatus.COMPLETED)
+
+    plan = state["plan"]
+    if settings.SIMILAR_PLANS_ENABLED and plan.steps:
+        reused = state.get("similar_plan") or {}
+        if failed and reused.get("reused"):
+            # the plan fit the other prompt, not this one
+            similar_plans.discard(reused["entry_id"])
+        elif not failed and not reused.get("reused"):
+            # the run already finished: failing to remember its plan must not
+            # keep the stream from ending normally
+            try:
+                cache_variant, _ = await _plan_variant(
+                    state["planning_mode"], state["workspace"]
+                )
+                similar_plans.add(request.prompt, plan, cache_variant)
+            except Exception as e:
+                logging.warning(f"Could not store the plan for similar prompts: {e}")
 
-    yield create_sse_event("end", {"message": "Workflow finished."})
+    if request.compile and not failed and plan.steps:
+        try:
+            recipe = await compile_recipe(
+                request.prompt, plan, state["request_history"], state["extracted_data"]
+            )
+            await recipe_store.put(recipe)
+            yield create_event(
+                "recipe_compiled",
+                {"recipe_id": recipe.recipe_id, "parameters": recipe.parameters},
+            )
+        except ValueError as e:
+            logging.warning(f"Could not compile recipe: {e}")
+            yield create_event("recipe_compile_failed", {"detail": str(e)})
+
+    yield create_event("end", {"message": "Workflow finished."})
+
+
+def start_workflow_run(
+    request: WorkflowRequest,
+    resume_from: Optional[AgentState] = None,
+    run_id: Optional[str] = None,
+    cancel_when_abandoned: Optional[bool] = None,
+) -> ActiveRun:
+    """
+    Starts a workflow run in the background; any client can follow it by its
+    run id. With `cancel_when_abandoned` (by default
+    `RUN_CANCEL_ON_DISCONNECT`), the run is cancelled once no client follows
+    it anymore.
+    """
+    run_id = resume_from["run_id"] if resume_from else run_id or uuid.uuid4().hex
+    if cancel_when_abandoned is None:
+        cancel_when_abandoned = settings.RUN_CANCEL_ON_DISCONNECT
+    return run_registry.start(
+        run_id,
+        iter_workflow_events(request, run_id, resume_from),
+        cancel_when_abandoned=cancel_when_abandoned,
+    )
+
+
+async def stream_run_events(
+    run: ActiveRun, after: int = 0
+) -> AsyncGenerator[str, None]:
+    """
+    Follows a run, yielding its events from index `after` on formatted as
+    Server-Sent Events (SSE). An event's id is its position in the run, so
+    a client resumes by passing the last id it received as `after`.
+
+    Events published while the previous ones were being sent go out in a
+    single write, and a heartbeat comment is sent whenever the run was
+    silent for `SSE_HEARTBEAT_SECONDS`.
+    """
+    event_id = max(0, after)
+    async for batch in run.follow_batches(after, settings.SSE_HEARTBEAT_SECONDS or None):
+        if not batch:
+            yield SSE_HEARTBEAT
+            continue
+        yield "".join(
+            format_sse_event(event, event_id + offset)
+            for offset, event in enumerate(batch, start=1)
+        )
+        event_id += len(batch)
+
+
+async def stream_workflow_graph(
+    request: WorkflowRequest,
+) -> AsyncGenerator[str, None]:
+    """
+    Runs the workflow graph, yielding real-time events formatted as
+    Server-Sent Events (SSE).
+    """
+    async for event in stream_run_events(start_workflow_run(request)):
+        yield event
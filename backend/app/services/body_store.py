@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+
+
+# the spilled body's framing no longer applies: it is stored decoded
+_FRAMING_HEADERS = ("content-length", "content-encoding", "transfer-encoding")
+_BODY_ID = re.compile(r"^[0-9a-f]{64}$")
+_BODY_REF_KEYS = frozenset(("body_ref", "content_type", "size", "preview"))
+
+# a body still being spilled is written to at least this often; a `.part`
+# file left alone for longer belongs to a process that died mid-download
+_STALE_PART_SECONDS = 60 * 60
+
+
+def is_body_ref(response_data: Any) -> bool:
+    """
+    Whether response data is the reference to a spilled body. Every key and
+    the id format are checked, so a response that merely has a `body_ref`
+    field is not mistaken for one.
+    """
+    return (
+        isinstance(response_data, dict)
+        and response_data.keys() == _BODY_REF_KEYS
+        and isinstance(response_data["body_ref"], str)
+        and _BODY_ID.match(response_data["body_ref"]) is not None
+        and isinstance(response_data["size"], int)
+    )
+
+
+# spilled chunks are written in batches of this size, off the event loop
+_WRITE_BATCH_BYTES = 256 * 1024
+
+
+class _SpoolWriter:
+    """Writes a body to a temp file of the store while hashing it."""
+
+    def __init__(self, file: BinaryIO) -> None:
+        self.file = file
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+
+    async def write(self, chunk: bytes) -> None:
+        self.digest.update(chunk)
+        if len(self.head) < settings.RESPONSE_PREVIEW_BYTES:
+            self.head += chunk[: settings.RESPONSE_PREVIEW_BYTES - len(self.head)]
+        self.size += len(chunk)
+        self._pending.append(chunk)
+        self._pending_bytes += len(chunk)
+        if self._pending_bytes >= _WRITE_BATCH_BYTES:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self._pending:
+            await asyncio.to_thread(self.file.writelines, self._pending)
+            self._pending = []
+            self._pending_bytes = 0
+
+
+class BodyStore:
+    """
+    Keeps API response bodies too large to hold in a run's state.
+
+    Bodies above `RESPONSE_SPILL_THRESHOLD_BYTES` are streamed to a file named
+    by their SHA-256, so a body downloaded by several runs is stored once.
+    The run's state, checkpoints and events only carry a reference with the
+    body's size, content type and a short preview; the full body is served
+    on demand. Bodies expire after `ttl_seconds`, and the oldest go first
+    once the store holds more than `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: float) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, body_id: str) -> Optional[str]:
+        """The file of a stored body, or None if the id is unknown."""
+        if not _BODY_ID.match(body_id):
+            return None
+        path = os.path.join(self.directory, body_id)
+        return path if os.path.exists(path) else None
+
+    def content_type(self, body_id: str) -> str:
+        try:
+            with open(os.path.join(self.directory, f"{body_id}.meta")) as meta:
+                return json.load(meta)["content_type"]
+        except (OSError, ValueError, KeyError):
+            return "application/octet-stream"
+
+    async def read_response(self, response: httpx.Response) -> httpx.Response:
+        """
+        Reads a streamed response. A body up to the spill threshold is returned
+        in a regular response; a larger one is spilled to the store and the
+        returned response carries its reference in `extensions["body_ref"]`
+        instead of content.
+        """
+        chunks: List[bytes] = []
+        buffered = 0
+        writer: Optional[_SpoolWriter] = None
+        file: Optional[BinaryIO] = None
+        try:
+            async for chunk in response.aiter_bytes():
+                if writer is None and buffered + len(chunk) > settings.RESPONSE_SPILL_THRESHOLD_BYTES:
+                    file = tempfile.NamedTemporaryFile(dir=self.directory, suffix=".part", delete=False)
+                    writer = _SpoolWriter(file)
+                    for buffered_chunk in chunks:
+                        await writer.write(buffered_chunk)
+                    chunks = []
+                if writer is not None:
+                    await writer.write(chunk)
+                else:
+                    chunks.append(chunk)
+                    buffered += len(chunk)
+        except BaseException:
+            if file is not None:
+                file.close()
+                os.unlink(file.name)
+            raise
+
+        headers = [
+            (name, value)
+            for name, value in response.headers.multi_items()
+            if name.lower() not in _FRAMING_HEADERS
+        ]
+        if writer is None:
+            return httpx.Response(
+                response.status_code,
+                headers=headers,
+                content=b"".join(chunks),
+                request=response.request,
+            )
+
+        await writer.flush()
+        file.close()
+        content_type = response.headers.get("content-type", "application/octet-stream")
+        body_ref = await asyncio.to_thread(
+            self._commit, file.name, writer.digest.hexdigest(), content_type
+        )
+        body_ref.update(
+            size=writer.size,
+            preview=writer.head.decode("utf-8", errors="replace"),
+        )
+        logging.info(f"Spilled a {writer.size} byte response body to the body store")
+        return httpx.Response(
+            response.status_code,
+            headers=headers,
+            request=response.request,
+            extensions={"body_ref": body_ref},
+        )
+
+    def _commit(self, part_path: str, body_id: str, content_type: str) -> Dict[str, Any]:
+        path = os.path.join(self.directory, body_id)
+        if os.path.exists(path):
+            os.unlink(part_path)
+            os.utime(path)
+        else:
+            os.replace(part_path, path)
+        with open(f"{path}.meta", "w") as meta:
+            json.dump({"content_type": content_type}, meta)
+        self._prune()
+        return {"body_ref": body_id, "content_type": content_type}
+
+    def _prune(self) -> None:
+        bodies = []
+        stale_parts_cutoff = time.time() - _STALE_PART_SECONDS
+        for entry in os.scandir(self.directory):
+            if _BODY_ID.match(entry.name):
+                stat = entry.stat()
+                bodies.append((stat.st_mtime, stat.st_size, entry.path))
+            elif entry.name.endswith(".part"):
+                try:
+                    if entry.stat().st_mtime < stale_parts_cutoff:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+        bodies.sort()
+        total = sum(size for _, size, _ in bodies)
+        cutoff = time.time() - self.ttl_seconds
+        for modified, size, path in bodies:
+            if modified >= cutoff and total <= self.max_bytes:
+                break
+            for stale in (path, f"{path}.meta"):
+                try:
+                    os.unlink(stale)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    async def resolve(self, response_data: Any) -> Any:
+        """
+        The parsed JSON of a spilled body, for evaluating extraction rules; any
+        other response data is returned as is. Bodies above
+        `RESPONSE_SPILL_PARSE_MAX_BYTES`, or not JSON, are not loaded.
+        """
+        if not is_body_ref(response_data) or response_data["size"] > settings.RESPONSE_SPILL_PARSE_MAX_BYTES:
+            return response_data
+        path = self.path(response_data["body_ref"])
+        if path is None:
+            return response_data
+
+        def load() -> Any:
+            with open(path, "rb") as body:
+                return json.load(body)
+
+        try:
+            return await asyncio.to_thread(load)
+        except ValueError:
+            return response_data
+
+
+body_store = BodyStore(
+    directory=settings.BODY_STORE_DIR or os.path.join(tempfile.gettempdir(), "api-flow-bodies"),
+    max_bytes=settings.BODY_STORE_MAX_BYTES,
+    ttl_seconds=settings.BODY_STORE_TTL_SECONDS,
+)
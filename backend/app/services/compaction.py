@@ -0,0 +1,181 @@
+import json
+import logging
+import re
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Tuple
+
+from app.services.openapi_index import tokenize
+
+
+# Pre-tokenizes text the way the model's SentencePiece tokenizer splits it:
+# runs of letters (long ones cost a token per ~6 characters), single digits
+# and single punctuation marks. Close enough to budget a prompt without a
+# call to the model's count_tokens endpoint.
+_PIECE = re.compile(r"[^\W\d_]+|\d|[^\w\s]|_")
+_LETTERS_PER_TOKEN = 6
+
+# Compaction passes, mildest first: how long strings may stay, how many
+# elements of a long array are kept as samples, and whether keys unrelated to
+# the next step are dropped
+_PASSES = (
+    (400, 10, False),
+    (200, 5, False),
+    (80, 3, False),
+    (80, 2, True),
+    (40, 1, True),
+)
+
+
+def count_tokens(text: str) -> int:
+    """Estimates how many tokens the model reads for a text."""
+    tokens = 0
+    for piece in _PIECE.findall(text):
+        tokens += -(-len(piece) // _LETTERS_PER_TOKEN) if piece.isalpha() else 1
+    return tokens
+
+
+def _dumps(data: Any) -> str:
+    return json.dumps(data, default=str, separators=(",", ":"), ensure_ascii=False)
+
+
+def _type_name(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return "array" if isinstance(value, list) else "object"
+
+
+def sketch(values: List[Any], depth: int = 0) -> Any:
+    """
+    The shape of an array's elements: objects as their keys mapped to the
+    types seen for them, arrays as the sketch of their elements.
+    """
+    objects = [value for value in values if isinstance(value, dict)]
+    if objects and depth < 3:
+        keys: Dict[str, List[Any]] = {}
+        for value in objects:
+            for key, child in value.items():
+                keys.setdefault(key, []).append(child)
+        return {key: sketch(children, depth + 1) for key, children in keys.items()}
+    arrays = [item for value in values if isinstance(value, list) for item in value]
+    if arrays and depth < 3:
+        return [sketch(arrays, depth + 1)]
+    return "|".join(sorted({_type_name(value) for value in values}))
+
+
+class _Compactor:
+    def __init__(
+        self,
+        terms: FrozenSet[str],
+        max_string: int,
+        max_items: int,
+        drop_keys: bool,
+    ) -> None:
+        self.terms = terms
+        self.max_string = max_string
+        self.max_items = max_items
+        self.drop_keys = drop_keys
+
+    def relevance(self, value: Any) -> int:
+        """How many of the next step's terms a value mentions."""
+        if not self.terms:
+            return 0
+        return len(self.terms.intersection(tokenize(_dumps(value))))
+
+    def compact(self, value: Any) -> Any:
+        if isinstance(value, str) and len(value) > self.max_string:
+            return f"{value[: self.max_string]}...(+{len(value) - self.max_string} chars)"
+        if isinstance(value, list):
+            return self.compact_list(value)
+        if isinstance(value, dict):
+            return self.compact_dict(value)
+        return value
+
+    def compact_list(self, values: List[Any]) -> List[Any]:
+        if len(values) <= self.max_items:
+            return [self.compact(value) for value in values]
+        # the first elements, plus those mentioning the next step's terms
+        ranked = sorted(
+            range(len(values)),
+            key=lambda index: (-self.relevance(values[index]), index),
+        )
+        kept = sorted(ranked[: self.max_items])
+        compacted = [self.compact(values[index]) for index in kept]
+        compacted.append(
+            {
+                "_omitted_items": len(values) - len(kept),
+                "_item_schema": sketch(values),
+            }
+        )
+        return compacted
+
+    def compact_dict(self, value: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.drop_keys or not self.terms:
+            return {key: self.compact(child) for key, child in value.items()}
+        kept = {
+            key: self.compact(child)
+            for key, child in value.items()
+            # scalars are cheap and often ids; containers go unless relevant
+            if not isinstance(child, (dict, list))
+            or self.terms.intersection(tokenize(key))
+            or self.relevance(child)
+        }
+        dropped = [key for key in value if key not in kept]
+        if dropped:
+            kept["_dropped_keys"] = dropped
+        return kept
+
+
+class Compaction(NamedTuple):
+    """A response compacted for a prompt, with its size before and after."""
+
+    data: Any
+    original_tokens: int
+    tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+def compact_response(response: Any, budget: int, hint: str = "") -> Compaction:
+    """
+    Shrinks an API response to about `budget` tokens before it is shown to an
+    LLM. Passes of increasing strength truncate long strings, replace long
+    arrays with a few samples (the elements mentioning words of `hint` first)
+    and a sketch of their elements' shape, and finally drop nested objects
+    and arrays unrelated to `hint`. A response that still does not fit is
+    cut off as text.
+
+    Args:
+        response: The API response data
+        budget: The token budget; 0 disables compaction
+        hint: What the data is needed for, e.g. the next step's description
+    """
+    original_tokens = count_tokens(_dumps(response))
+    if budget <= 0 or original_tokens <= budget:
+        return Compaction(response, original_tokens, original_tokens)
+
+    terms = frozenset(tokenize(hint))
+    compacted, tokens = response, original_tokens
+    for max_string, max_items, drop_keys in _PASSES:
+        compacted = _Compactor(terms, max_string, max_items, drop_keys).compact(response)
+        tokens = count_tokens(_dumps(compacted))
+        if tokens <= budget:
+            break
+    else:
+        text = _dumps(compacted)
+        # tokens are not evenly spread, so cut proportionally and recount
+        while tokens > budget and len(text) > 1:
+            text = text[: int(len(text) * budget / tokens * 0.95)]
+            tokens = count_tokens(text)
+        compacted = f"{text}...(truncated)"
+
+    logging.info(
+        f"Compacted an API response from {original_tokens} to {tokens} tokens"
+    )
+    return Compaction(compacted, original_tokens, tokens)
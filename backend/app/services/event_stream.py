@@ -0,0 +1,58 @@
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+
+# An SSE comment line: ignored by clients, but it keeps proxies and load
+# balancers from closing a connection that is idle during long LLM calls
+SSE_HEARTBEAT = ": keep-alive\n\n"
+
+
+def dumps(value: Any) -> str:
+    """Serializes an event to compact JSON with orjson."""
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def format_sse_event(event: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """
+    Formats a stream event into an SSE message string. With `event_id`, the
+    message carries it as its `id`, which a reconnecting client sends back
+    as `Last-Event-ID`.
+    """
+    if event_id is None:
+        return f"data: {dumps(event)}\n\n"
+    return f"id: {event_id}\ndata: {dumps(event)}\n\n"
+
+
+def _pointer(path: str, key: Any) -> str:
+    return f"{path}/{str(key).replace('~', '~0').replace('/', '~1')}"
+
+
+def json_patch(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """
+    The JSON Patch (RFC 6902) operations turning `old` into `new`. Objects are
+    diffed key by key, values appended to an array are added at its end, and
+    anything else that changed is replaced whole.
+    """
+    if old is new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = [
+            {"op": "remove", "path": _pointer(path, key)} for key in old if key not in new
+        ]
+        for key, value in new.items():
+            if key not in old:
+                operations.append({"op": "add", "path": _pointer(path, key), "value": value})
+            else:
+                operations.extend(json_patch(old[key], value, _pointer(path, key)))
+        return operations
+    if (
+        isinstance(old, list)
+        and isinstance(new, list)
+        and len(new) > len(old)
+        and new[: len(old)] == old
+    ):
+        return [{"op": "add", "path": f"{path}/-", "value": value} for value in new[len(old):]]
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
@@ -0,0 +1,116 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
+
+from app.models.workflow import ExtractionRule
+
+
+# One path segment: `.name`, `['name']` / `["name"]`, `[0]`, `[*]` or `.*`
+_SEGMENT = re.compile(
+    r"""\.(?P<name>[^.\[\]]+)|\[(?P<quote>['"])(?P<qname>.*?)(?P=quote)\]|\[(?P<index>-?\d+|\*)\]"""
+)
+
+_WILDCARD = "*"
+
+Segment = Tuple[str, Any]
+
+
+class CompiledPath:
+    """A JSONPath / dotted-path expression parsed into a tuple of segments."""
+
+    def __init__(self, expression: str, segments: Tuple[Segment, ...]) -> None:
+        self.expression = expression
+        self.segments = segments
+        self.is_multi = any(kind == "wildcard" for kind, _ in segments)
+
+    def _walk(self, node: Any, position: int) -> Iterable[Any]:
+        if position == len(self.segments):
+            yield node
+            return
+
+        kind, value = self.segments[position]
+        if kind == "wildcard":
+            if isinstance(node, dict):
+                children = list(node.values())
+            else:
+                children = node if isinstance(node, list) else []
+            for child in children:
+                yield from self._walk(child, position + 1)
+        elif kind == "index" and isinstance(node, list):
+            if -len(node) <= value < len(node):
+                yield from self._walk(node[value], position + 1)
+        elif kind == "key" and isinstance(node, dict):
+            if value in node:
+                yield from self._walk(node[value], position + 1)
+        elif kind == "key" and isinstance(node, list) and value.lstrip("-").isdigit():
+            # dotted paths address list items as `items.0.id`
+            index = int(value)
+            if -len(node) <= index < len(node):
+                yield from self._walk(node[index], position + 1)
+
+    def find(self, data: Any) -> List[Any]:
+        """Returns every value in `data` matched by the expression."""
+        return list(self._walk(data, 0))
+
+
+@lru_cache(maxsize=1024)
+def compile_path(expression: str) -> CompiledPath:
+    """
+    Parses a JSONPath (`$.data.items[0].id`) or dotted path (`data.items.0.id`)
+    expression once; repeated rules reuse the compiled form.
+
+    Raises:
+        ValueError: If the expression is not a supported path
+    """
+    text = expression.strip()
+    if text.startswith("$"):
+        text = text[1:]
+    if text and not text.startswith((".", "[")):
+        text = "." + text
+
+    segments: List[Segment] = []
+    position = 0
+    while position < len(text):
+        match = _SEGMENT.match(text, position)
+        if match is None:
+            raise ValueError(f"Unsupported extraction path: {expression!r}")
+        if match.group("name") is not None:
+            name = match.group("name")
+            segments.append(("wildcard", None) if name == _WILDCARD else ("key", name))
+        elif match.group("qname") is not None:
+            segments.append(("key", match.group("qname")))
+        elif match.group("index") == _WILDCARD:
+            segments.append(("wildcard", None))
+        else:
+            segments.append(("index", int(match.group("index"))))
+        position = match.end()
+
+    return CompiledPath(expression, tuple(segments))
+
+
+def apply_extraction_rules(
+    rules: Iterable[ExtractionRule], response: Any
+) -> Dict[str, Any]:
+    """
+    Evaluates extraction rules against an API response.
+
+    Rules that fail to compile or match nothing are skipped. A rule with a
+    wildcard yields the list of every match; otherwise the single match.
+
+    Returns:
+        The extracted variables keyed by each rule's target variable name
+    """
+    extracted: Dict[str, Any] = {}
+    for rule in rules:
+        try:
+            compiled = compile_path(rule.path)
+        except ValueError as e:
+            logging.warning(f"Skipping extraction rule for '{rule.variable}': {e}")
+            continue
+
+        matches = compiled.find(response)
+        if not matches:
+            continue
+        extracted[rule.variable] = matches if compiled.is_multi else matches[0]
+    return extracted
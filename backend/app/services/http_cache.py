@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import settings
+
+
+CACHEABLE_METHODS = {"GET", "HEAD"}
+# statuses stored when the response allows it; others are never cached
+_CACHEABLE_STATUSES = {200, 203, 300, 301, 308}
+# request headers that identify the caller; entries are keyed on all of them
+_CREDENTIAL_HEADER = re.compile(
+    r"authorization|proxy-authorization|cookie|.*(api[-_]?key|token|secret|session|auth).*"
+)
+
+
+def _directives(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parses a Cache-Control header into its directives."""
+    directives: Dict[str, Optional[str]] = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _seconds(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+# the stored body is already decoded, so its transfer framing is dropped
+_FRAMING_HEADERS = ("content-length", "content-encoding", "transfer-encoding")
+
+
+def normalize_headers(headers: Optional[Dict[str, str]]) -> Dict[str, str]:
+    return {name.lower(): str(value) for name, value in (headers or {}).items()}
+
+
+class CachedResponse:
+    """A stored response, with the request header values it varies on."""
+
+    __slots__ = ("status_code", "headers", "content", "vary", "stored_at")
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: Dict[str, str],
+        content: bytes,
+        vary: Dict[str, str],
+        stored_at: float,
+    ) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.vary = vary
+        self.stored_at = stored_at
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    def freshness_lifetime(self) -> float:
+        """How long the response is fresh for, from s-maxage, max-age or Expires."""
+        directives = _directives(self.headers.get("cache-control"))
+        if "no-cache" in directives:
+            return 0.0
+        for name in ("s-maxage", "max-age"):
+            lifetime = _seconds(directives.get(name))
+            if lifetime is not None:
+                return lifetime
+        expires = _timestamp(self.headers.get("expires"))
+        if expires is None:
+            return 0.0
+        date = _timestamp(self.headers.get("date")) or self.stored_at
+        return max(0.0, expires - date)
+
+    def is_fresh(self) -> bool:
+        age = (_seconds(self.headers.get("age")) or 0.0) + time.time() - self.stored_at
+        return age < self.freshness_lifetime()
+
+    def validators(self) -> Dict[str, str]:
+        """The conditional headers revalidating this response."""
+        conditional = {}
+        if "etag" in self.headers:
+            conditional["If-None-Match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            conditional["If-Modified-Since"] = self.headers["last-modified"]
+        return conditional
+
+    def matches(self, request_headers: Dict[str, str]) -> bool:
+        return all(request_headers.get(name) == value for name, value in self.vary.items())
+
+    def to_response(self, method: str, url: str) -> httpx.Response:
+        return httpx.Response(
+            self.status_code,
+            headers=self.headers,
+            content=self.content,
+            request=httpx.Request(method, url),
+        )
+
+    def dumps(self) -> str:
+        return json.dumps(
+            {
+                "status_code": self.status_code,
+                "headers": self.headers,
+                "vary": self.vary,
+                "stored_at": self.stored_at,
+            }
+        )
+
+    @classmethod
+    def loads(cls, meta: str, content: bytes) -> "CachedResponse":
+        data = json.loads(meta)
+        return cls(data["status_code"], data["headers"], content, data["vary"], data["stored_at"])
+
+
+def request_bypasses(request_headers: Dict[str, str]) -> bool:
+    """Whether the request forbids the cache (Cache-Control: no-store)."""
+    return "no-store" in _directives(request_headers.get("cache-control"))
+
+
+def request_revalidates(request_headers: Dict[str, str]) -> bool:
+    """Whether the request asks for a stored response to be revalidated first."""
+    directives = _directives(request_headers.get("cache-control"))
+    return (
+        "no-cache" in directives
+        or directives.get("max-age") == "0"
+        or "no-cache" in request_headers.get("pragma", "")
+    )
+
+
+class HttpCache:
+    """
+    Caches target API responses to GET and HEAD calls following HTTP caching
+    semantics for a shared cache: `Cache-Control` (no-store, no-cache,
+    private, max-age, s-maxage), `Expires`, and `Vary`. `private` responses
+    are never stored. A stale response is never served as is: one with an
+    ETag or Last-Modified is revalidated with a conditional request, and a
+    304 serves the stored body.
+
+    Entries are keyed on the method, the URL and every credential-bearing
+    request header (Authorization, Cookie, API keys, tokens), so a response
+    is only ever served to the same credentials. They are kept in
+    an in-memory LRU capped at `max_bytes`; with `db_path` set they are also
+    written to SQLite, capped at `disk_max_bytes`, so they survive restarts
+    and are shared between workers.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_entry_bytes: int,
+        db_path: Optional[str] = None,
+        disk_max_bytes: int = 0,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.db_path = db_path
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, List[CachedResponse]]" = OrderedDict()
+        self._bytes = 0
+        if db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS http_cache ("
+                    "key TEXT NOT NULL, vary TEXT NOT NULL, meta TEXT NOT NULL, "
+                    "content BLOB NOT NULL, size INTEGER NOT NULL, stored_at REAL NOT NULL, "
+                    "PRIMARY KEY (key, vary))"
+                )
+
+    @staticmethod
+    def key(method: str, url: str, request_headers: Dict[str, str]) -> str:
+        credentials = sorted(
+            (name, value)
+            for name, value in request_headers.items()
+            if _CREDENTIAL_HEADER.fullmatch(name)
+        )
+        return hashlib.sha256(
+            f"{method} {url}\n{json.dumps(credentials)}".encode()
+        ).hexdigest()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _db_get(self, key: str) -> List[Tuple[str, bytes]]:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT meta, content FROM http_cache WHERE key = ?", (key,)
+            ).fetchall()
+
+    def _db_put(self, key: str, entry: CachedResponse) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO http_cache (key, vary, meta, content, size, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(entry.vary, sort_keys=True), entry.dumps(), entry.content, entry.size, entry.stored_at),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+            while total > self.disk_max_bytes:
+                row = conn.execute(
+                    "SELECT rowid, size FROM http_cache ORDER BY stored_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM http_cache WHERE rowid = ?", (row[0],))
+                total -= row[1]
+
+    def _remember(self, key: str, entry: CachedResponse) -> None:
+        variants = self._entries.pop(key, [])
+        for existing in [v for v in variants if v.vary == entry.vary]:
+            variants.remove(existing)
+            self._bytes -= existing.size
+        variants.append(entry)
+        self._bytes += entry.size
+        self._entries[key] = variants
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= sum(variant.size for variant in evicted)
+
+    async def lookup(
+        self, method: str, url: str, request_headers: Dict[str, str]
+    ) -> Optional[CachedResponse]:
+        """Returns the stored response matching the request, fresh or not."""
+        key = self.key(method, url, request_headers)
+        variants = self._entries.get(key)
+        if variants is None and self.db_path:
+            rows = await asyncio.to_thread(self._db_get, key)
+            for meta, content in rows:
+                self._remember(key, CachedResponse.loads(meta, content))
+            variants = self._entries.get(key)
+        if variants is None:
+            return None
+        self._entries.move_to_end(key)
+        return next((entry for entry in variants if entry.matches(request_headers)), None)
+
+    async def store(
+        self,
+        method: str,
+        url: str,
+        request_headers: Dict[str, str],
+        response: httpx.Response,
+    ) -> Optional[CachedResponse]:
+        """
+        Stores a response if its status and headers allow it; spilled bodies
+        are not cached.
+        """
+        headers = {
+            name: value
+            for name, value in normalize_headers(dict(response.headers)).items()
+            if name not in _FRAMING_HEADERS
+        }
+        directives = _directives(headers.get("cache-control"))
+        vary_names = [
+            name.strip().lower() for name in headers.get("vary", "").split(",") if name.strip()
+        ]
+        if (
+            "body_ref" in response.extensions
+            or response.status_code not in _CACHEABLE_STATUSES
+            or "no-store" in directives
+            or "private" in directives
+            or "*" in vary_names
+            or len(response.content) > self.max_entry_bytes
+        ):
+            return None
+        entry = CachedResponse(
+            response.status_code,
+            headers,
+            response.content,
+            {name: request_headers.get(name) for name in vary_names},
+            time.time(),
+        )
+        # a response that is never fresh is only worth keeping to revalidate
+        if entry.freshness_lifetime() <= 0 and not entry.validators():
+            return None
+        await self._put(self.key(method, url, request_headers), entry)
+        return entry
+
+    async def revalidated(
+        self,
+        method: str,
+        url: str,
+        request_headers: Dict[str, str],
+        entry: CachedResponse,
+        not_modified: httpx.Response,
+    ) -> CachedResponse:
+        """Refreshes a stored response with the headers of a 304 Not Modified."""
+        headers = {**entry.headers}
+        for name, value in normalize_headers(dict(not_modified.headers)).items():
+            if name not in _FRAMING_HEADERS:
+                headers[name] = value
+        headers.pop("age", None)
+        refreshed = CachedResponse(entry.status_code, headers, entry.content, entry.vary, time.time())
+        await self._put(self.key(method, url, request_headers), refreshed)
+        return refreshed
+
+    async def _put(self, key: str, entry: CachedResponse) -> None:
+        self._remember(key, entry)
+        if self.db_path:
+            await asyncio.to_thread(self._db_put, key, entry)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+
+http_cache = HttpCache(
+    max_bytes=settings.HTTP_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.HTTP_CACHE_MAX_ENTRY_BYTES,
+    db_path=settings.HTTP_CACHE_DB_PATH,
+    disk_max_bytes=settings.HTTP_CACHE_DISK_MAX_BYTES,
+)
@@ -0,0 +1,356 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.core.config import settings
+from app.services.body_store import body_store
+from app.services.http_cache import (
+    CACHEABLE_METHODS,
+    http_cache,
+    normalize_headers,
+    request_bypasses,
+    request_revalidates,
+)
+from app.services.http_resilience import (
+    CIRCUIT_REJECTED,
+    host_health,
+    is_host_failure,
+    is_retryable,
+    max_attempts,
+    retry_delay,
+)
+from app.services.instrumentation import (
+    record_http_cache,
+    record_http_hedge,
+    record_http_response,
+    record_http_retry,
+)
+from app.services.single_flight import SingleFlight, call_key
+
+
+class HttpClientPool:
+    """
+    Owns the shared async HTTP client used to execute workflow API calls.
+
+    A single `httpx.AsyncClient` keeps connections alive per origin, so
+    consecutive steps that hit the same host reuse the TCP/TLS connection
+    instead of handshaking again. On top of httpx's global limits, a
+    semaphore per host caps how many requests can be in flight to any one
+    target so a single slow API cannot take the whole pool.
+    """
+
+    def __init__(self) -> None:
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(
+                    settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT
+                ),
+            )
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(
+                settings.HTTP_MAX_CONNECTIONS_PER_HOST
+            )
+        return self._host_limits[host]
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        json: Optional[Any] = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> httpx.Response:
+        """
+        Sends a request over the shared pool and returns the fully read response.
+        The body is streamed; one larger than `RESPONSE_SPILL_THRESHOLD_BYTES`
+        is spilled to the body store instead of being read into memory.
+
+        Args:
+            method: HTTP method of the request
+            url: Absolute URL of the target endpoint
+            json: Optional JSON body
+            headers: Optional request headers
+            timeout: Optional per-request timeout in seconds, overriding the pool default
+        """
+        request_timeout = (
+            httpx.Timeout(timeout, connect=settings.HTTP_CONNECT_TIMEOUT)
+            if timeout is not None
+            else httpx.USE_CLIENT_DEFAULT
+        )
+        async with self._host_limit(url):
+            request = self.client.build_request(
+                method,
+                url,
+                json=json,
+                # templates substitute typed values, headers must be text
+                headers={name: str(value) for name, value in (headers or {}).items()},
+                timeout=request_timeout,
+            )
+            response = await self.client.send(request, stream=True)
+            try:
+                return await body_store.read_response(response)
+            finally:
+                await response.aclose()
+
+    async def aclose(self) -> None:
+        """Closes the underlying client and releases every pooled connection."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._host_limits.clear()
+        host_health.clear()
+
+
+http_client_pool = HttpClientPool()
+
+# Identical GET/HEAD calls in flight share one response with HTTP_COALESCE_GETS
+_idempotent_requests = SingleFlight("http_get")
+_COALESCED_METHODS = {"GET", "HEAD"}
+
+
+async def execute_api_request(
+    api_details: Dict[str, Any],
+    use_cache: bool = True,
+) -> Tuple[Any, Optional[str]]:
+    """
+    Executes a formatted API call over the shared pool.
+
+    With `HTTP_COALESCE_GETS`, a GET or HEAD identical (URL and headers) to
+    one already in flight waits for that response instead of being sent
+    again. Failed attempts are retried, and slow ones hedged, according to
+    the per-method policy; hosts that keep failing are skipped for a while.
+    With `HTTP_CACHE_ENABLED`, GET and HEAD responses are cached as their
+    Cache-Control headers allow.
+
+    Args:
+        api_details: The formatted `ApiDetails` of the call as a dict
+        use_cache: Whether the HTTP response cache may be used for this call
+
+    Returns:
+        A tuple of the response data (parsed JSON, or the raw text wrapped in
+        a dict) and an error message if the call failed
+    """
+    method = api_details["method"]
+    method = str(getattr(method, "value", method)).upper()
+    if (
+        settings.HTTP_COALESCE_GETS
+        and method in _COALESCED_METHODS
+        and not api_details.get("body")
+    ):
+        key = call_key(method, api_details["url"], api_details.get("headers"), use_cache)
+        result, _ = await _idempotent_requests.do(
+            key, lambda: _send_api_request(api_details, method, use_cache)
+        )
+        return result
+    return await _send_api_request(api_details, method, use_cache)
+
+
+async def _send_api_request(
+    api_details: Dict[str, Any], method: str, use_cache: bool
+) -> Tuple[Any, Optional[str]]:
+    """
+    Serves a GET or HEAD from the HTTP cache when a fresh response is stored,
+    revalidating a stale one with a conditional request; sends any other
+    call as is.
+    """
+    request_headers = normalize_headers(api_details.get("headers"))
+    if (
+        not use_cache
+        or not settings.HTTP_CACHE_ENABLED
+        or method not in CACHEABLE_METHODS
+        or api_details.get("body")
+        or request_bypasses(request_headers)
+    ):
+        response, error = await _send_with_policy(api_details, method)
+        return _response_result(response, error)
+
+    url = api_details["url"]
+    entry = await http_cache.lookup(method, url, request_headers)
+    if entry is not None and entry.is_fresh() and not request_revalidates(request_headers):
+        record_http_cache("hit")
+        return _response_result(entry.to_response(method, url), None)
+
+    conditional = api_details
+    if entry is not None and entry.validators():
+        conditional = {
+            **api_details,
+            "headers": {**(api_details.get("headers") or {}), **entry.validators()},
+        }
+    response, error = await _send_with_policy(conditional, method)
+    if entry is not None and response is not None and response.status_code == 304:
+        entry = await http_cache.revalidated(method, url, request_headers, entry, response)
+        record_http_cache("revalidated")
+        return _response_result(entry.to_response(method, url), None)
+
+    if response is not None:
+        await http_cache.store(method, url, request_headers, response)
+    record_http_cache("miss")
+    return _response_result(response, error)
+
+
+async def _timed_request(
+    api_details: Dict[str, Any], host: str
+) -> Tuple[Optional[httpx.Response], Optional[httpx.RequestError]]:
+    """Sends one attempt of a call, returning its response or network error."""
+    started = time.perf_counter()
+    try:
+        response = await http_client_pool.request(
+            api_details["method"],
+            api_details["url"],
+            json=api_details.get("body"),
+            headers=api_details.get("headers"),
+        )
+    except httpx.RequestError as e:
+        record_http_response("error", time.perf_counter() - started, 0)
+        logging.error(f"Request Exception: {e!r}")
+        return None, e
+    duration = time.perf_counter() - started
+    host_health.latency(host).observe(duration)
+    body_ref = response.extensions.get("body_ref")
+    record_http_response(
+        response.status_code,
+        duration,
+        body_ref["size"] if body_ref else len(response.content),
+    )
+    return response, None
+
+
+async def _hedged_request(
+    api_details: Dict[str, Any], host: str, method: str
+) -> Tuple[Optional[httpx.Response], Optional[httpx.RequestError]]:
+    """
+    Sends an attempt, and a duplicate of it when the host has not answered
+    within its usual latency (`HTTP_HEDGE_PERCENTILE`). The first successful
+    answer wins and the other request is cancelled.
+    """
+    hedge_after = host_health.hedge_delay(host, method)
+    if hedge_after is None:
+        return await _timed_request(api_details, host)
+
+    tasks = {asyncio.ensure_future(_timed_request(api_details, host))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return done.pop().result()
+
+        record_http_hedge()
+        logging.info(f"No response from {host} after {hedge_after:.3f}s; hedging")
+        tasks.add(asyncio.ensure_future(_timed_request(api_details, host)))
+        pending = set(tasks)
+        result: Tuple[Optional[httpx.Response], Optional[httpx.RequestError]] = (None, None)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if result[1] is None:
+                    return result
+        return result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _send_with_policy(
+    api_details: Dict[str, Any], method: str
+) -> Tuple[Optional[httpx.Response], Optional[str]]:
+    """
+    Sends a call with the resilience policy: calls to a host whose circuit
+    breaker is open fail fast, network errors and retryable statuses are
+    retried with jittered backoff for methods with `HTTP_RETRY_MAX_ATTEMPTS`,
+    and slow idempotent calls are hedged with `HTTP_HEDGE_ENABLED`.
+
+    Returns:
+        The final response, or None and an error message when none arrived
+    """
+    host = urlsplit(api_details["url"]).netloc
+    breaker = host_health.breaker(host)
+    attempts = max_attempts(method)
+
+    for attempt in itertools.count(1):
+        # a request let through an open circuit is its half-open trial
+        trial = breaker.is_open
+        if not breaker.allow():
+            CIRCUIT_REJECTED.inc()
+            error = (
+                f"API call to {host} was not sent: the host failed repeatedly "
+                f"and is skipped for up to {settings.HTTP_CIRCUIT_RESET_SECONDS:g}s"
+            )
+            logging.error(error)
+            return None, error
+
+        try:
+            response, network_error = await _hedged_request(api_details, host, method)
+        except BaseException:
+            # a trial cancelled or failed before any answer still has to be
+            # released, or the circuit would never let another one through
+            if trial:
+                breaker.record(success=False)
+            raise
+        breaker.record(success=not is_host_failure(response))
+        if attempt >= attempts or not is_retryable(response):
+            break
+        delay = retry_delay(attempt, response)
+        record_http_retry()
+        logging.warning(
+            f"API call to {host} failed "
+            f"({response.status_code if response is not None else repr(network_error)}), "
+            f"retrying in {delay:.2f}s (attempt {attempt + 1} of {attempts})"
+        )
+        await asyncio.sleep(delay)
+
+    if response is None:
+        return None, f"API call failed due to a network error: {network_error!r}"
+    return response, None
+
+
+def _response_result(
+    response: Optional[httpx.Response], error: Optional[str]
+) -> Tuple[Any, Optional[str]]:
+    """Turns a response into the response data and error of the call."""
+    if response is None:
+        return {"error": error}, error
+
+    body_ref = response.extensions.get("body_ref")
+    try:
+        response.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        logging.error(
+            f"HTTP Error: {e.response.status_code} {e.response.reason_phrase}"
+        )
+        error = (
+            f"API call failed with status {e.response.status_code}: {e.response.reason_phrase}"
+        )
+        content = body_ref["preview"] if body_ref else e.response.text
+        return {"error": error, "content": content}, error
+
+    if body_ref:
+        # the state and events only carry a reference to the spilled body
+        return dict(body_ref), None
+
+    try:
+        response_data = response.json()
+        logging.info(f"API Response Data: {response_data}")
+    except ValueError:
+        logging.warning("API response was not valid JSON. Storing raw text.")
+        response_data = {"raw_content": response.text}
+    return response_data, None
@@ -0,0 +1,161 @@
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import metrics_registry
+
+
+CIRCUIT_OPENED = metrics_registry.counter(
+    "workflow_http_circuit_opened_total",
+    "Times a target host's circuit breaker opened after repeated failures.",
+)
+CIRCUIT_REJECTED = metrics_registry.counter(
+    "workflow_http_circuit_rejected_total",
+    "Target API calls failed fast because their host's circuit was open.",
+)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host after `failure_threshold` consecutive
+    failures (network errors and 5xx responses), so calls to a dead host fail
+    fast instead of waiting for timeouts.
+
+    After `reset_seconds` one trial request is let through: its success
+    closes the circuit, its failure opens it again. A threshold of 0
+    disables the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; claims the trial when half open."""
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_seconds or self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record(self, success: bool) -> None:
+        self._trial_in_flight = False
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.failure_threshold and (
+            self.opened_at is not None or self.failures >= self.failure_threshold
+        ):
+            if self.opened_at is None:
+                CIRCUIT_OPENED.inc()
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Keeps a host's most recent response times for hedging decisions."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, quantile: float, min_samples: int) -> Optional[float]:
+        """The latency at `quantile`, or None until `min_samples` were observed."""
+        if len(self._samples) < min_samples:
+            return None
+        ordered: List[float] = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class HostHealth:
+    """The circuit breakers and latency trackers of every target host."""
+
+    def __init__(self) -> None:
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(
+                settings.HTTP_CIRCUIT_FAILURE_THRESHOLD,
+                settings.HTTP_CIRCUIT_RESET_SECONDS,
+            )
+        return self._breakers[host]
+
+    def latency(self, host: str) -> LatencyTracker:
+        if host not in self._latencies:
+            self._latencies[host] = LatencyTracker()
+        return self._latencies[host]
+
+    def hedge_delay(self, host: str, method: str) -> Optional[float]:
+        """
+        How long to wait for a response before sending a duplicate request,
+        or None when the call must not be hedged.
+        """
+        if not settings.HTTP_HEDGE_ENABLED or method not in settings.HTTP_HEDGE_METHODS:
+            return None
+        return self.latency(host).percentile(
+            settings.HTTP_HEDGE_PERCENTILE, settings.HTTP_HEDGE_MIN_SAMPLES
+        )
+
+    def clear(self) -> None:
+        self._breakers.clear()
+        self._latencies.clear()
+
+
+host_health = HostHealth()
+
+
+def max_attempts(method: str) -> int:
+    """How many times a call with this method may be sent, retries included."""
+    return max(1, settings.HTTP_RETRY_MAX_ATTEMPTS.get(method, 1))
+
+
+def is_retryable(response: Optional[httpx.Response]) -> bool:
+    """Network errors (no response) and the configured statuses are retried."""
+    return response is None or response.status_code in settings.HTTP_RETRY_STATUSES
+
+
+def is_host_failure(response: Optional[httpx.Response]) -> bool:
+    """Whether a result counts against the host's circuit breaker."""
+    return response is None or response.status_code >= 500
+
+
+def retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    """
+    The delay before retry number `attempt` (from 1): the response's
+    Retry-After when it sent one, otherwise exponential backoff with full
+    jitter.
+    """
+    value = response.headers.get("retry-after") if response is not None else None
+    if value:
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(settings.HTTP_RETRY_MAX_DELAY, max(0.0, delay))
+    backoff = min(
+        settings.HTTP_RETRY_MAX_DELAY,
+        settings.HTTP_RETRY_BASE_DELAY * 2 ** (attempt - 1),
+    )
+    return random.uniform(0, backoff)
@@ -0,0 +1,244 @@
+import functools
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from app.core.metrics import metrics_registry
+
+
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+NODE_DURATION = metrics_registry.histogram(
+    "workflow_node_duration_seconds",
+    "Wall time of a workflow graph node.",
+    ["node", "outcome"],
+)
+LLM_TOKENS = metrics_registry.counter(
+    "workflow_llm_tokens_total",
+    "LLM tokens used by workflow graph nodes.",
+    ["node", "direction"],
+)
+LLM_CALLS = metrics_registry.counter(
+    "workflow_llm_calls_total",
+    "LLM calls made by workflow graph nodes.",
+    ["node"],
+)
+COMPACTION_TOKENS_SAVED = metrics_registry.counter(
+    "workflow_compaction_tokens_saved_total",
+    "Estimated prompt tokens saved by compacting API responses shown to an LLM.",
+    ["node"],
+)
+HTTP_REQUESTS = metrics_registry.counter(
+    "workflow_http_requests_total",
+    "Target API requests by response status; network failures count as 'error'.",
+    ["status"],
+)
+HTTP_DURATION = metrics_registry.histogram(
+    "workflow_http_request_duration_seconds",
+    "Time until a target API response was fully read.",
+)
+HTTP_RETRIES = metrics_registry.counter(
+    "workflow_http_retries_total",
+    "Target API calls sent again after a network error or a retryable status.",
+)
+HTTP_HEDGES = metrics_registry.counter(
+    "workflow_http_hedges_total",
+    "Duplicate requests sent because a target API call was slower than usual.",
+)
+HTTP_CACHE_LOOKUPS = metrics_registry.counter(
+    "workflow_http_cache_lookups_total",
+    "Cacheable target API calls by outcome: hit, revalidated (304) or miss.",
+    ["outcome"],
+)
+HTTP_RESPONSE_BYTES = metrics_registry.histogram(
+    "workflow_http_response_bytes",
+    "Size of target API response bodies.",
+    buckets=BYTES_BUCKETS,
+)
+
+# The timing record of the node running in the current task, if any
+_node_timing: ContextVar[Optional[Dict[str, Any]]] = ContextVar("node_timing", default=None)
+
+
+def _node_label() -> str:
+    timing = _node_timing.get()
+    return timing["node"] if timing else "none"
+
+
+def usage_from_result(response: LLMResult) -> Tuple[int, int]:
+    """Sums the input and output tokens a chat model reported for a call."""
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            if not isinstance(generation, ChatGeneration):
+                continue
+            usage = getattr(generation.message, "usage_metadata", None) or {}
+            input_tokens += usage.get("input_tokens", 0)
+            output_tokens += usage.get("output_tokens", 0)
+    return input_tokens, output_tokens
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Counts the tokens reported by every chat model call into the node's timing."""
+
+    run_inline = True
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        input_tokens, output_tokens = usage_from_result(response)
+        node = _node_label()
+        LLM_CALLS.inc(node=node)
+        LLM_TOKENS.inc(input_tokens, node=node, direction="input")
+        LLM_TOKENS.inc(output_tokens, node=node, direction="output")
+        timing = _node_timing.get()
+        if timing is not None:
+            timing["llm_calls"] += 1
+            timing["llm_input_tokens"] += input_tokens
+            timing["llm_output_tokens"] += output_tokens
+
+
+token_usage_callback = TokenUsageCallback()
+
+
+def record_compaction(original_tokens: int, tokens: int) -> None:
+    """Records the tokens a response compaction saved in the metrics and the node's timing."""
+    COMPACTION_TOKENS_SAVED.inc(original_tokens - tokens, node=_node_label())
+    timing = _node_timing.get()
+    if timing is not None:
+        timing["compaction_tokens_saved"] += original_tokens - tokens
+
+
+def record_http_response(status: Any, duration: float, response_bytes: int) -> None:
+    """
+    Records a target API response in the metrics and the running node's
+    timing. A node making several calls (retries, for_each elements) gets
+    their total time and size, and the status of the last one.
+    """
+    HTTP_REQUESTS.inc(status=str(status))
+    HTTP_DURATION.observe(duration)
+    HTTP_RESPONSE_BYTES.observe(response_bytes)
+    timing = _node_timing.get()
+    if timing is not None:
+        timing["http_requests"] += 1
+        timing["http_status"] = status
+        timing["http_ms"] = round((timing["http_ms"] or 0) + duration * 1000, 2)
+        timing["response_bytes"] = (timing["response_bytes"] or 0) + response_bytes
+
+
+def record_http_retry() -> None:
+    """Counts a retried target API call in the metrics and the running node's timing."""
+    HTTP_RETRIES.inc()
+    timing = _node_timing.get()
+    if timing is not None:
+        timing["http_retries"] += 1
+
+
+def record_http_hedge() -> None:
+    """Counts a hedged target API call in the metrics and the running node's timing."""
+    HTTP_HEDGES.inc()
+    timing = _node_timing.get()
+    if timing is not None:
+        timing["http_hedges"] += 1
+
+
+def record_http_cache(outcome: str) -> None:
+    """Records an HTTP cache lookup in the metrics and the running node's timing."""
+    HTTP_CACHE_LOOKUPS.inc(outcome=outcome)
+    timing = _node_timing.get()
+    if timing is not None:
+        timing["http_cache"] = outcome
+        if outcome != "miss":
+            timing["http_cache_hits"] += 1
+
+
+def node_http_cache() -> Optional[str]:
+    """The outcome of the running node's last HTTP cache lookup, if any."""
+    timing = _node_timing.get()
+    return timing["http_cache"] if timing else None
+
+
+def new_timing(node: str, step_index: Optional[int]) -> Dict[str, Any]:
+    """An empty timing record of a node."""
+    return {
+        "node": node,
+        "step_index": step_index,
+        "started_at": round(time.time() * 1000, 2),
+        "duration_ms": 0.0,
+        "llm_calls": 0,
+        "llm_input_tokens": 0,
+        "llm_output_tokens": 0,
+        "compaction_tokens_saved": 0,
+        "http_requests": 0,
+        "http_status": None,
+        "http_ms": None,
+        "response_bytes": None,
+        "http_retries": 0,
+        "http_hedges": 0,
+        "http_cache": None,
+        "http_cache_hits": 0,
+    }
+
+
+def use_timing(timing: Dict[str, Any]) -> None:
+    """
+    Records the work of the current task into `timing` instead of the
+    record of the node that started it (see `add_timing`).
+    """
+    _node_timing.set(timing)
+
+
+# the counters of a timing record that add up across records
+_ADDITIVE = (
+    "llm_calls",
+    "llm_input_tokens",
+    "llm_output_tokens",
+    "compaction_tokens_saved",
+    "http_requests",
+    "http_retries",
+    "http_hedges",
+    "http_cache_hits",
+)
+
+
+def add_timing(timing: Dict[str, Any]) -> None:
+    """Adds the counters of work done in a task of its own to the running node's timing."""
+    node_timing = _node_timing.get()
+    if node_timing is not None:
+        for name in _ADDITIVE:
+            node_timing[name] += timing[name]
+
+
+def instrument_node(
+    node: str,
+) -> Callable[[Callable[..., Awaitable[Dict[str, Any]]]], Callable[..., Awaitable[Dict[str, Any]]]]:
+    """
+    Wraps a graph node so its wall time, LLM token usage and HTTP responses
+    are recorded in the metrics and returned under `timings` in its update.
+    """
+
+    def decorator(
+        func: Callable[..., Awaitable[Dict[str, Any]]],
+    ) -> Callable[..., Awaitable[Dict[str, Any]]]:
+        @functools.wraps(func)
+        async def wrapper(state: Dict[str, Any]) -> Dict[str, Any]:
+            timing = new_timing(
+                node, state.get("step_index") if node != "create_plan" else None
+            )
+            context_token = _node_timing.set(timing)
+            started = time.perf_counter()
+            outcome = "exception"
+            try:
+                update = await func(state)
+                outcome = "error" if update.get("error") else "ok"
+            finally:
+                duration = time.perf_counter() - started
+                _node_timing.reset(context_token)
+                NODE_DURATION.observe(duration, node=node, outcome=outcome)
+                timing["duration_ms"] = round(duration * 1000, 2)
+            return {**update, "timings": [timing]}
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,365 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import re
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+
+from app.core.config import settings
+from app.core.metrics import metrics_registry
+from app.services.instrumentation import usage_from_result
+from app.services.single_flight import SingleFlight, call_key
+
+
+QUEUE_DEPTH = metrics_registry.gauge(
+    "workflow_llm_queue_depth",
+    "LLM calls waiting for the scheduler.",
+    ["priority"],
+)
+QUEUE_WAIT = metrics_registry.histogram(
+    "workflow_llm_queue_wait_seconds",
+    "Time an LLM call waited for the scheduler before it was sent.",
+    ["priority"],
+)
+IN_FLIGHT = metrics_registry.gauge(
+    "workflow_llm_in_flight",
+    "LLM calls currently in flight.",
+)
+RETRIES = metrics_registry.counter(
+    "workflow_llm_retries_total",
+    "LLM calls retried after a rate limit or provider error, by status.",
+    ["status"],
+)
+
+# The share of the LLM budget batches may use, when the current task runs
+# one. Tasks spawned while running a batch inherit it through their context.
+_batch_share: ContextVar[Optional[asyncio.Semaphore]] = ContextVar(
+    "llm_batch_share", default=None
+)
+
+_RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Gemini reports the server-side retry hint in the error message
+_RETRY_IN = re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+_RETRY_DELAY = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)")
+
+
+class Priority(IntEnum):
+    """Scheduling priority of an LLM call; lower values are sent first."""
+
+    # steps of workflows that are already running
+    STEP = 0
+    # planning calls that start a new workflow
+    PLAN = 1
+    # API calls generated ahead of time for steps that are not ready yet
+    SPECULATIVE = 2
+
+
+class TokenBucket:
+    """
+    A bucket refilled continuously at `per_minute` units a minute and holding
+    at most one minute's worth. A limit of 0 disables it.
+    """
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (an oversized amount waits for a full bucket)."""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self._level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float) -> None:
+        """Removes `amount` units; a negative amount returns an over-estimate."""
+        if self.capacity <= 0:
+            return
+        self._refill(now)
+        self._level = min(self.capacity, self._level - amount)
+
+
+class _UsageCollector(BaseCallbackHandler):
+    """Collects the token usage a single call reported."""
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self.tokens = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self.tokens += sum(usage_from_result(response))
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    """The HTTP status behind a provider error, looking through wrapped causes."""
+    while exc is not None:
+        for candidate in (
+            getattr(exc, "status_code", None),
+            getattr(exc, "code", None),
+            getattr(getattr(exc, "response", None), "status_code", None),
+        ):
+            if isinstance(candidate, int):
+                return int(candidate)
+        exc = exc.__cause__
+    return None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """The delay the provider asked for in a Retry-After header or its message, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    match = _RETRY_IN.search(str(exc)) or _RETRY_DELAY.search(str(exc))
+    return float(match.group(1)) if match else None
+
+
+def estimate_tokens(inputs: Dict[str, Any]) -> int:
+    """
+    A rough token count of a call used to debit the token bucket before the
+    call is sent; the difference to the reported usage is settled afterwards.
+    """
+    text = json.dumps(inputs, default=str)
+    return len(text) // 4 + settings.LLM_ESTIMATED_OUTPUT_TOKENS
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "future", "enqueued")
+
+    def __init__(self, priority: Priority, tokens: int, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class LlmLimiter:
+    """
+    Schedules every LLM call made by the workflows.
+
+    Calls are sent in priority order, so steps of workflows that are already
+    running go ahead of planning calls for new ones, and only while the
+    concurrency limit and the requests- and tokens-per-minute buckets allow.
+    Rate-limited calls are retried after the delay the provider asks for,
+    and the whole scheduler holds off for that long so the rest of the queue
+    does not run into the same limit.
+
+    Batch runs all draw from one smaller share of the same budget, so however
+    many batches run at once they cannot crowd out interactive workflows.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        batch_share: float,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.batch_share = batch_share
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._queue: List[Tuple[int, int, _Waiter]] = []
+        self._sequence = itertools.count()
+        self._waiting = {priority: 0 for priority in Priority}
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._calls = SingleFlight("llm")
+        # shared by every batch
+        self._batch_slots = asyncio.Semaphore(max(1, int(max_concurrency * batch_share)))
+
+    def _set_waiting(self, priority: Priority, delta: int) -> None:
+        self._waiting[priority] += delta
+        QUEUE_DEPTH.set(self._waiting[priority], priority=priority.name.lower())
+
+    def _schedule_pump(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._pump)
+
+    def _pump(self) -> None:
+        """Grants waiting calls in priority order for as long as the limits allow."""
+        self._timer = None
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            if self._in_flight >= self.max_concurrency:
+                return
+            now = time.monotonic()
+            delay = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now),
+                self._tokens.wait_time(waiter.tokens, now),
+            )
+            if delay > 0:
+                self._schedule_pump(delay)
+                return
+
+            heapq.heappop(self._queue)
+            self._requests.take(1, now)
+            self._tokens.take(waiter.tokens, now)
+            self._in_flight += 1
+            IN_FLIGHT.set(self._in_flight)
+            self._set_waiting(waiter.priority, -1)
+            QUEUE_WAIT.observe(now - waiter.enqueued, priority=waiter.priority.name.lower())
+            waiter.future.set_result(None)
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        IN_FLIGHT.set(self._in_flight)
+        self._pump()
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        priority: Priority = Priority.STEP,
+        tokens: int = 0,
+        sequence: Optional[int] = None,
+    ) -> AsyncIterator[None]:
+        """
+        Waits until the scheduler sends this call and holds its slot for the
+        duration of the call.
+
+        Args:
+            priority: Scheduling priority of the call
+            tokens: Tokens to debit from the tokens-per-minute bucket
+            sequence: Queue position to keep across retries; new calls queue last
+        """
+        share = _batch_share.get()
+        if share is not None:
+            await share.acquire()
+        try:
+            waiter = _Waiter(priority, tokens, asyncio.get_running_loop().create_future())
+            order = next(self._sequence) if sequence is None else sequence
+            heapq.heappush(self._queue, (priority, order, waiter))
+            self._set_waiting(priority, 1)
+            self._pump()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    self._release()
+                else:
+                    waiter.future.cancel()
+                    self._set_waiting(priority, -1)
+                raise
+            try:
+                yield
+            finally:
+                self._release()
+        finally:
+            if share is not None:
+                share.release()
+
+    def settle_tokens(self, estimated: int, actual: int) -> None:
+        """Corrects the token bucket once a call's real usage is known."""
+        if actual:
+            self._tokens.take(actual - estimated, time.monotonic())
+
+    def hold_off(self, delay: float) -> None:
+        """Stops sending calls for `delay` seconds, e.g. after the provider rate limited us."""
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    async def invoke(
+        self,
+        chain: Runnable,
+        inputs: Dict[str, Any],
+        priority: Priority = Priority.STEP,
+    ) -> Any:
+        """
+        Runs a chain through the scheduler, retrying rate-limited and
+        unavailable calls with exponential backoff or the provider's
+        Retry-After delay.
+
+        With `SINGLE_FLIGHT_ENABLED`, a call identical to one already in
+        flight (same chain and inputs) waits for that call's result instead
+        of being sent again.
+        """
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await self._invoke(chain, inputs, priority)
+        # chains are cached per (name, model), so their identity stands for
+        # the prompt template and model
+        key = call_key(id(chain), inputs)
+        result, _ = await self._calls.do(
+            key, lambda: self._invoke(chain, inputs, priority)
+        )
+        return result
+
+    async def _invoke(
+        self,
+        chain: Runnable,
+        inputs: Dict[str, Any],
+        priority: Priority,
+    ) -> Any:
+        estimated = estimate_tokens(inputs)
+        sequence = next(self._sequence)
+        for attempt in itertools.count():
+            usage = _UsageCollector()
+            try:
+                async with self.slot(priority, estimated, sequence):
+                    result = await chain.ainvoke(inputs, config={"callbacks": [usage]})
+                self.settle_tokens(estimated, usage.tokens)
+                return result
+            except Exception as e:
+                status = _status_of(e)
+                if status not in _RETRYABLE_STATUSES or attempt >= settings.LLM_MAX_RETRIES:
+                    raise
+                retry_after = _retry_after(e)
+                backoff = min(
+                    settings.LLM_RETRY_MAX_DELAY,
+                    settings.LLM_RETRY_BASE_DELAY * 2**attempt,
+                )
+                delay = retry_after if retry_after is not None else random.uniform(backoff / 2, backoff)
+                if status == 429:
+                    self.hold_off(delay)
+                RETRIES.inc(status=str(status))
+                logging.warning(
+                    f"LLM call failed with status {status}, retrying in {delay:.1f}s "
+                    f"(attempt {attempt + 1} of {settings.LLM_MAX_RETRIES})"
+                )
+                await asyncio.sleep(delay)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Runs the enclosed batch within the share of the LLM budget all batches draw from."""
+        token = _batch_share.set(self._batch_slots)
+        try:
+            yield
+        finally:
+            _batch_share.reset(token)
+
+
+llm_limiter = LlmLimiter(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    batch_share=settings.BATCH_LLM_SHARE,
+    requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+)
@@ -0,0 +1,413 @@
+import asyncio
+import hashlib
+import heapq
+import json
+import math
+import re
+import sqlite3
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.models.workflow import ApiOperation, OpenApiRegistration
+
+
+_HTTP_METHODS = ("get", "post", "put", "patch", "delete")
+
+# BM25 term-frequency saturation and document-length normalization
+_K1 = 1.2
+_B = 0.75
+
+# path segments and operation ids say the most about an operation, so their
+# terms are counted this many times
+_IDENTIFIER_BOOST = 2
+
+# how deep request body schemas are expanded for the LLM
+_MAX_SCHEMA_DEPTH = 2
+
+_CAMEL_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_WORD = re.compile(r"[a-z0-9]+")
+_PATH_PARAMETER = re.compile(r"\{([^}]+)\}")
+_STOPWORDS = frozenset(
+    "a an and the to of in on for by with from at as is are be it its this that "
+    "then using use my me i our your into".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase index terms. camelCase and snake_case
+    identifiers are split into their words and plurals are folded, so
+    "getUserOrders" and "the user's orders" share terms.
+    """
+    terms = []
+    for word in _WORD.findall(_CAMEL_BOUNDARY.sub(" ", text).lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class SpecError(ValueError):
+    """Raised when a document is not a usable OpenAPI or Swagger spec."""
+
+
+def parse_spec(text: str) -> Dict[str, Any]:
+    """
+    Parses a spec from JSON, or YAML when PyYAML is installed.
+
+    Raises:
+        SpecError: If the text is neither
+    """
+    try:
+        spec = json.loads(text)
+    except ValueError:
+        try:
+            import yaml
+        except ImportError:
+            raise SpecError("The spec is not valid JSON, and YAML support needs PyYAML.")
+        try:
+            spec = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise SpecError(f"The spec is neither valid JSON nor YAML: {e}")
+    if not isinstance(spec, dict) or not ("openapi" in spec or "swagger" in spec):
+        raise SpecError("The document is not an OpenAPI 3 or Swagger 2 spec.")
+    return spec
+
+
+def _resolve(spec: Dict[str, Any], node: Any, seen: Tuple[str, ...] = ()) -> Tuple[Any, Tuple[str, ...]]:
+    """Follows a local `$ref`, returning the target and the refs followed so far."""
+    while isinstance(node, dict) and isinstance(node.get("$ref"), str):
+        ref = node["$ref"]
+        if not ref.startswith("#/") or ref in seen:
+            return {}, seen
+        seen = seen + (ref,)
+        node = spec
+        for part in ref[2:].split("/"):
+            node = node.get(part.replace("~1", "/").replace("~0", "~"), {}) if isinstance(node, dict) else {}
+    return node, seen
+
+
+def _schema_shape(spec: Dict[str, Any], schema: Any, depth: int = 0, seen: Tuple[str, ...] = ()) -> Any:
+    """Reduces a JSON schema to its properties mapped to their types."""
+    schema, seen = _resolve(spec, schema, seen)
+    if not isinstance(schema, dict):
+        return "any"
+    for combinator in ("allOf", "oneOf", "anyOf"):
+        if combinator in schema and "properties" not in schema:
+            parts = [_schema_shape(spec, part, depth, seen) for part in schema[combinator]]
+            merged = {k: v for part in parts if isinstance(part, dict) for k, v in part.items()}
+            return merged or (parts[0] if parts else "any")
+    if "properties" in schema and depth < _MAX_SCHEMA_DEPTH:
+        return {
+            name: _schema_shape(spec, child, depth + 1, seen)
+            for name, child in schema["properties"].items()
+        }
+    if schema.get("type") == "array" and depth < _MAX_SCHEMA_DEPTH:
+        return [_schema_shape(spec, schema.get("items", {}), depth + 1, seen)]
+    return schema.get("type", "object" if "properties" in schema else "any")
+
+
+def _schema_terms(spec: Dict[str, Any], schema: Any, seen: Tuple[str, ...] = ()) -> List[str]:
+    """The names of a schema, its referenced components and its properties."""
+    terms = []
+    if isinstance(schema, dict) and isinstance(schema.get("$ref"), str):
+        terms.append(schema["$ref"].rsplit("/", 1)[-1])
+    schema, seen = _resolve(spec, schema, seen)
+    if not isinstance(schema, dict) or len(seen) > _MAX_SCHEMA_DEPTH:
+        return terms
+    for name, child in schema.get("properties", {}).items():
+        terms.append(name)
+        terms.extend(_schema_terms(spec, child, seen))
+    for key in ("items", "allOf", "oneOf", "anyOf"):
+        children = schema.get(key)
+        for child in children if isinstance(children, list) else [children] if children else []:
+            terms.extend(_schema_terms(spec, child, seen))
+    return terms
+
+
+def _server_url(spec: Dict[str, Any], servers: Any, base_url: Optional[str]) -> str:
+    if base_url:
+        return base_url.rstrip("/")
+    if "swagger" in spec:
+        host = spec.get("host")
+        if not host:
+            return spec.get("basePath", "").rstrip("/")
+        scheme = (spec.get("schemes") or ["https"])[0]
+        return f"{scheme}://{host}{spec.get('basePath', '')}".rstrip("/")
+    for server in servers or []:
+        url = server.get("url", "")
+        for name, variable in (server.get("variables") or {}).items():
+            url = url.replace("{" + name + "}", str(variable.get("default", "")))
+        return url.rstrip("/")
+    return ""
+
+
+def extract_operations(
+    spec: Dict[str, Any], base_url: Optional[str] = None
+) -> List[Tuple[ApiOperation, List[str]]]:
+    """
+    Flattens a spec into its operations, each with the index terms
+    describing it: path, operation id, summary, description, tags,
+    parameter names and request and response schema names.
+
+    Args:
+        spec: A parsed OpenAPI 3 or Swagger 2 document
+        base_url: Overrides the server URL the spec declares
+
+    Raises:
+        SpecError: If a part of the spec does not have the shape OpenAPI
+            prescribes, e.g. a list of parameters that is an object
+    """
+    try:
+        return _flatten_operations(spec, base_url)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise SpecError(f"The spec is malformed: {e!r}")
+
+
+def _flatten_operations(
+    spec: Dict[str, Any], base_url: Optional[str]
+) -> List[Tuple[ApiOperation, List[str]]]:
+
+    operations = []
+    for path, path_item in (spec.get("paths") or {}).items():
+        path_item, _ = _resolve(spec, path_item)
+        if not isinstance(path_item, dict):
+            continue
+        for method in _HTTP_METHODS:
+            operation = path_item.get(method)
+            if not isinstance(operation, dict):
+                continue
+
+            parameters: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            for parameter in (path_item.get("parameters") or []) + (operation.get("parameters") or []):
+                parameter, _ = _resolve(spec, parameter)
+                if isinstance(parameter, dict) and "name" in parameter:
+                    parameters[(parameter["name"], parameter.get("in", ""))] = parameter
+
+            body_schema = None
+            request_body, _ = _resolve(spec, operation.get("requestBody"))
+            if isinstance(request_body, dict):
+                content = request_body.get("content") or {}
+                media = content.get("application/json") or next(iter(content.values()), {})
+                body_schema = media.get("schema")
+            described = []
+            for (name, location), parameter in parameters.items():
+                if location == "body":
+                    # Swagger 2 declares the request body as a parameter
+                    body_schema = parameter.get("schema")
+                    continue
+                kind = parameter.get("type") or _resolve(spec, parameter.get("schema", {}))[0].get("type", "string")
+                required = ", required" if parameter.get("required") else ""
+                described.append(f"{name} ({location}, {kind}{required})")
+
+            server = _server_url(spec, operation.get("servers") or path_item.get("servers") or spec.get("servers"), base_url)
+            api_operation = ApiOperation(
+                method=method.upper(),
+                url=server + _PATH_PARAMETER.sub(r"<\1>", path),
+                operation_id=operation.get("operationId"),
+                summary=operation.get("summary") or (operation.get("description") or "")[:200] or None,
+                parameters=described,
+                body=_schema_shape(spec, body_schema) if body_schema is not None else None,
+            )
+            if api_operation.body is not None and not isinstance(api_operation.body, dict):
+                api_operation.body = {"value": api_operation.body}
+
+            identifiers = " ".join([path, operation.get("operationId") or ""])
+            text = " ".join(
+                [
+                    operation.get("summary") or "",
+                    operation.get("description") or "",
+                    " ".join(operation.get("tags") or []),
+                    " ".join(name for name, _ in parameters),
+                    " ".join(_schema_terms(spec, body_schema)),
+                ]
+                + [
+                    " ".join(_schema_terms(spec, media.get("schema")))
+                    for response in (operation.get("responses") or {}).values()
+                    for media in ((_resolve(spec, response)[0] or {}).get("content") or {}).values()
+                    if isinstance(media, dict)
+                ]
+            )
+            terms = tokenize(identifiers) * _IDENTIFIER_BOOST + tokenize(method + " " + text)
+            operations.append((api_operation, terms))
+    return operations
+
+
+class OperationIndex:
+    """
+    A BM25 inverted index over the operations of one spec.
+
+    A search only walks the postings of the query's terms, so its cost
+    depends on how many operations share those terms, not on the size of
+    the spec.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        operations: List[ApiOperation],
+        postings: Dict[str, List[Tuple[int, int]]],
+        lengths: List[int],
+    ) -> None:
+        self.version = version
+        self.operations = operations
+        self.postings = postings
+        self.lengths = lengths
+        self.average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, version: str, documents: List[Tuple[ApiOperation, List[str]]]) -> "OperationIndex":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = []
+        for doc_id, (_, terms) in enumerate(documents):
+            lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                postings.setdefault(term, []).append((doc_id, frequency))
+        return cls(version, [operation for operation, _ in documents], postings, lengths)
+
+    def search(self, query: str, k: int) -> List[ApiOperation]:
+        """Returns the `k` operations that best match the query, best first."""
+        total = len(self.operations)
+        scores: Dict[int, float] = {}
+        terms: Set[str] = set(tokenize(query))
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings:
+                norm = _K1 * (1 - _B + _B * self.lengths[doc_id] / self.average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (_K1 + 1) / (frequency + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self.operations[doc_id] for doc_id, _ in best]
+
+    def dumps(self) -> str:
+        return json.dumps(
+            {
+                "operations": [operation.model_dump(exclude_none=True) for operation in self.operations],
+                "postings": self.postings,
+                "lengths": self.lengths,
+            },
+            separators=(",", ":"),
+        )
+
+    @classmethod
+    def loads(cls, version: str, payload: str) -> "OperationIndex":
+        data = json.loads(payload)
+        return cls(
+            version,
+            [ApiOperation.model_validate(operation) for operation in data["operations"]],
+            {term: [tuple(posting) for posting in postings] for term, postings in data["postings"].items()},
+            data["lengths"],
+        )
+
+
+class OpenApiIndexStore:
+    """
+    Keeps the endpoint index of each workspace's registered OpenAPI spec.
+
+    A spec is parsed and indexed once when it is registered. Built indexes
+    are kept in memory and written to SQLite at `OPENAPI_INDEX_DB_PATH`, so
+    they are loaded, not rebuilt, after a restart and are shared between
+    workers. Without a path they only live in memory.
+    """
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        self.db_path = db_path
+        self._indexes: Dict[str, OperationIndex] = {}
+        self._table_created = False
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # the file is created on first use rather than when the app imports
+        # the store
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                if not self._table_created:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS openapi_indexes ("
+                        "workspace TEXT PRIMARY KEY, version TEXT NOT NULL, "
+                        "operations INTEGER NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+                    )
+                    self._table_created = True
+                yield conn
+        finally:
+            conn.close()
+
+    def _db_get(self, workspace: str) -> Optional[Tuple[str, str]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT version, payload FROM openapi_indexes WHERE workspace = ?",
+                (workspace,),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _db_put(self, workspace: str, index: OperationIndex) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO openapi_indexes "
+                "(workspace, version, operations, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (workspace, index.version, len(index.operations), index.dumps(), time.time()),
+            )
+
+    def _build(self, text: str, base_url: Optional[str]) -> OperationIndex:
+        spec = parse_spec(text)
+        version = hashlib.sha256(
+            (text + "\n" + (base_url or "")).encode()
+        ).hexdigest()[:16]
+        operations = extract_operations(spec, base_url)
+        if not operations:
+            raise SpecError("The spec does not declare any operations.")
+        return OperationIndex.build(version, operations)
+
+    async def register(
+        self, workspace: str, text: str, base_url: Optional[str] = None
+    ) -> OpenApiRegistration:
+        """
+        Parses and indexes a spec, replacing the workspace's previous one.
+
+        Args:
+            workspace: The workspace the spec belongs to
+            text: The spec as JSON or YAML
+            base_url: Overrides the server URL the spec declares
+
+        Raises:
+            SpecError: If the text is not a usable spec
+        """
+        index = await asyncio.to_thread(self._build, text, base_url)
+        if self.db_path:
+            await asyncio.to_thread(self._db_put, workspace, index)
+        self._indexes[workspace] = index
+        return OpenApiRegistration(
+            workspace=workspace, operations=len(index.operations), version=index.version
+        )
+
+    async def get(self, workspace: str) -> Optional[OperationIndex]:
+        """Returns the workspace's index, or None if it has no registered spec."""
+        index = self._indexes.get(workspace)
+        if index is None and self.db_path:
+            row = await asyncio.to_thread(self._db_get, workspace)
+            if row is None:
+                return None
+            index = await asyncio.to_thread(OperationIndex.loads, *row)
+            self._indexes[workspace] = index
+        return index
+
+    async def search(
+        self, workspace: str, query: str, k: Optional[int] = None
+    ) -> List[ApiOperation]:
+        """Returns the workspace's operations most relevant to the query."""
+        index = await self.get(workspace)
+        if index is None:
+            return []
+        return index.search(query, k or settings.OPENAPI_TOP_K)
+
+
+openapi_index = OpenApiIndexStore(db_path=settings.OPENAPI_INDEX_DB_PATH)
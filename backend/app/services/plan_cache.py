@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from enum import Enum
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.models.workflow import Plan
+
+
+# A quoted literal must start and end on a word boundary so apostrophes
+# inside words ("user's") are not mistaken for quotes.
+_QUOTED_LITERAL = re.compile(r"""(?<!\w)(['"])(.+?)\1(?!\w)""")
+
+
+def _param_marker(index: int) -> str:
+    return f"<<p{index}>>"
+
+
+def normalize_prompt(prompt: str) -> Tuple[str, List[str]]:
+    """
+    Normalizes a prompt into a cache key shape and its literal parameters.
+
+    Quoted literals are lifted out and replaced with positional markers, then
+    whitespace is collapsed and the text lowercased. Two prompts that only
+    differ in their quoted values (usernames, ids, ...) normalize to the same
+    text.
+
+    Returns:
+        A tuple of the normalized prompt and the lifted literal values
+    """
+    params: List[str] = []
+
+    def lift(match: re.Match) -> str:
+        params.append(match.group(2))
+        return _param_marker(len(params) - 1)
+
+    text = _QUOTED_LITERAL.sub(lift, prompt)
+    return " ".join(text.lower().split()), params
+
+
+# Literals shorter than this are too likely to collide with unrelated text
+# ("1" in "step 1") to be swapped for markers safely.
+MIN_PARAM_LENGTH = 3
+
+
+def literal_pattern(value: str) -> re.Pattern:
+    if not value:
+        return re.compile(r"(?!)")
+    prefix = r"(?<!\w)" if re.match(r"\w", value[0]) else ""
+    suffix = r"(?!\w)" if re.match(r"\w", value[-1]) else ""
+    return re.compile(prefix + re.escape(value) + suffix)
+
+
+def substitute_strings(value: Any, substitute: Callable[[str], str]) -> Any:
+    """
+    Applies `substitute` to every string value of a model or JSON structure,
+    returning its JSON-mode data. Keys, enum values (an action type, an HTTP
+    method) and other scalars are left alone, so the result still validates
+    against the model whatever the substitution does to free text.
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, BaseModel):
+        return {
+            name: substitute_strings(getattr(value, name), substitute)
+            for name in type(value).model_fields
+        }
+    if isinstance(value, str):
+        return substitute(value)
+    if isinstance(value, dict):
+        return {key: substitute_strings(child, substitute) for key, child in value.items()}
+    if isinstance(value, list):
+        return [substitute_strings(child, substitute) for child in value]
+    return value
+
+
+def replace_literals(
+    data: Any, replacements: List[Tuple[str, str]]
+) -> Tuple[Any, Set[int]]:
+    """
+    Replaces literal values inside the string values of a model or JSON
+    structure (see `substitute_strings`).
+
+    Args:
+        data: The model or JSON structure
+        replacements: (literal, replacement) pairs; longer literals are
+            replaced first so "admin" does not eat "admin2"
+
+    Returns:
+        The JSON-mode data, and the indexes of the pairs whose literal occurred
+    """
+    order = sorted(range(len(replacements)), key=lambda i: -len(replacements[i][0]))
+    patterns = [(i, literal_pattern(replacements[i][0]), replacements[i][1]) for i in order]
+    found: Set[int] = set()
+
+    def substitute(text: str) -> str:
+        for index, pattern, replacement in patterns:
+            text, count = pattern.subn(lambda _: replacement, text)
+            if count:
+                found.add(index)
+        return text
+
+    return substitute_strings(data, substitute), found
+
+
+def parameterize_plan(plan: Plan, params: List[str]) -> Tuple[Plan, Dict[int, str]]:
+    """
+    Replaces the prompt's literal values in a plan's string values with
+    positional markers.
+
+    Returns:
+        A tuple of the parameterized plan and the literals that could not be
+        replaced safely. Those are pinned: a cached plan is only reused when
+        the new prompt has the same value at each pinned position.
+    """
+    replaceable = [
+        index for index, value in enumerate(params) if len(value) >= MIN_PARAM_LENGTH
+    ]
+    plan_data, found = replace_literals(
+        plan, [(params[index], _param_marker(index)) for index in replaceable]
+    )
+    replaced = {replaceable[position] for position in found}
+    pinned = {
+        index: value for index, value in enumerate(params) if index not in replaced
+    }
+    return Plan.model_validate(plan_data), pinned
+
+
+def bind_plan(plan_template: Plan, params: List[str]) -> Plan:
+    """Fills the positional markers of a parameterized plan with new literal values."""
+
+    def bind(text: str) -> str:
+        for index, value in enumerate(params):
+            text = text.replace(_param_marker(index), value)
+        return text
+
+    return Plan.model_validate(substitute_strings(plan_template, bind))
+
+
+class PlanCache:
+    """
+    Caches generated plans keyed on the normalized user prompt.
+
+    Plans are stored with the prompt's quoted literals replaced by markers, so
+    a hit for "log in as 'bob'" can serve "log in as 'alice'" with the values
+    re-bound. Entries live in an in-memory LRU with a TTL; when
+    `PLAN_CACHE_DB_PATH` is set they are also written to SQLite so the cache
+    survives restarts and is shared between workers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        db_path: Optional[str] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        if db_path:
+            self._init_db()
+
+    @staticmethod
+    def _key(normalized_prompt: str, variant: str = "") -> str:
+        if variant:
+            normalized_prompt = f"{variant}\n{normalized_prompt}"
+        return hashlib.sha256(normalized_prompt.encode()).hexdigest()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS plan_cache ("
+                "key TEXT PRIMARY KEY, plan TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _db_get(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT created_at, plan FROM plan_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _db_put(self, key: str, created_at: float, payload: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO plan_cache (key, plan, created_at) VALUES (?, ?, ?)",
+                (key, payload, created_at),
+            )
+            conn.execute(
+                "DELETE FROM plan_cache WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+
+    def _remember(self, key: str, created_at: float, payload: str) -> None:
+        self._entries[key] = (created_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _is_fresh(self, created_at: float) -> bool:
+        return time.time() - created_at < self.ttl_seconds
+
+    async def get(self, prompt: str, variant: str = "") -> Optional[Plan]:
+        """
+        Looks up a cached plan for the prompt.
+
+        Args:
+            prompt: The user prompt
+            variant: Keeps plans of different shapes (e.g. planning modes) apart
+
+        Returns:
+            The cached plan bound to this prompt's literals, or None on a miss
+        """
+        normalized, params = normalize_prompt(prompt)
+        key = self._key(normalized, variant)
+
+        entry = self._entries.get(key)
+        if entry is not None and not self._is_fresh(entry[0]):
+            del self._entries[key]
+            entry = None
+        if entry is None and self.db_path:
+            entry = await asyncio.to_thread(self._db_get, key)
+            if entry is not None and not self._is_fresh(entry[0]):
+                entry = None
+        if entry is None:
+            return None
+
+        self._remember(key, *entry)
+        payload = json.loads(entry[1])
+        if any(params[int(index)] != value for index, value in payload["pinned"].items()):
+            return None
+        return bind_plan(Plan.model_validate(payload["plan"]), params)
+
+    async def put(self, prompt: str, plan: Plan, variant: str = "") -> None:
+        """Stores a freshly generated plan for the prompt."""
+        normalized, params = normalize_prompt(prompt)
+        key = self._key(normalized, variant)
+        created_at = time.time()
+        plan_template, pinned = parameterize_plan(plan, params)
+        payload = json.dumps(
+            {"plan": plan_template.model_dump(mode="json"), "pinned": pinned}
+        )
+
+        self._remember(key, created_at, payload)
+        if self.db_path:
+            await asyncio.to_thread(self._db_put, key, created_at, payload)
+
+
+plan_cache = PlanCache(
+    max_entries=settings.PLAN_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PLAN_CACHE_TTL_SECONDS,
+    db_path=settings.PLAN_CACHE_DB_PATH,
+)
@@ -0,0 +1,328 @@
+import asyncio
+import itertools
+import json
+import re
+import sqlite3
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.workflow import (
+    ActionType,
+    ApiDetails,
+    ExtractionRule,
+    Plan,
+    Recipe,
+    RecipeStep,
+    WorkflowResponse,
+    WorkflowStepResponse,
+)
+from app.services.agents.step_scheduler import ready_steps, source_api_step
+from app.services.body_store import body_store, is_body_ref
+from app.services.extraction import apply_extraction_rules
+from app.services.http_client import execute_api_request
+from app.services.plan_cache import MIN_PARAM_LENGTH, normalize_prompt, replace_literals
+from app.services.templates import format_recursively, template_placeholders
+
+
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _matches(data: Any, value: Any) -> bool:
+    """Whether a response value is an extracted one, type included (True is not 1)."""
+    if _is_number(data) and _is_number(value):
+        return data == value
+    # the extraction LLM tends to stringify ids, or to parse numeric strings
+    if _is_number(data) and isinstance(value, str):
+        return str(data) == value
+    if isinstance(data, str) and _is_number(value):
+        return data == str(value)
+    return type(data) is type(value) and data == value
+
+
+def _find_paths(data: Any, value: Any, path: str = "$") -> Iterator[str]:
+    """Yields a JSONPath to every occurrence of `value` in `data`."""
+    if _matches(data, value):
+        yield path
+    elif isinstance(data, dict):
+        for key, child in data.items():
+            segment = f".{key}" if _IDENTIFIER.fullmatch(key) else f"[{json.dumps(key)}]"
+            yield from _find_paths(child, value, path + segment)
+    elif isinstance(data, list):
+        for index, child in enumerate(data):
+            yield from _find_paths(child, value, f"{path}[{index}]")
+
+
+def _locate_source(
+    earlier_steps: List[RecipeStep],
+    responses: Dict[int, Any],
+    value: Any,
+) -> Tuple[Optional[RecipeStep], Optional[str]]:
+    """
+    Finds the latest earlier API call whose response contains `value` at a
+    single path. A response holding it at several paths is skipped, as
+    nothing tells which of them the LLM took it from.
+    """
+    for step in reversed(earlier_steps):
+        response = responses.get(step.step_index)
+        # a spilled body too large to load cannot be searched
+        if step.api_details is None or is_body_ref(response):
+            continue
+        paths = list(itertools.islice(_find_paths(response, value), 2))
+        if len(paths) == 1:
+            return step, paths[0]
+    return None, None
+
+
+def _parameterize_template(
+    template: ApiDetails,
+    literals: List[Tuple[str, str]],
+) -> ApiDetails:
+    """
+    Replaces literal values baked into an API call template's string values
+    with placeholders; keys and the method are left alone.
+
+    Args:
+        template: The API call template the LLM produced
+        literals: (placeholder name, literal value) pairs
+    """
+    template_data, _ = replace_literals(
+        template, [(value, "{" + name + "}") for name, value in literals]
+    )
+    return ApiDetails.model_validate(template_data)
+
+
+async def compile_recipe(
+    prompt: str,
+    plan: Plan,
+    request_history: List[Dict[str, Any]],
+    extracted_data: Dict[str, Any],
+) -> Recipe:
+    """
+    Compiles a successful run into a recipe that replays without the LLM.
+
+    The API call templates are kept with their placeholders; the prompt's
+    quoted literals and any extracted values the LLM inlined are turned back
+    into placeholders. Values the extraction LLM found are located in the
+    recorded responses (spilled bodies included) and replaced by path rules;
+    the rules of data_extraction steps are kept as they are.
+
+    Raises:
+        ValueError: If the run cannot be compiled deterministically
+    """
+    _, params = normalize_prompt(prompt)
+    parameters = {
+        f"p{index}": value
+        for index, value in enumerate(params)
+        if len(value) >= MIN_PARAM_LENGTH
+    }
+    inlined_values = [
+        (name, value)
+        for name, value in extracted_data.items()
+        if isinstance(value, str) and len(value) >= MIN_PARAM_LENGTH
+    ]
+    literals = list(parameters.items()) + inlined_values
+
+    entries = {entry["step_index"]: entry for entry in request_history}
+    steps: List[RecipeStep] = []
+    for index, plan_step in enumerate(plan.steps):
+        if plan_step.action_type == ActionType.FOR_EACH:
+            raise ValueError(f"Step {index + 1} is a for_each step, which recipes do not support.")
+        if plan_step.action_type != ActionType.API_CALL:
+            steps.append(
+                RecipeStep(
+                    step_index=index,
+                    action_type=plan_step.action_type,
+                    extraction_rules=list(plan_step.extraction_rules or []),
+                )
+            )
+            continue
+
+        entry = entries.get(index)
+        if entry is None or entry["error"]:
+            raise ValueError(f"Step {index + 1} did not complete successfully.")
+        template = ApiDetails.model_validate(entry["api_details_template"])
+        template.extraction_rules = None
+        steps.append(
+            RecipeStep(
+                step_index=index,
+                action_type=plan_step.action_type,
+                api_details=_parameterize_template(template, literals),
+                extraction_rules=[
+                    ExtractionRule.model_validate(rule)
+                    for rule in entry["extraction_rules"]
+                ],
+            )
+        )
+
+    responses = {
+        index: await body_store.resolve(entry["response_data"])
+        for index, entry in entries.items()
+    }
+    produced = {rule.variable for step in steps for rule in step.extraction_rules}
+    for consumer in steps:
+        if consumer.api_details is None:
+            continue
+        for name in sorted(template_placeholders(consumer.api_details.model_dump())):
+            if name in produced or name in parameters:
+                continue
+            if name not in extracted_data:
+                raise ValueError(
+                    f"Step {consumer.step_index + 1} uses {{{name}}} but no step produced it."
+                )
+            source, path = _locate_source(
+                steps[: consumer.step_index], responses, extracted_data[name]
+            )
+            if source is None:
+                raise ValueError(
+                    f"Could not locate the value of {{{name}}} at a single path "
+                    "in any recorded response."
+                )
+            source.extraction_rules.append(ExtractionRule(variable=name, path=path))
+            produced.add(name)
+
+    return Recipe(
+        recipe_id=uuid.uuid4().hex,
+        prompt=prompt,
+        plan=plan,
+        steps=steps,
+        parameters=parameters,
+    )
+
+
+async def replay_recipe(
+    recipe: Recipe, parameters: Dict[str, Any]
+) -> WorkflowResponse:
+    """
+    Replays a recipe with new parameter values. Only the HTTP calls are made;
+    independent steps run concurrently as in a live run.
+    """
+    values = {**recipe.parameters, **parameters}
+    extracted: Dict[str, Any] = {}
+    results: Dict[int, WorkflowStepResponse] = {}
+    # the resolved response of each API call, for the data_extraction steps
+    responses: Dict[int, Any] = {}
+    steps = {step.step_index: step for step in recipe.steps}
+    completed: List[int] = []
+    error: Optional[str] = None
+
+    async def run_step(index: int) -> Tuple[Dict[str, Any], Optional[str]]:
+        step = steps[index]
+        if step.api_details is None:
+            source_index = source_api_step(recipe.plan, index)
+            if not step.extraction_rules or source_index not in responses:
+                return {}, None
+            return apply_extraction_rules(step.extraction_rules, responses[source_index]), None
+
+        template = step.api_details.model_dump(exclude={"extraction_rules"})
+        missing = template_placeholders(template) - set(values) - set(extracted)
+        if missing:
+            return {}, f"Step {index + 1} is missing values for: {', '.join(sorted(missing))}"
+
+        api_details = format_recursively(template, {**values, **extracted})
+        response_data, step_error = await execute_api_request(api_details)
+        rule_data: Dict[str, Any] = {}
+        if not step_error:
+            responses[index] = await body_store.resolve(response_data)
+            rule_data = apply_extraction_rules(step.extraction_rules, responses[index])
+        results[index] = WorkflowStepResponse(
+            step_title=f"Step {index + 1}: {recipe.plan.steps[index].description}",
+            request_details=api_details,
+            response_details=response_data,
+            extracted_data=rule_data or None,
+        )
+        return rule_data, step_error
+
+    while error is None:
+        ready = ready_steps(recipe.plan, completed)
+        if not ready:
+            break
+        outcomes = await asyncio.gather(*(run_step(index) for index in ready))
+        for rule_data, step_error in outcomes:
+            extracted.update(rule_data)
+            error = error or step_error
+        completed.extend(ready)
+
+    return WorkflowResponse(
+        results=[results[index] for index in sorted(results)],
+        plan=recipe.plan,
+        extracted_data=extracted,
+        error=error,
+    )
+
+
+class RecipeStore:
+    """
+    Keeps compiled recipes in memory, and in SQLite when `RECIPE_DB_PATH` is
+    set so they survive restarts and are shared between workers. At most
+    `max_entries` recipes are held in memory; the least recently used go
+    first, and are loaded again from SQLite when they are persisted.
+    """
+
+    def __init__(self, max_entries: int, db_path: Optional[str] = None) -> None:
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._recipes: "OrderedDict[str, Recipe]" = OrderedDict()
+        if db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS recipes ("
+                    "recipe_id TEXT PRIMARY KEY, recipe TEXT NOT NULL)"
+                )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _db_get(self, recipe_id: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT recipe FROM recipes WHERE recipe_id = ?", (recipe_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _db_put(self, recipe: Recipe) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO recipes (recipe_id, recipe) VALUES (?, ?)",
+                (recipe.recipe_id, recipe.model_dump_json()),
+            )
+
+    def _remember(self, recipe: Recipe) -> None:
+        self._recipes[recipe.recipe_id] = recipe
+        self._recipes.move_to_end(recipe.recipe_id)
+        while len(self._recipes) > self.max_entries:
+            self._recipes.popitem(last=False)
+
+    async def get(self, recipe_id: str) -> Optional[Recipe]:
+        recipe = self._recipes.get(recipe_id)
+        if recipe is None and self.db_path:
+            recipe_json = await asyncio.to_thread(self._db_get, recipe_id)
+            if recipe_json is not None:
+                recipe = Recipe.model_validate_json(recipe_json)
+        if recipe is not None:
+            self._remember(recipe)
+        return recipe
+
+    async def put(self, recipe: Recipe) -> None:
+        self._remember(recipe)
+        if self.db_path:
+            await asyncio.to_thread(self._db_put, recipe)
+
+
+recipe_store = RecipeStore(
+    max_entries=settings.RECIPE_MAX_ENTRIES,
+    db_path=settings.RECIPE_DB_PATH,
+)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics_registry
+from app.models.workflow import RunStatus, WorkflowRequest
+from app.services.agents.workflow_agent import (
+    initial_state,
+    snapshot_state,
+    start_workflow_run,
+)
+from app.services.run_registry import run_registry
+from app.services.run_store import run_store
+
+
+QUEUE_DEPTH = metrics_registry.gauge(
+    "workflow_run_queue_depth",
+    "Submitted runs waiting for a worker.",
+)
+QUEUE_WAIT = metrics_registry.histogram(
+    "workflow_run_queue_wait_seconds",
+    "Time a submitted run waited for a worker before it started.",
+)
+BUSY_WORKERS = metrics_registry.gauge(
+    "workflow_run_workers_busy",
+    "Run queue workers executing a run.",
+)
+RUNS_REJECTED = metrics_registry.counter(
+    "workflow_runs_rejected_total",
+    "Submitted runs turned away because the run queue was full.",
+)
+
+
+class RunQueueFull(Exception):
+    """Raised when a run is submitted while the run queue is full."""
+
+
+class RunQueue:
+    """
+    Executes submitted runs on a fixed pool of workers, detached from the
+    request that submitted them.
+
+    Submitting a run checkpoints it as queued and returns its id at once;
+    clients poll its checkpoint or follow its events by that id, before and
+    while it runs. At most `workers` runs execute at once, which bounds the
+    LLM and HTTP concurrency of queued work, and at most `max_size` wait for
+    a worker: further submissions are rejected until the queue drains.
+    Queued runs are not cancelled when their clients disconnect.
+    """
+
+    def __init__(self, workers: int, max_size: int) -> None:
+        self.workers = workers
+        self.max_size = max_size
+        # runs waiting for a worker, in submission order
+        self._pending: "OrderedDict[str, Tuple[WorkflowRequest, float]]" = OrderedDict()
+        # waiting runs, counting those whose queued checkpoint is being written
+        self._admitted = 0
+        self._changed = asyncio.Condition()
+        self._worker_tasks: List[asyncio.Task] = []
+
+    async def submit(self, request: WorkflowRequest) -> Tuple[str, int]:
+        """
+        Queues a run of a request.
+
+        Returns:
+            The run id and the run's position in the queue
+
+        Raises:
+            RunQueueFull: If `max_size` runs are already waiting
+        """
+        if self._admitted >= self.max_size:
+            RUNS_REJECTED.inc()
+            raise RunQueueFull(
+                f"The run queue is full ({self.max_size} runs waiting); retry later."
+            )
+        self._admitted += 1
+        self._start_workers()
+        run_id = uuid.uuid4().hex
+        run_registry.reserve(run_id)
+        # written before a worker can pick the run up, so it never overwrites
+        # the run's own checkpoints
+        try:
+            await run_store.save(
+                run_id, RunStatus.QUEUED, request, snapshot_state(initial_state(request, run_id))
+            )
+        except BaseException:
+            self._admitted -= 1
+            run_registry.release(run_id)
+            raise
+        async with self._changed:
+            self._pending[run_id] = (request, time.monotonic())
+            QUEUE_DEPTH.set(len(self._pending))
+            self._changed.notify()
+        return run_id, len(self._pending)
+
+    def position(self, run_id: str) -> Optional[int]:
+        """The position of a waiting run in the queue, 1 being next."""
+        for position, pending_id in enumerate(self._pending, start=1):
+            if pending_id == run_id:
+                return position
+        return None
+
+    async def cancel(self, run_id: str) -> bool:
+        """
+        Cancels a run, whether it still waits for a worker or already executes
+        in this process.
+
+        Returns:
+            False if the run is neither waiting nor executing here
+        """
+        entry = self._pending.pop(run_id, None)
+        if entry is None:
+            return run_registry.cancel(run_id)
+        self._admitted -= 1
+        QUEUE_DEPTH.set(len(self._pending))
+        request, _ = entry
+        await run_store.save(
+            run_id, RunStatus.CANCELLED, request, snapshot_state(initial_state(request, run_id))
+        )
+        run = run_registry.get(run_id)
+        if run is not None:
+            await run.publish(
+                {"event": "cancelled", "data": {"detail": "The run was cancelled."}}
+            )
+            await run.finish()
+        return True
+
+    def _start_workers(self) -> None:
+        if not self._worker_tasks:
+            self._worker_tasks = [
+                asyncio.create_task(self._work()) for _ in range(self.workers)
+            ]
+
+    async def _work(self) -> None:
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: bool(self._pending))
+                run_id, (request, submitted_at) = self._pending.popitem(last=False)
+                self._admitted -= 1
+                QUEUE_DEPTH.set(len(self._pending))
+            QUEUE_WAIT.observe(time.monotonic() - submitted_at)
+
+            run = start_workflow_run(request, run_id=run_id, cancel_when_abandoned=False)
+            BUSY_WORKERS.inc()
+            try:
+                # a cancelled run ends its task without stopping the worker
+                await asyncio.wait([run.task])
+            except asyncio.CancelledError:
+                # shutting down: the run is cancelled and checkpointed first
+                run.task.cancel()
+                await asyncio.wait([run.task])
+                raise
+            finally:
+                BUSY_WORKERS.dec()
+
+    async def aclose(self) -> None:
+        """
+        Stops the workers on shutdown. Executing runs are cancelled and waiting
+        ones checkpointed as cancelled, so all of them can be resumed.
+        """
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        if self._pending:
+            logging.info(f"Cancelling {len(self._pending)} queued runs on shutdown")
+        for run_id in list(self._pending):
+            await self.cancel(run_id)
+
+
+run_queue = RunQueue(
+    workers=settings.RUN_QUEUE_WORKERS,
+    max_size=settings.RUN_QUEUE_MAX_SIZE,
+)
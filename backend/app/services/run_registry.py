@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics_registry
+
+
+RUNS_ABANDONED = metrics_registry.counter(
+    "workflow_runs_abandoned_total",
+    "Runs cancelled before finishing because their client disconnected.",
+)
+
+
+class RunAlreadyActive(Exception):
+    """Raised when a run is started while it is already running or reserved."""
+
+
+class ActiveRun:
+    """
+    A workflow run executing in this process, with every event it emitted so
+    far. Any number of clients can follow it; each starts from the event
+    index it asks for, so a client that re-attaches misses nothing.
+
+    With `cancel_when_abandoned`, the run is cancelled once its last follower
+    left and nobody re-attached within `RUN_DISCONNECT_GRACE_SECONDS`.
+    """
+
+    def __init__(self, run_id: str, cancel_when_abandoned: bool = False) -> None:
+        self.run_id = run_id
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_when_abandoned = cancel_when_abandoned
+        self.followers = 0
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        async with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    async def finish(self) -> None:
+        async with self._changed:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    async def follow(self, after: int = 0) -> AsyncIterator[Dict[str, Any]]:
+        """Yields the run's events from index `after` on until the run finishes."""
+        async for batch in self.follow_batches(after):
+            for event in batch:
+                yield event
+
+    async def follow_batches(
+        self, after: int = 0, idle_timeout: Optional[float] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yields the run's events from index `after` on until the run finishes,
+        all those published since the previous batch at once. With
+        `idle_timeout`, an empty batch is yielded whenever no event was
+        published for that many seconds.
+        """
+        index = max(0, after)
+        self.followers += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        try:
+            while True:
+                async with self._changed:
+                    try:
+                        async with asyncio.timeout(idle_timeout):
+                            await self._changed.wait_for(
+                                lambda: len(self.events) > index or self.done
+                            )
+                    except TimeoutError:
+                        pass
+                    pending = self.events[index:]
+                if not pending and self.done:
+                    return
+                yield pending
+                index += len(pending)
+        finally:
+            self.followers -= 1
+            if self.followers == 0 and not self.done and self.cancel_when_abandoned:
+                self._abandon_timer = asyncio.get_running_loop().call_later(
+                    settings.RUN_DISCONNECT_GRACE_SECONDS, self._cancel_abandoned
+                )
+
+    def _cancel_abandoned(self) -> None:
+        self._abandon_timer = None
+        if self.followers or self.done or self.task is None:
+            return
+        RUNS_ABANDONED.inc()
+        logging.info(f"Run {self.run_id} lost its last client; cancelling it")
+        self.task.cancel()
+
+
+class RunRegistry:
+    """
+    Runs workflows in the background, detached from the client that started
+    them, and keeps finished runs for `RUN_EVENTS_RETENTION_SECONDS` so a
+    late client can still read their events.
+    """
+
+    def __init__(self) -> None:
+        self._runs: Dict[str, ActiveRun] = {}
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - settings.RUN_EVENTS_RETENTION_SECONDS
+        for run_id in [
+            run_id
+            for run_id, run in self._runs.items()
+            if run.done and run.finished_at < cutoff
+        ]:
+            del self._runs[run_id]
+
+    def reserve(self, run_id: str) -> ActiveRun:
+        """
+        Registers a run that has not started yet, e.g. one waiting in the run
+        queue, so clients can already follow it.
+
+        Raises:
+            RunAlreadyActive: If the run is already reserved or running
+        """
+        self._prune()
+        if self.is_running(run_id):
+            raise RunAlreadyActive(f"Run '{run_id}' is already running")
+        run = ActiveRun(run_id)
+        self._runs[run_id] = run
+        return run
+
+    def release(self, run_id: str) -> None:
+        """Drops a reserved run that will not be started after all."""
+        run = self._runs.get(run_id)
+        if run is not None and run.task is None and not run.done:
+            del self._runs[run_id]
+
+    def start(
+        self,
+        run_id: str,
+        events: AsyncGenerator[Dict[str, Any], None],
+        cancel_when_abandoned: bool = False,
+    ) -> ActiveRun:
+        """
+        Starts publishing a run's events in a background task, into the run
+        reserved for them if there is one.
+        """
+        self._prune()
+        run = self._runs.get(run_id)
+        if run is None or run.task is not None or run.done:
+            run = ActiveRun(run_id, cancel_when_abandoned)
+            self._runs[run_id] = run
+        else:
+            run.cancel_when_abandoned = cancel_when_abandoned
+
+        async def pump() -> None:
+            try:
+                async for event in events:
+                    await run.publish(event)
+            except asyncio.CancelledError:
+                # a run cancelled between two events is closed here, so it
+                # still records the cancellation
+                await events.aclose()
+                await run.publish(
+                    {"event": "cancelled", "data": {"detail": "The run was cancelled."}}
+                )
+                raise
+            except Exception as e:
+                logging.error(f"Run {run_id} failed: {e}", exc_info=True)
+            finally:
+                await run.finish()
+
+        run.task = asyncio.create_task(pump())
+        return run
+
+    def cancel(self, run_id: str) -> bool:
+        """Cancels a run executing in this process; False if there is none."""
+        run = self._runs.get(run_id)
+        if run is None or run.done or run.task is None:
+            return False
+        run.task.cancel()
+        return True
+
+    async def aclose(self) -> None:
+        """
+        Cancels the runs still executing on shutdown and waits for them to
+        checkpoint, so they can be resumed.
+        """
+        tasks = [
+            run.task
+            for run in self._runs.values()
+            if run.task is not None and not run.task.done()
+        ]
+        if tasks:
+            logging.info(f"Cancelling {len(tasks)} runs on shutdown")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get(self, run_id: str) -> Optional[ActiveRun]:
+        return self._runs.get(run_id)
+
+    def is_running(self, run_id: str) -> bool:
+        run = self._runs.get(run_id)
+        return run is not None and not run.done
+
+
+run_registry = RunRegistry()
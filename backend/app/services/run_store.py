@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, create_engine, event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.core.config import settings
+from app.models.workflow import RunStatus, WorkflowRequest
+
+
+metadata = MetaData()
+
+workflow_runs = Table(
+    "workflow_runs",
+    metadata,
+    Column("run_id", String(64), primary_key=True),
+    Column("status", String(16), nullable=False),
+    Column("request", Text, nullable=False),
+    Column("state", Text, nullable=False),
+    Column("created_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+)
+
+
+def _async_database_url(database_url: str) -> str:
+    """Points a plain Postgres URL at the async psycopg driver."""
+    for prefix in ("postgresql://", "postgres://"):
+        if database_url.startswith(prefix):
+            return "postgresql+psycopg://" + database_url[len(prefix):]
+    return database_url
+
+
+def _upsert(dialect: str, values: Dict[str, Any]) -> Any:
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(workflow_runs).values(**values)
+    return statement.on_conflict_do_update(
+        index_elements=[workflow_runs.c.run_id],
+        set_={
+            "status": statement.excluded.status,
+            "state": statement.excluded.state,
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+
+
+class RunStore:
+    """
+    Checkpoints workflow runs so they can be resumed after a crash or redeploy.
+
+    The run's state is written after every node as a single upsert. With
+    `DATABASE_URL` set the checkpoints go to Postgres over an async psycopg
+    connection pool; otherwise they go to a local SQLite file, written from a
+    worker thread.
+    """
+
+    def __init__(
+        self,
+        database_url: Optional[str],
+        sqlite_path: str,
+        enabled: bool = True,
+    ) -> None:
+        self.enabled = enabled
+        self._async_engine: Optional[AsyncEngine] = None
+        self._engine: Optional[Engine] = None
+        if database_url:
+            self._async_engine = create_async_engine(
+                _async_database_url(database_url),
+                pool_size=settings.DATABASE_POOL_SIZE,
+                max_overflow=settings.DATABASE_MAX_OVERFLOW,
+                pool_pre_ping=True,
+            )
+        else:
+            self._engine = create_engine(
+                f"sqlite:///{sqlite_path}", connect_args={"timeout": 5}
+            )
+            event.listen(self._engine, "connect", self._enable_wal)
+        self._schema_ready = False
+        self._schema_lock = asyncio.Lock()
+
+    @staticmethod
+    def _enable_wal(dbapi_connection: Any, _: Any) -> None:
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+    @property
+    def dialect(self) -> str:
+        engine = self._async_engine or self._engine
+        return engine.dialect.name
+
+    async def _execute(self, statement: Any) -> Any:
+        """Runs a statement in its own transaction and returns the first row."""
+        if not self._schema_ready:
+            await self._create_schema()
+        if self._async_engine is not None:
+            async with self._async_engine.begin() as conn:
+                result = await conn.execute(statement)
+                return result.first() if result.returns_rows else None
+
+        def execute() -> Any:
+            with self._engine.begin() as conn:
+                result = conn.execute(statement)
+                return result.first() if result.returns_rows else None
+
+        return await asyncio.to_thread(execute)
+
+    async def _create_schema(self) -> None:
+        async with self._schema_lock:
+            if self._schema_ready:
+                return
+            if self._async_engine is not None:
+                async with self._async_engine.begin() as conn:
+                    await conn.run_sync(metadata.create_all)
+            else:
+                await asyncio.to_thread(metadata.create_all, self._engine)
+            self._schema_ready = True
+
+    async def save(
+        self,
+        run_id: str,
+        status: RunStatus,
+        request: WorkflowRequest,
+        state: Dict[str, Any],
+    ) -> None:
+        """
+        Writes the checkpoint of a run. A failed write is logged and does not
+        interrupt the run.
+
+        Args:
+            run_id: The run being checkpointed
+            status: The run's status after this checkpoint
+            request: The request that started the run
+            state: The JSON-serializable snapshot of the run's state
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        statement = _upsert(
+            self.dialect,
+            {
+                "run_id": run_id,
+                "status": status.value,
+                "request": request.model_dump_json(),
+                "state": json.dumps(state),
+                "created_at": now,
+                "updated_at": now,
+            },
+        )
+        try:
+            await self._execute(statement)
+        except Exception as e:
+            logging.error(f"Failed to checkpoint run {run_id}: {e}")
+
+    async def load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Reads the last checkpoint of a run.
+
+        Returns:
+            A dict with the run's status, request, state snapshot and
+            timestamps, or None if the run is unknown
+        """
+        if not self.enabled:
+            return None
+        row = await self._execute(
+            select(workflow_runs).where(workflow_runs.c.run_id == run_id)
+        )
+        if row is None:
+            return None
+        return {
+            "run_id": row.run_id,
+            "status": RunStatus(row.status),
+            "request": WorkflowRequest.model_validate_json(row.request),
+            "state": json.loads(row.state),
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+        }
+
+    async def aclose(self) -> None:
+        """Releases the connection pool."""
+        if self._async_engine is not None:
+            await self._async_engine.dispose()
+        elif self._engine is not None:
+            self._engine.dispose()
+
+
+run_store = RunStore(
+    database_url=settings.DATABASE_URL,
+    sqlite_path=settings.RUN_CHECKPOINT_SQLITE_PATH,
+    enabled=settings.RUN_CHECKPOINTS_ENABLED,
+)
@@ -0,0 +1,332 @@
+import hashlib
+import json
+import random
+import re
+import struct
+import time
+import uuid
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics_registry
+from app.models.workflow import Plan
+from app.services.openapi_index import tokenize
+from app.services.plan_cache import bind_plan, normalize_prompt, parameterize_plan
+
+
+LOOKUPS = metrics_registry.counter(
+    "workflow_similar_plan_lookups_total",
+    "Plan lookups in the similarity index by outcome: reused (served without "
+    "the LLM), suggested (shown to the planning LLM) or miss.",
+    ["outcome"],
+)
+
+# MinHash signature length and its split into LSH bands; 32 bands of 2 rows
+# make prompts with a Jaccard similarity of 0.4 and up near certain to share
+# a bucket. Candidates are then compared exactly, prompts being short.
+_NUM_PERMUTATIONS = 64
+_BANDS = 32
+_ROWS = _NUM_PERMUTATIONS // _BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(_NUM_PERMUTATIONS)
+]
+
+_PARAM_MARKER = re.compile(r"<<p\d+>>")
+# unquoted values the plan is bound to: URLs, emails and anything with a
+# digit (ids, numbers, dates, versions)
+_VALUE = re.compile(r"\S+://\S+|[\w.+-]+@[\w-]+(?:\.[\w-]+)+|[\w-]*\d[\w-]*")
+
+# wordings of the same action are folded into one term
+_SYNONYMS = {
+    "login": "login",
+    "logon": "login",
+    "signin": "login",
+    "authenticate": "login",
+    "fetch": "get",
+    "retrieve": "get",
+    "obtain": "get",
+    "read": "get",
+    "load": "get",
+    "show": "get",
+    "list": "get",
+    "create": "add",
+    "make": "add",
+    "insert": "add",
+    "remove": "delete",
+    "erase": "delete",
+    "modify": "update",
+    "change": "update",
+    "edit": "update",
+}
+_PHRASES = re.compile(r"\b(log|sign)\s+(in|on)\b")
+_ACTIONS = frozenset(_SYNONYMS.values())
+# words that rarely tell two workflows apart
+_FILLER = frozenset("after also please now first next".split())
+# labels of a literal ("as user 'bob'" is "as 'bob'")
+_LABELS = frozenset("user username name".split())
+
+
+def _words(prompt: str) -> List[str]:
+    normalized, _ = normalize_prompt(prompt)
+    normalized = _PHRASES.sub("login", _PARAM_MARKER.sub(" param ", normalized))
+    words = [
+        _SYNONYMS.get(word, word)
+        for word in tokenize(normalized)
+        if len(word) > 1 and word not in _FILLER
+    ]
+    return [
+        word
+        for word, following in zip(words, words[1:] + [""])
+        if not (word in _LABELS and following == "param")
+    ]
+
+
+def shingles(prompt: str) -> FrozenSet[str]:
+    """
+    The word unigrams and bigrams of a prompt, after the prompt's quoted
+    literals are replaced by a generic marker and synonyms are folded.
+    """
+    words = _words(prompt)
+    return frozenset(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+def actions(prompt: str) -> Tuple[str, ...]:
+    """The prompt's actions (log in, get, add, ...) in the order it names them."""
+    return tuple(word for word in _words(prompt) if word in _ACTIONS)
+
+
+def values(prompt: str) -> Tuple[str, ...]:
+    """
+    The unquoted values a prompt names, sorted. Unlike quoted literals they
+    are not re-bound, so a stored plan still holds the values of its own
+    prompt.
+    """
+    normalized, _ = normalize_prompt(prompt)
+    return tuple(sorted(_VALUE.findall(_PARAM_MARKER.sub(" ", normalized))))
+
+
+def minhash(features: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [
+        struct.unpack("<Q", hashlib.blake2b(feature.encode(), digest_size=8).digest())[0]
+        for feature in features
+    ]
+    if not hashes:
+        return tuple([_MERSENNE_PRIME] * _NUM_PERMUTATIONS)
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS
+    )
+
+
+def _bands(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [
+        (band, signature[band * _ROWS : (band + 1) * _ROWS]) for band in range(_BANDS)
+    ]
+
+
+class _Entry:
+    __slots__ = (
+        "entry_id",
+        "variant",
+        "shingles",
+        "actions",
+        "values",
+        "signature",
+        "payload",
+        "created_at",
+        "hits",
+    )
+
+    def __init__(
+        self,
+        entry_id: str,
+        variant: str,
+        features: FrozenSet[str],
+        prompt_actions: Tuple[str, ...],
+        prompt_values: Tuple[str, ...],
+        signature: Tuple[int, ...],
+        payload: str,
+    ) -> None:
+        self.entry_id = entry_id
+        self.variant = variant
+        self.shingles = features
+        self.actions = prompt_actions
+        self.values = prompt_values
+        self.signature = signature
+        self.payload = payload
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class SimilarPlan(NamedTuple):
+    """A stored plan bound to a new prompt's literals."""
+
+    entry_id: str
+    plan: Plan
+    similarity: float
+    # whether both prompts name the same actions in the same order, and the
+    # same unquoted values (ids, numbers, emails, URLs); a plan is only reused
+    # as is when they do
+    same_actions: bool
+    same_values: bool
+
+
+class SimilarPlanIndex:
+    """
+    Finds plans of past successful runs whose prompts are worded differently
+    but mean the same, e.g. "log in as 'bob' and get my profile" and "sign in
+    with user 'bob' then fetch my profile".
+
+    Prompts are reduced to word shingles, whose MinHash signatures are bucketed
+    by locality-sensitive hashing, so a lookup only compares the prompts that
+    share a bucket. Plans are stored with the prompt's quoted literals replaced
+    by markers and re-bound to the new prompt's literals, as in the plan cache;
+    unquoted values (ids, numbers, emails, URLs) are not, so a plan is only
+    reused as is for a prompt naming the same ones.
+    Everything runs in-process. The index holds at most `max_entries` plans;
+    expired ones go first, then the least used.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, _Entry] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+
+    def _is_fresh(self, entry: _Entry) -> bool:
+        return time.time() - entry.created_at < self.ttl_seconds
+
+    def _remove(self, entry_id: str) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band in _bands(entry.signature):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band]
+
+    def _evict(self) -> None:
+        for entry in [entry for entry in self._entries.values() if not self._is_fresh(entry)]:
+            self._remove(entry.entry_id)
+        while len(self._entries) >= self.max_entries:
+            victim = min(
+                self._entries.values(), key=lambda entry: (entry.hits, entry.created_at)
+            )
+            self._remove(victim.entry_id)
+
+    def find(
+        self, prompt: str, variant: str = "", threshold: float = 0.0
+    ) -> Optional[SimilarPlan]:
+        """
+        Looks up the stored plan most similar to the prompt.
+
+        Args:
+            prompt: The user prompt
+            variant: Keeps plans of different shapes (e.g. planning modes) apart
+            threshold: The lowest Jaccard similarity of the prompts' shingles accepted
+
+        Returns:
+            The plan bound to this prompt's literals, or None when no stored
+            plan is similar enough or its literals cannot be re-bound
+        """
+        features = shingles(prompt)
+        _, params = normalize_prompt(prompt)
+        candidates: Set[str] = set()
+        for band in _bands(minhash(features)):
+            candidates.update(self._buckets.get(band, ()))
+
+        best: Optional[Tuple[float, _Entry]] = None
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.variant != variant or not self._is_fresh(entry):
+                continue
+            similarity = len(features & entry.shingles) / len(features | entry.shingles)
+            if similarity < threshold or (best is not None and similarity <= best[0]):
+                continue
+            payload = json.loads(entry.payload)
+            # the literals are re-bound by position, so the prompts must have
+            # the same number of them and agree on the ones that are pinned
+            if payload["params"] != len(params) or any(
+                params[int(index)] != value for index, value in payload["pinned"].items()
+            ):
+                continue
+            best = (similarity, entry)
+
+        if best is None:
+            return None
+        similarity, entry = best
+        entry.hits += 1
+        plan = bind_plan(Plan.model_validate(json.loads(entry.payload)["plan"]), params)
+        return SimilarPlan(
+            entry.entry_id,
+            plan,
+            round(similarity, 3),
+            entry.actions == actions(prompt),
+            entry.values == values(prompt),
+        )
+
+    def lookup(self, prompt: str, variant: str = "") -> Tuple[Optional[SimilarPlan], bool]:
+        """
+        Looks up a stored plan for the prompt with the configured thresholds.
+
+        Returns:
+            A tuple of the most similar plan above `SIMILAR_PLAN_SUGGEST_THRESHOLD`,
+            if any, and whether it is similar enough to be reused as is. A plan
+            whose prompt names other unquoted values is only ever suggested.
+        """
+        similar = self.find(prompt, variant, settings.SIMILAR_PLAN_SUGGEST_THRESHOLD)
+        reusable = (
+            similar is not None
+            and similar.same_actions
+            and similar.same_values
+            and similar.similarity >= settings.SIMILAR_PLAN_REUSE_THRESHOLD
+        )
+        LOOKUPS.inc(outcome="reused" if reusable else "suggested" if similar else "miss")
+        return similar, reusable
+
+    def add(self, prompt: str, plan: Plan, variant: str = "") -> str:
+        """Stores the plan of a successful run, returning its entry id."""
+        _, params = normalize_prompt(prompt)
+        plan_template, pinned = parameterize_plan(plan, params)
+        features = shingles(prompt)
+        entry = _Entry(
+            uuid.uuid4().hex,
+            variant,
+            features,
+            actions(prompt),
+            values(prompt),
+            minhash(features),
+            json.dumps(
+                {
+                    "plan": plan_template.model_dump(mode="json"),
+                    "pinned": pinned,
+                    "params": len(params),
+                }
+            ),
+        )
+        # a prompt seen again replaces its older entry, which shares every bucket
+        for entry_id in list(self._buckets.get(_bands(entry.signature)[0], ())):
+            existing = self._entries[entry_id]
+            if existing.variant == variant and existing.shingles == features:
+                entry.hits = existing.hits
+                self._remove(entry_id)
+        self._evict()
+        self._entries[entry.entry_id] = entry
+        for band in _bands(entry.signature):
+            self._buckets.setdefault(band, set()).add(entry.entry_id)
+        return entry.entry_id
+
+    def discard(self, entry_id: str) -> None:
+        """Drops a plan that did not work for a prompt it was reused for."""
+        self._remove(entry_id)
+
+
+similar_plans = SimilarPlanIndex(
+    max_entries=settings.SIMILAR_PLANS_MAX_ENTRIES,
+    ttl_seconds=settings.SIMILAR_PLANS_TTL_SECONDS,
+)
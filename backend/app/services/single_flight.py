@@ -0,0 +1,74 @@
+import asyncio
+import copy
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from app.core.metrics import metrics_registry
+
+
+T = TypeVar("T")
+
+COALESCED = metrics_registry.counter(
+    "workflow_single_flight_coalesced_total",
+    "Calls that joined an identical call already in flight instead of running.",
+    ["group"],
+)
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight,
+    later callers with the same key wait for its result instead of running it
+    again.
+
+    The call runs in its own task, so a caller that goes away does not cancel
+    it for the others; it is only cancelled once every caller has left.
+    Callers that joined get a deep copy of the result, so nobody shares
+    mutable state with another workflow.
+    """
+
+    def __init__(self, group: str) -> None:
+        self.group = group
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Runs `func` for `key`, or joins the call already in flight for it.
+
+        Returns:
+            A tuple of the result and whether it came from another caller's call
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            COALESCED.inc(group=self.group)
+
+        call.waiters += 1
+        try:
+            result = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+        return (copy.deepcopy(result) if shared else result), shared
+
+
+def call_key(*parts: Any) -> str:
+    """A stable key for a call from its JSON-serializable parts."""
+    return json.dumps(parts, sort_keys=True, default=str)
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import re
+import string
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Set, Tuple, Union
+
+
+# `{name}`, with optional `.key` / `[key]` accessors, `!r` conversion and
+# `:spec` format spec as in str.format. Braces that do not form a placeholder,
+# as in JSON literals, are kept as is.
+_PLACEHOLDER = re.compile(
+    r"\{([A-Za-z_]\w*)((?:\.\w+|\[[^\[\]{}]+\])*)(?:!([rsa]))?(?::([^{}]*))?\}"
+)
+# the field name of a placeholder, as Formatter.parse splits it off
+_FIELD_NAME = re.compile(r"([A-Za-z_]\w*)((?:\.\w+|\[[^\[\]{}]+\])*)")
+_ACCESSOR = re.compile(r"\.(\w+)|\[([^\]]+)\]")
+_formatter = string.Formatter()
+_MISSING = object()
+
+# compiled templates kept, keyed by the hash of the template
+_CACHE_SIZE = 1024
+
+_Render = Callable[[Mapping[str, Any]], Any]
+
+
+class _Field:
+    """A placeholder: a variable, the keys to look up in it and its formatting."""
+
+    __slots__ = ("text", "name", "path", "conversion", "spec")
+
+    def __init__(
+        self, name: str, accessors: str, conversion: Optional[str], spec: str
+    ) -> None:
+        self.text = "{%s%s%s%s}" % (
+            name,
+            accessors,
+            f"!{conversion}" if conversion else "",
+            f":{spec}" if spec else "",
+        )
+        self.name = name
+        self.path: List[Union[str, int]] = [
+            attribute or (int(key) if key.isdigit() else key)
+            for attribute, key in _ACCESSOR.findall(accessors)
+        ]
+        self.conversion = conversion
+        self.spec = spec
+
+    def resolve(self, values: Mapping[str, Any]) -> Any:
+        value = values.get(self.name, _MISSING)
+        for key in self.path:
+            if value is _MISSING:
+                break
+            try:
+                value = value[key]
+            except (KeyError, IndexError, TypeError):
+                value = getattr(value, str(key), _MISSING)
+        return value
+
+    def format(self, values: Mapping[str, Any]) -> str:
+        """The value as text; the placeholder itself when it cannot be resolved."""
+        value = self.resolve(values)
+        if value is _MISSING:
+            return self.text
+        if self.conversion == "r":
+            value = repr(value)
+        elif self.conversion == "a":
+            value = ascii(value)
+        elif self.conversion == "s":
+            value = str(value)
+        try:
+            return format(value, self.spec)
+        except (TypeError, ValueError):
+            return self.text
+
+
+# A compiled node renders its value, or is None when the node holds no
+# placeholder and its constant value is used as is
+_Node = Tuple[Optional[_Render], Any, FrozenSet[str]]
+
+
+def _parse_format_string(text: str) -> Optional[List[Union[str, _Field]]]:
+    """
+    Splits a string as str.format does, with `{{` and `}}` standing for
+    literal braces; None when it is not a format string of placeholders.
+    """
+    parts: List[Union[str, _Field]] = []
+    try:
+        for literal, field_name, spec, conversion in _formatter.parse(text):
+            if literal:
+                parts.append(literal)
+            if field_name is None:
+                continue
+            match = _FIELD_NAME.fullmatch(field_name)
+            if match is None or "{" in spec or conversion not in (None, "r", "s", "a"):
+                return None
+            parts.append(_Field(match.group(1), match.group(2), conversion, spec))
+    except ValueError:
+        return None
+    return parts
+
+
+def _scan_placeholders(text: str) -> List[Union[str, _Field]]:
+    """Splits a string holding stray braces, such as JSON, around its placeholders."""
+    parts: List[Union[str, _Field]] = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(text):
+        if match.start() > position:
+            parts.append(text[position : match.start()])
+        parts.append(_Field(*match.group(1, 2, 3), match.group(4) or ""))
+        position = match.end()
+    if position < len(text):
+        parts.append(text[position:])
+    return parts
+
+
+def _compile_string(text: str) -> _Node:
+    parts = _parse_format_string(text)
+    if parts is None:
+        parts = _scan_placeholders(text)
+
+    fields = [part for part in parts if isinstance(part, _Field)]
+    if not fields:
+        return None, "".join(parts), frozenset()
+    names = frozenset(field.name for field in fields)
+
+    if len(parts) == 1 and not fields[0].conversion and not fields[0].spec:
+        # a whole-value placeholder is replaced by the value itself, so numbers,
+        # lists and objects keep their JSON type
+        field = fields[0]
+
+        def render_value(values: Mapping[str, Any]) -> Any:
+            value = field.resolve(values)
+            return field.text if value is _MISSING else value
+
+        return render_value, None, names
+
+    frozen = tuple(parts)
+
+    def render_text(values: Mapping[str, Any]) -> str:
+        return "".join(
+            part if part.__class__ is str else part.format(values) for part in frozen
+        )
+
+    return render_text, None, names
+
+
+def _compile(data: Any) -> _Node:
+    if isinstance(data, str):
+        return _compile_string(data)
+    if isinstance(data, (dict, list)):
+        keys = data.keys() if isinstance(data, dict) else range(len(data))
+        base = data.copy()
+        slots = []
+        names: FrozenSet[str] = frozenset()
+        for key in keys:
+            render, constant, child_names = _compile(data[key])
+            base[key] = constant
+            if render is not None:
+                slots.append((key, render))
+                names |= child_names
+        filled = tuple(slots)
+
+        # every render builds its own containers, so results can be modified
+        # freely; only the scalar leaves are copied over from `base`
+        def render_container(values: Mapping[str, Any]) -> Any:
+            rendered = base.copy()
+            for key, render in filled:
+                rendered[key] = render(values)
+            return rendered
+
+        return render_container, None, names
+    return None, data, frozenset()
+
+
+class CompiledTemplate:
+    """
+    A nested structure of strings with `{placeholder}` markers (an
+    `ApiDetails` template), parsed once into literal and placeholder segments
+    so rendering it only pays for the substitutions.
+    """
+
+    __slots__ = ("placeholders", "_render", "_constant")
+
+    def __init__(self, data: Any) -> None:
+        self._render, self._constant, names = _compile(data)
+        self.placeholders: FrozenSet[str] = names
+
+    def render(self, values: Mapping[str, Any]) -> Any:
+        """
+        Fills the placeholders in. A string that is a single placeholder
+        becomes the value itself; within text values are formatted as by
+        str.format, `{{` and `}}` included. Placeholders without a value are
+        left in place.
+        """
+        if self._render is None:
+            return self._constant
+        return self._render(values)
+
+
+_compiled: "OrderedDict[bytes, CompiledTemplate]" = OrderedDict()
+
+
+def compile_template(data: Any) -> CompiledTemplate:
+    """Compiles a template, or returns its cached compiled form."""
+    key = hashlib.blake2b(
+        json.dumps(data, default=str).encode(), digest_size=16
+    ).digest()
+    compiled: Optional[CompiledTemplate] = _compiled.get(key)
+    if compiled is None:
+        compiled = CompiledTemplate(data)
+        _compiled[key] = compiled
+        if len(_compiled) > _CACHE_SIZE:
+            _compiled.popitem(last=False)
+    else:
+        _compiled.move_to_end(key)
+    return compiled
+
+
+def format_recursively(data: Any, format_with: Dict[str, Any]) -> Any:
+    """Fills the placeholders of a nested structure in (see `CompiledTemplate`)."""
+    return compile_template(data).render(format_with)
+
+
+def template_placeholders(data: Any) -> Set[str]:
+    """
+    Collects the names of every `{placeholder}` in a nested structure. For
+    `{item[id]}` or `{item.id}` that is the variable, `item`.
+    """
+    return set(compile_template(data).placeholders)
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import statistics
+import time
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from app.core.config import settings
+from app.models.workflow import BatchWorkflowRequest, WorkflowRequest
+from app.services.agents.workflow_agent import StreamEvent, iter_workflow_events
+from app.services.llm_limiter import llm_limiter
+from app.services.run_registry import RUNS_ABANDONED
+
+
+# Marks the end of one workflow's events on the shared queue.
+_DONE = object()
+
+
+async def run_workflow_batch(
+    request: BatchWorkflowRequest,
+    heartbeat_seconds: Optional[float] = None,
+) -> AsyncGenerator[Optional[Dict[str, Any]], None]:
+    """
+    Runs the workflows of a batch concurrently and multiplexes their events.
+
+    At most `max_parallelism` workflows run at once and together they draw
+    from the batch share of the LLM budget. Every event is tagged with the
+    `workflow_id` (the workflow's position in the batch) it belongs to, and a
+    `batch_summary` event with per-workflow latencies closes the stream.
+
+    With `heartbeat_seconds`, None is yielded whenever no workflow emitted an
+    event for that long, so the caller can keep its connection alive.
+    """
+    parallelism = request.max_parallelism or settings.BATCH_MAX_PARALLELISM
+    semaphore = asyncio.Semaphore(parallelism)
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+    batch_started = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+
+    async def run_one(workflow_id: str, workflow: WorkflowRequest) -> None:
+        submitted = started = time.perf_counter()
+        result: Dict[str, Any] = {"workflow_id": workflow_id, "status": "completed"}
+        try:
+            async with semaphore:
+                started = time.perf_counter()
+                async with aclosing(iter_workflow_events(workflow)) as events:
+                    async for event in events:
+                        if event["event"] == "error":
+                            result["status"] = "failed"
+                        await queue.put(_tag(event, workflow_id))
+        except Exception as e:
+            logging.error(f"Batch workflow {workflow_id} failed: {e}", exc_info=True)
+            result["status"] = "failed"
+        finally:
+            finished = time.perf_counter()
+            result["queued_ms"] = round((started - submitted) * 1000, 1)
+            result["latency_ms"] = round((finished - started) * 1000, 1)
+            results.append(result)
+            await queue.put(_DONE)
+
+    with llm_limiter.batch():
+        tasks = [
+            asyncio.create_task(run_one(str(index), workflow))
+            for index, workflow in enumerate(request.workflows)
+        ]
+
+    remaining = len(tasks)
+    try:
+        while remaining:
+            try:
+                async with asyncio.timeout(heartbeat_seconds):
+                    item = await queue.get()
+            except TimeoutError:
+                yield None
+                continue
+            if item is _DONE:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        # the client disconnected: the unfinished workflows are cancelled
+        if remaining:
+            RUNS_ABANDONED.inc(remaining)
+        for task in tasks:
+            task.cancel()
+
+    yield {
+        "event": "batch_summary",
+        "data": _summarize(results, time.perf_counter() - batch_started),
+    }
+
+
+def _tag(event: StreamEvent, workflow_id: str) -> Dict[str, Any]:
+    return {"event": event["event"], "workflow_id": workflow_id, "data": event["data"]}
+
+
+def _summarize(results: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    latencies = sorted(result["latency_ms"] for result in results)
+    percentiles = (
+        statistics.quantiles(latencies, n=100, method="inclusive")
+        if len(latencies) > 1
+        else latencies * 99
+    )
+    return {
+        "total": len(results),
+        "completed": sum(result["status"] == "completed" for result in results),
+        "failed": sum(result["status"] == "failed" for result in results),
+        "wall_time_ms": round(wall_seconds * 1000, 1),
+        "latency_ms": {
+            "p50": round(percentiles[49], 1) if percentiles else None,
+            "p95": round(percentiles[94], 1) if percentiles else None,
+            "max": latencies[-1] if latencies else None,
+        },
+        "workflows": sorted(results, key=lambda result: int(result["workflow_id"])),
+    }
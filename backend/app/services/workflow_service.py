@@ -1,6 +1,29 @@
-from typing import AsyncGenerator, Dict, Any
-from app.models.workflow import WorkflowRequest, WorkflowResponse
-from app.services.agents.workflow_agent import stream_workflow_graph
+from typing import AsyncGenerator, Dict, Any, List, Optional, Tuple
+from app.core.config import settings
+from app.models.workflow import (
+    ApiOperation,
+    BatchResponseFormat,
+    BatchWorkflowRequest,
+    OpenApiRegistration,
+    Recipe,
+    RunInfo,
+    RunSubmission,
+    WorkflowRequest,
+    WorkflowResponse,
+)
+from app.services.agents.workflow_agent import (
+    restore_state,
+    start_workflow_run,
+    stream_run_events,
+)
+from app.services.body_store import body_store
+from app.services.event_stream import SSE_HEARTBEAT, dumps, format_sse_event
+from app.services.openapi_index import openapi_index
+from app.services.recipes import recipe_store, replay_recipe
+from app.services.run_queue import run_queue
+from app.services.run_registry import ActiveRun, run_registry
+from app.services.run_store import run_store
+from app.services.workflow_batch import run_workflow_batch
 
 
 class WorkflowService:
@@ -9,24 +32,258 @@ class WorkflowService:
     @staticmethod
     async def execute_workflow_stream(
         request: WorkflowRequest,
-    ) -> AsyncGenerator[str, None]:
+    ) -> Tuple[str, AsyncGenerator[str, None]]:
         """
-        Executes a workflow and streams the results back.
+        Starts a workflow run in the background and streams its results back.
+        The run is cancelled if the client disconnects and does not re-attach
+        (see `RUN_CANCEL_ON_DISCONNECT`).
 
         Args:
             request: WorkflowRequest containing the user's prompt
 
         Returns:
-            An async generator yielding Server-Sent Events.
+            The run id, and an async generator yielding Server-Sent Events.
         """
         try:
-            # The service now calls the streaming agent and returns the generator
-            return stream_workflow_graph(request)
+            run = start_workflow_run(request)
+            return run.run_id, stream_run_events(run)
         except Exception as e:
             # In a real app, you'd have more robust logging/error handling here
             print(f"Error executing workflow stream: {str(e)}")
             raise
+
+    @staticmethod
+    async def submit_run(request: WorkflowRequest) -> RunSubmission:
+        """
+        Queues a workflow run for the worker pool and returns without waiting
+        for it to start.
+
+        Args:
+            request: WorkflowRequest containing the user's prompt
+
+        Returns:
+            The run id and the run's position in the queue
+
+        Raises:
+            RunQueueFull: If the run queue is full
+        """
+        run_id, position = await run_queue.submit(request)
+        return RunSubmission(run_id=run_id, queue_position=position)
+
+    @staticmethod
+    async def cancel_run(run_id: str) -> bool:
+        """
+        Cancel a queued run, or a run executing in this process.
+
+        Args:
+            run_id: The run id returned when the run was started
+
+        Returns:
+            False if the run is neither queued nor executing here
+        """
+        return await run_queue.cancel(run_id)
+
+    @staticmethod
+    def attach_to_run(run_id: str, after: int = 0) -> Optional[AsyncGenerator[str, None]]:
+        """
+        Re-attach to a run executing (or recently finished) in this process.
+
+        Args:
+            run_id: The run id returned when the run was started
+            after: Index of the first event to send; earlier ones were already seen
+
+        Returns:
+            An async generator yielding Server-Sent Events, or None if the run
+            is not known to this process
+        """
+        run = run_registry.get(run_id)
+        if run is None:
+            return None
+        return stream_run_events(run, after)
+
+    @staticmethod
+    async def get_run(run_id: str) -> Optional[RunInfo]:
+        """
+        Look up the last checkpoint of a run.
+
+        Args:
+            run_id: The run id returned when the run was started
+
+        Returns:
+            The run's status and progress, or None if it is unknown
+        """
+        checkpoint = await run_store.load(run_id)
+        if checkpoint is None:
+            return None
+        state = checkpoint["state"]
+        return RunInfo(
+            run_id=run_id,
+            status=checkpoint["status"],
+            request=checkpoint["request"],
+            plan=state["plan"],
+            completed_steps=sorted(state["completed_steps"]),
+            extracted_data=state["extracted_data"],
+            error=state["error"],
+            active=run_registry.is_running(run_id),
+            queue_position=run_queue.position(run_id),
+            created_at=checkpoint["created_at"],
+            updated_at=checkpoint["updated_at"],
+        )
+
+    @staticmethod
+    async def resume_run(run_id: str) -> Optional[ActiveRun]:
+        """
+        Resume an interrupted, failed or cancelled run from its last checkpoint; the
+        steps that already succeeded are not run again.
+
+        Args:
+            run_id: The run id returned when the run was started
+
+        Returns:
+            The resumed run, or None if it is unknown
+
+        Raises:
+            RunAlreadyActive: If the run is already running or being resumed
+        """
+        # reserved before the checkpoint is loaded, so concurrent resumes of
+        # the same run cannot both start it
+        run_registry.reserve(run_id)
+        try:
+            checkpoint = await run_store.load(run_id)
+        except BaseException:
+            run_registry.release(run_id)
+            raise
+        if checkpoint is None:
+            run_registry.release(run_id)
+            return None
+        return start_workflow_run(
+            checkpoint["request"], restore_state(checkpoint["state"])
+        )
     
+    @staticmethod
+    async def execute_workflow_batch(
+        request: BatchWorkflowRequest,
+    ) -> AsyncGenerator[str, None]:
+        """
+        Executes a batch of workflows concurrently and streams their events
+        back on a single stream.
+
+        Args:
+            request: BatchWorkflowRequest containing the workflows to run
+
+        Returns:
+            An async generator yielding Server-Sent Events or NDJSON lines,
+            depending on the requested format. Server-Sent Events are numbered
+            and interleaved with heartbeats while the workflows are silent.
+        """
+        if request.format == BatchResponseFormat.NDJSON:
+            async def ndjson_lines() -> AsyncGenerator[str, None]:
+                async for event in run_workflow_batch(request):
+                    yield dumps(event) + "\n"
+
+            return ndjson_lines()
+
+        async def sse_events() -> AsyncGenerator[str, None]:
+            event_id = 0
+            async for event in run_workflow_batch(
+                request, settings.SSE_HEARTBEAT_SECONDS or None
+            ):
+                if event is None:
+                    yield SSE_HEARTBEAT
+                    continue
+                event_id += 1
+                yield format_sse_event(event, event_id)
+
+        return sse_events()
+
+    @staticmethod
+    def get_response_body(body_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Look up an API response body spilled to the body store.
+
+        Args:
+            body_id: The `body_ref` of the response data
+
+        Returns:
+            The body's file path and content type, or None if it is unknown
+            or expired
+        """
+        path = body_store.path(body_id)
+        if path is None:
+            return None
+        return path, body_store.content_type(body_id)
+
+    @staticmethod
+    async def get_recipe(recipe_id: str) -> Optional[Recipe]:
+        """
+        Look up a compiled recipe.
+
+        Args:
+            recipe_id: The id reported by the recipe_compiled event
+
+        Returns:
+            The recipe, or None if it does not exist
+        """
+        return await recipe_store.get(recipe_id)
+
+    @staticmethod
+    async def replay_recipe(
+        recipe: Recipe, parameters: Dict[str, Any]
+    ) -> WorkflowResponse:
+        """
+        Replay a compiled recipe without any LLM calls.
+
+        Args:
+            recipe: The recipe to replay
+            parameters: Values overriding the recipe's default parameters
+
+        Returns:
+            The results of every executed step
+        """
+        return await replay_recipe(recipe, parameters)
+
+    @staticmethod
+    async def register_openapi_spec(
+        workspace: str, spec_text: str, base_url: Optional[str] = None
+    ) -> OpenApiRegistration:
+        """
+        Register a workspace's OpenAPI spec, replacing its previous one.
+
+        Args:
+            workspace: The workspace workflows name to be grounded in the spec
+            spec_text: The OpenAPI 3 or Swagger 2 document, as JSON or YAML
+            base_url: Overrides the server URL the spec declares
+
+        Returns:
+            The workspace, its number of operations and the spec's version
+
+        Raises:
+            SpecError: If the document is not a usable spec
+        """
+        return await openapi_index.register(workspace, spec_text, base_url)
+
+    @staticmethod
+    async def has_openapi_spec(workspace: str) -> bool:
+        """Whether the workspace has a registered OpenAPI spec."""
+        return await openapi_index.get(workspace) is not None
+
+    @staticmethod
+    async def search_operations(
+        workspace: str, query: str, k: Optional[int] = None
+    ) -> List[ApiOperation]:
+        """
+        Look up the operations of a workspace's spec the LLM would be shown.
+
+        Args:
+            workspace: The workspace the spec is registered under
+            query: A prompt or step description
+            k: How many operations to return; defaults to OPENAPI_TOP_K
+
+        Returns:
+            The best matching operations, best first
+        """
+        return await openapi_index.search(workspace, query, k)
+
     @staticmethod
     async def validate_workflow_request(prompt: str) -> Dict[str, Any]:
         """
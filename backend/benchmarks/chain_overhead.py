@@ -0,0 +1,48 @@
+"""
+Microbenchmark of the per-step cost of obtaining the LLM chains.
+
+Compares rebuilding the prompt template, structured-output model and chain
+on every call (what the nodes used to do) with looking them up in the chain
+registry. No LLM is called; only chain construction is measured.
+
+Usage:
+    python -m benchmarks.chain_overhead [--iterations 2000]
+"""
+import argparse
+import os
+import timeit
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from langchain_core.prompts import ChatPromptTemplate  # noqa: E402
+
+from app.services.agents.chains import CHAIN_SPECS, chain_registry  # noqa: E402
+
+
+def build_per_call(name: str) -> None:
+    spec = CHAIN_SPECS[name]
+    prompt_template = ChatPromptTemplate.from_messages(spec.messages())
+    llm = chain_registry.llm()
+    if spec.schema is not None:
+        prompt_template | llm.with_structured_output(spec.schema)
+    else:
+        prompt_template | llm
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    chain_registry.build_all()
+    print(f"{'chain':<14}{'per call (us)':>16}{'registry (us)':>16}{'speedup':>10}")
+    for name in CHAIN_SPECS:
+        before = timeit.timeit(lambda: build_per_call(name), number=args.iterations)
+        after = timeit.timeit(lambda: chain_registry.get(name), number=args.iterations)
+        before_us = before / args.iterations * 1e6
+        after_us = after / args.iterations * 1e6
+        print(f"{name:<14}{before_us:>16.1f}{after_us:>16.2f}{before_us / after_us:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
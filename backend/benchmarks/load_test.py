@@ -0,0 +1,187 @@
+"""
+Offline load test of the workflow backend.
+
+Runs the FastAPI app in-process with a scripted chat model in place of
+Gemini and a local stub target API, then executes workflow scenarios at
+increasing concurrency. Reports p50/p95/p99 time to first SSE event, total
+workflow time, throughput, and SSE bytes and memory per workflow, and saves
+the results as JSON so runs can be compared for regressions.
+
+Usage:
+    python -m benchmarks.load_test --concurrency 1,10,50 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import httpx  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services.agents.chains import chain_registry  # noqa: E402
+from benchmarks.stubs import (  # noqa: E402
+    BackgroundServer,
+    ScriptedChatModel,
+    create_stub_api,
+    scenario_plan,
+)
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": round(cuts[49], 2), "p95": round(cuts[94], 2), "p99": round(cuts[98], 2)}
+
+
+async def run_workflow(client: httpx.AsyncClient, prompt: str) -> Dict[str, Any]:
+    """Runs one workflow over SSE and times its first event and completion."""
+    started = time.perf_counter()
+    first_event_ms = None
+    events = 0
+    sse_bytes = 0
+    failed = False
+    async with client.stream(
+        "POST", "/api/v1/workflow/execute-stream", json={"prompt": prompt}
+    ) as response:
+        if response.status_code != 200:
+            failed = True
+        async for line in response.aiter_lines():
+            sse_bytes += len(line.encode()) + 1
+            if not line.startswith("data: "):
+                continue
+            if first_event_ms is None:
+                first_event_ms = (time.perf_counter() - started) * 1000
+            events += 1
+            if json.loads(line[6:]).get("event") == "error":
+                failed = True
+    return {
+        "first_event_ms": first_event_ms,
+        "total_ms": (time.perf_counter() - started) * 1000,
+        "events": events,
+        "sse_bytes": sse_bytes,
+        "failed": failed,
+    }
+
+
+async def run_level(
+    app_url: str, scenario: str, concurrency: int, workflows: int, trace_memory: bool
+) -> Dict[str, Any]:
+    """Runs `workflows` workflows with at most `concurrency` in flight."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=None) as client:
+
+        async def bounded(index: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await run_workflow(
+                    client, f"Run the {scenario} benchmark scenario, workflow {index}"
+                )
+
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(bounded(index) for index in range(workflows)))
+        wall_seconds = time.perf_counter() - started
+        peak_bytes = None
+        if trace_memory:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "workflows": workflows,
+        "errors": sum(result["failed"] for result in results),
+        "time_to_first_event_ms": _percentiles(
+            sorted(r["first_event_ms"] for r in results if r["first_event_ms"] is not None)
+        ),
+        "total_ms": _percentiles(sorted(result["total_ms"] for result in results)),
+        "throughput_per_s": round(workflows / wall_seconds, 2),
+        "sse_kb_per_workflow": round(
+            statistics.mean(result["sse_bytes"] for result in results) / 1024, 1
+        ),
+        "memory_per_workflow_kb": (
+            round(peak_bytes / min(concurrency, workflows) / 1024, 1)
+            if peak_bytes is not None
+            else None
+        ),
+    }
+
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.PLAN_CACHE_ENABLED = args.plan_cache
+    settings.SIMILAR_PLANS_ENABLED = args.plan_cache
+
+    levels = []
+    async with BackgroundServer(create_stub_api()) as stub, BackgroundServer(app) as server:
+        for scenario in args.scenarios:
+            plan = scenario_plan(scenario, stub.url, args.api_latency_ms, args.payload_bytes)
+            model = ScriptedChatModel(plan=plan, latency_ms=args.llm_latency_ms)
+            chain_registry.use_llm_factory(lambda _model: model)
+            for concurrency in args.concurrency:
+                workflows = max(concurrency, args.workflows_per_level)
+                level = await run_level(
+                    server.url, scenario, concurrency, workflows, args.trace_memory
+                )
+                levels.append(level)
+                print(
+                    f"{scenario:<6} c={concurrency:<4} "
+                    f"ttfe p50={level['time_to_first_event_ms']['p50']}ms "
+                    f"p99={level['time_to_first_event_ms']['p99']}ms | "
+                    f"total p50={level['total_ms']['p50']}ms p99={level['total_ms']['p99']}ms | "
+                    f"{level['throughput_per_s']}/s errors={level['errors']} "
+                    f"sse/wf={level['sse_kb_per_workflow']}KB "
+                    f"mem/wf={level['memory_per_workflow_kb']}KB"
+                )
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "scenarios": args.scenarios,
+            "concurrency": args.concurrency,
+            "workflows_per_level": args.workflows_per_level,
+            "llm_latency_ms": args.llm_latency_ms,
+            "api_latency_ms": args.api_latency_ms,
+            "payload_bytes": args.payload_bytes,
+            "plan_cache": args.plan_cache,
+        },
+        "levels": levels,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test of the workflow backend.")
+    parser.add_argument("--scenarios", type=lambda v: v.split(","), default=["chain", "wide"])
+    parser.add_argument("--concurrency", type=lambda v: [int(c) for c in v.split(",")], default=[1, 10, 50, 100])
+    parser.add_argument("--workflows-per-level", type=int, default=100)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--api-latency-ms", type=float, default=50.0)
+    parser.add_argument("--payload-bytes", type=int, default=2048)
+    parser.add_argument("--plan-cache", action="store_true", help="Keep the plan cache and similar plan reuse enabled.")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false")
+    parser.add_argument("--output", default="benchmark-results.json")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = asyncio.run(main(arguments))
+    with open(arguments.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {arguments.output}")
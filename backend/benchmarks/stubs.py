@@ -0,0 +1,142 @@
+"""
+Stand-ins for the external services a workflow talks to: a scripted chat
+model in place of Gemini and a stub target API with configurable latency and
+payload size.
+"""
+import asyncio
+import json
+import re
+import socket
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from app.models.workflow import ApiDetails, Plan, PlanStep
+
+
+STUB_TOKEN = "stub-token"
+
+# Step descriptions carry the call to make, e.g. "GET /items (...)"
+_STEP_CALL = re.compile(r"Current Step Description: (GET|POST|PUT|PATCH|DELETE) (\S+)")
+
+
+def scenario_plan(scenario: str, base_url: str, latency_ms: float, payload_bytes: int) -> Plan:
+    """Builds the plan a scenario's workflows execute against the stub API."""
+    query = f"latency_ms={latency_ms}&size={payload_bytes}"
+    if scenario == "chain":
+        return Plan(
+            steps=[
+                PlanStep(description=f"POST {base_url}/login?{query} to log in", action_type="api_call", consumes=[], produces=["auth_token"]),
+                PlanStep(description="Extract the auth token", action_type="data_extraction", produces=["auth_token"]),
+                PlanStep(description=f"GET {base_url}/profile?{query} using auth_token", action_type="api_call", consumes=["auth_token"]),
+                PlanStep(description=f"GET {base_url}/orders?{query} using auth_token", action_type="api_call", consumes=["auth_token"]),
+            ]
+        )
+    if scenario == "wide":
+        return Plan(
+            steps=[
+                PlanStep(description=f"GET {base_url}/{resource}?{query}", action_type="api_call", consumes=[])
+                for resource in ("users/1", "users/2", "catalog", "config")
+            ]
+        )
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    A chat model that answers every chain of the workflow agent from a script.
+
+    Planning returns the scenario's plan, API-call generation reads the call
+    out of the step description and extraction returns the stub token. Each
+    call waits `latency_ms` to stand in for model latency.
+    """
+
+    plan: Plan
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _respond(self, messages: List[BaseMessage], schema: Optional[type]) -> Any:
+        text = "\n".join(str(message.content) for message in messages)
+        if schema is Plan:
+            return self.plan
+        if schema is ApiDetails:
+            match = _STEP_CALL.search(text)
+            if match is None:
+                raise ValueError("Step description does not name a call")
+            return ApiDetails(
+                url=match.group(2),
+                method=match.group(1),
+                headers={"Authorization": "Bearer {auth_token}"},
+            )
+        return "```json\n" + json.dumps({"data": {"auth_token": STUB_TOKEN}}) + "\n```"
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        content = self._respond(messages, None)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._generate(messages, stop, run_manager, **kwargs)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> RunnableLambda:
+        async def respond(prompt_value: Any) -> Any:
+            await asyncio.sleep(self.latency_ms / 1000)
+            return self._respond(prompt_value.to_messages(), schema)
+
+        return RunnableLambda(lambda prompt_value: self._respond(prompt_value.to_messages(), schema), afunc=respond)
+
+
+@lru_cache(maxsize=32)
+def _payload(size: int) -> Dict[str, Any]:
+    items = []
+    while len(json.dumps(items)) < size:
+        items.append({"id": len(items), "name": f"item-{len(items):06d}"})
+    return {"token": STUB_TOKEN, "id": 1, "items": items}
+
+
+def create_stub_api() -> FastAPI:
+    """A target API answering any path after `latency_ms` with a ~`size` byte body."""
+    stub = FastAPI()
+
+    @stub.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+    async def respond(path: str, latency_ms: float = 0, size: int = 256):
+        await asyncio.sleep(latency_ms / 1000)
+        return _payload(size)
+
+    return stub
+
+
+class BackgroundServer:
+    """Serves an ASGI app with uvicorn on a free local port inside the running loop."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self.url = ""
+        self._server: Optional[uvicorn.Server] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "BackgroundServer":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(self.app, log_level="warning", access_log=False, backlog=4096)
+        )
+        self._task = asyncio.create_task(self._server.serve(sockets=[sock]))
+        while not self._server.started:
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._server.should_exit = True
+        await self._task
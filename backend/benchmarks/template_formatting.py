@@ -0,0 +1,94 @@
+"""
+Microbenchmark of filling the placeholders of API call templates.
+
+Compares the previous implementation, which walked the template and called
+str.format on every string for every step, with the compiled templates of
+app.services.templates: rendering through the cache (a single step) and
+rendering a template compiled once (every element of a for_each step).
+
+Usage:
+    python -m benchmarks.template_formatting [--items 500] [--iterations 200]
+"""
+import argparse
+import os
+import timeit
+from typing import Any, Dict
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from app.services.templates import compile_template, format_recursively  # noqa: E402
+
+
+def legacy_format_recursively(data: Any, format_with: Dict[str, Any]) -> Any:
+    """The implementation compiled templates replaced."""
+    if isinstance(data, str):
+        try:
+            return data.format(**format_with)
+        except (KeyError, IndexError, ValueError):
+            return data
+    if isinstance(data, dict):
+        return {k: legacy_format_recursively(v, format_with) for k, v in data.items()}
+    if isinstance(data, list):
+        return [legacy_format_recursively(i, format_with) for i in data]
+    return data
+
+
+def nested_template(items: int) -> Dict[str, Any]:
+    """An ApiDetails-like template whose body holds `items` nested records."""
+    return {
+        "url": "https://api.example.com/accounts/{account_id}/orders/{item[id]}",
+        "method": "POST",
+        "headers": {
+            "Authorization": "Bearer {auth_token}",
+            "Content-Type": "application/json",
+        },
+        "body": {
+            "customer": "{customer_id}",
+            "lines": [
+                {
+                    "sku": f"sku-{index}",
+                    "quantity": index % 7,
+                    "note": "Shipped to {customer_name} for order {item[id]}",
+                    "tags": ["bulk", "priority", "{region}"],
+                    "meta": {"source": "workflow", "position": index},
+                }
+                for index in range(items)
+            ],
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    template = nested_template(args.items)
+    values = {
+        "account_id": 42,
+        "auth_token": "token-123",
+        "customer_id": "c-9",
+        "customer_name": "Ada",
+        "region": "eu-west",
+        "item": {"id": 7},
+    }
+    compiled = compile_template(template)
+
+    runs = {
+        "str.format walk": lambda: legacy_format_recursively(template, values),
+        "compiled (cached)": lambda: format_recursively(template, values),
+        "compiled (reused)": lambda: compiled.render(values),
+    }
+    print(f"{args.items} body items, {args.iterations} renders")
+    print(f"{'implementation':<20}{'per render (us)':>18}{'speedup':>10}")
+    baseline = None
+    for name, run in runs.items():
+        seconds = timeit.timeit(run, number=args.iterations)
+        per_render_us = seconds / args.iterations * 1e6
+        baseline = baseline or per_render_us
+        print(f"{name:<20}{per_render_us:>18.1f}{baseline / per_render_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
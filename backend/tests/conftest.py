@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+import pytest
+
+# The settings are read when the app modules are imported: give them a key and
+# keep the stores they open out of the working directory.
+_store_dir = tempfile.mkdtemp(prefix="api-flow-tests-")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("RUN_CHECKPOINT_SQLITE_PATH", os.path.join(_store_dir, "runs.db"))
+os.environ.setdefault("BODY_STORE_DIR", os.path.join(_store_dir, "bodies"))
+os.environ.setdefault("OPENAPI_INDEX_DB_PATH", os.path.join(_store_dir, "openapi_index.db"))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
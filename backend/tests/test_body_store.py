@@ -0,0 +1,57 @@
+import os
+import time
+
+import httpx
+import pytest
+
+from app.services.body_store import BodyStore, is_body_ref
+
+
+BODY_ID = "ab" * 32
+
+
+def test_only_complete_references_are_body_refs():
+    ref = {"body_ref": BODY_ID, "content_type": "application/json", "size": 10, "preview": ""}
+    assert is_body_ref(ref)
+    # API data that happens to have a body_ref field
+    assert not is_body_ref({"body_ref": "attachment-1", "name": "report.pdf"})
+    assert not is_body_ref({**ref, "body_ref": "attachment-1"})
+    assert not is_body_ref({**ref, "owner": "ada"})
+    assert not is_body_ref([ref])
+
+
+@pytest.mark.anyio
+async def test_resolve_leaves_colliding_data_alone(tmp_path):
+    store = BodyStore(str(tmp_path), max_bytes=1024, ttl_seconds=60)
+    data = {"body_ref": "attachment-1"}
+    assert await store.resolve(data) is data
+
+
+@pytest.mark.anyio
+async def test_spilled_body_is_referenced_and_resolved(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.RESPONSE_SPILL_THRESHOLD_BYTES", 16)
+    store = BodyStore(str(tmp_path), max_bytes=1 << 20, ttl_seconds=60)
+    body = b'{"items": [' + b",".join(b"%d" % i for i in range(100)) + b"]}"
+    response = httpx.Response(
+        200,
+        headers={"content-type": "application/json"},
+        stream=httpx.ByteStream(body),
+        request=httpx.Request("GET", "https://api.example.com/items"),
+    )
+
+    ref = (await store.read_response(response)).extensions["body_ref"]
+    assert is_body_ref(ref) and ref["size"] == len(body)
+    assert (await store.resolve(ref))["items"][-1] == 99
+
+
+def test_prune_removes_stale_part_files(tmp_path):
+    store = BodyStore(str(tmp_path), max_bytes=1 << 20, ttl_seconds=60)
+    stale = tmp_path / "tmpstale.part"
+    fresh = tmp_path / "tmpfresh.part"
+    stale.write_bytes(b"partial")
+    fresh.write_bytes(b"partial")
+    two_hours_ago = time.time() - 2 * 60 * 60
+    os.utime(stale, (two_hours_ago, two_hours_ago))
+
+    store._prune()
+    assert sorted(os.listdir(tmp_path)) == ["tmpfresh.part"]
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.workflow import ActionType, Plan, PlanStep, WorkflowRequest
+from app.services.agents import workflow_agent
+from app.services.agents.workflow_agent import extract_data_node, initial_state
+from app.services.compaction import _dumps, compact_response, count_tokens
+from app.services.instrumentation import COMPACTION_TOKENS_SAVED
+
+
+def _orders(count):
+    return {
+        "orders": [
+            {
+                "id": index,
+                "status": "shipped" if index % 7 else "returned",
+                "note": f"order {index} " + "lorem ipsum dolor sit amet " * 20,
+                "items": [{"sku": f"SKU-{index}-{item}", "qty": item} for item in range(5)],
+            }
+            for index in range(count)
+        ],
+        "next_cursor": "abc123",
+    }
+
+
+def test_a_large_list_is_compacted_under_the_budget():
+    response = _orders(500)
+    budget = settings.EXTRACT_RESPONSE_TOKEN_BUDGET
+    compaction = compact_response(response, budget, "Get the items of the returned orders")
+
+    assert compaction.original_tokens > budget
+    assert compaction.tokens <= budget
+    assert count_tokens(_dumps(compaction.data)) == compaction.tokens
+    assert compaction.saved_tokens == compaction.original_tokens - compaction.tokens
+
+    orders = compaction.data["orders"]
+    summary = orders[-1]
+    assert summary["_omitted_items"] == 500 - (len(orders) - 1)
+    assert summary["_item_schema"] == {
+        "id": "number",
+        "status": "string",
+        "note": "string",
+        "items": [{"sku": "string", "qty": "number"}],
+    }
+    # samples mentioning the hint are kept over the first elements
+    assert any(order["status"] == "returned" for order in orders[:-1])
+    assert compaction.data["next_cursor"] == "abc123"
+
+
+def test_a_budget_of_zero_disables_compaction():
+    response = _orders(500)
+    compaction = compact_response(response, 0)
+    assert compaction.data is response
+    assert compaction.saved_tokens == 0
+
+
+def test_a_response_under_the_budget_is_left_alone():
+    response = _orders(2)
+    compaction = compact_response(response, 100_000)
+    assert compaction.data is response
+    assert compaction.tokens == compaction.original_tokens
+
+
+def _state(response):
+    plan = Plan(
+        steps=[
+            PlanStep(description="List my orders", action_type=ActionType.API_CALL),
+            PlanStep(description="Extract the order ids", action_type=ActionType.DATA_EXTRACTION),
+            PlanStep(description="Get the returned orders", action_type=ActionType.API_CALL),
+        ]
+    )
+    return {
+        **initial_state(WorkflowRequest(prompt="List my orders and get the returned ones")),
+        "plan": plan,
+        "step_index": 1,
+        "request_history": [
+            {"step_index": 0, "api_details": {}, "response_data": response, "error": None}
+        ],
+    }
+
+
+@pytest.fixture
+def llm_inputs(monkeypatch):
+    inputs_seen = []
+
+    async def invoke(chain, inputs):
+        inputs_seen.append(inputs)
+        return SimpleNamespace(content='{"data": {"order_ids": [7]}}')
+
+    monkeypatch.setattr(workflow_agent.chain_registry, "get", lambda name: name)
+    monkeypatch.setattr(workflow_agent.llm_limiter, "invoke", invoke)
+    return inputs_seen
+
+
+@pytest.mark.anyio
+async def test_extraction_records_the_tokens_saved(llm_inputs):
+    saved_before = COMPACTION_TOKENS_SAVED.value(node="extract_data")
+    update = await extract_data_node(_state(_orders(500)))
+
+    [timing] = update["timings"]
+    assert timing["compaction_tokens_saved"] > 0
+    assert (
+        COMPACTION_TOKENS_SAVED.value(node="extract_data") - saved_before
+        == timing["compaction_tokens_saved"]
+    )
+    assert "_omitted_items" in _dumps(llm_inputs[0]["api_response"])
+
+
+@pytest.mark.anyio
+async def test_extraction_without_a_budget_shows_the_whole_response(llm_inputs, monkeypatch):
+    monkeypatch.setattr(settings, "EXTRACT_RESPONSE_TOKEN_BUDGET", 0)
+    response = _orders(500)
+    update = await extract_data_node(_state(response))
+
+    assert update["timings"][0]["compaction_tokens_saved"] == 0
+    assert llm_inputs[0]["api_response"] == response
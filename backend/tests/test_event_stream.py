@@ -0,0 +1,62 @@
+import json
+
+from app.services.event_stream import dumps, format_sse_event, json_patch
+
+
+def _apply(document, operations):
+    """A minimal JSON Patch applier, as the frontend's applyPatch."""
+    for operation in operations:
+        tokens = [
+            token.replace("~1", "/").replace("~0", "~")
+            for token in operation["path"].split("/")[1:]
+        ]
+        if not tokens:
+            document = operation["value"]
+            continue
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token) if isinstance(parent, list) else token]
+        key = tokens[-1]
+        if operation["op"] == "remove":
+            del parent[key]
+        elif isinstance(parent, list) and key == "-":
+            parent.append(operation["value"])
+        else:
+            parent[int(key) if isinstance(parent, list) else key] = operation["value"]
+    return document
+
+
+def test_appended_items_are_added_at_the_end():
+    old = {"users": [{"id": 1}]}
+    new = {"users": [{"id": 1}, {"id": 2}, {"id": 3}]}
+    assert json_patch(old, new) == [
+        {"op": "add", "path": "/users/-", "value": {"id": 2}},
+        {"op": "add", "path": "/users/-", "value": {"id": 3}},
+    ]
+
+
+def test_objects_are_diffed_key_by_key():
+    old = {"token": "a", "gone": 1, "nested": {"x": 1, "y": [1, 2]}}
+    new = {"token": "b", "nested": {"x": 1, "y": [2]}, "a/b~c": True}
+    operations = json_patch(old, new)
+    assert operations == [
+        {"op": "remove", "path": "/gone"},
+        {"op": "replace", "path": "/token", "value": "b"},
+        {"op": "replace", "path": "/nested/y", "value": [2]},
+        {"op": "add", "path": "/a~1b~0c", "value": True},
+    ]
+    assert _apply(json.loads(json.dumps(old)), operations) == new
+
+
+def test_unchanged_and_retyped_values():
+    assert json_patch({"a": [1, {"b": 2}]}, {"a": [1, {"b": 2}]}) == []
+    # 1 == True, but the client must still see the new type
+    assert json_patch({"a": 1}, {"a": True}) == [{"op": "replace", "path": "/a", "value": True}]
+    assert json_patch(None, {"a": 1}) == [{"op": "replace", "path": "", "value": {"a": 1}}]
+
+
+def test_sse_messages_carry_their_id():
+    event = {"event": "end", "data": {"detail": "é"}}
+    assert format_sse_event(event) == f"data: {dumps(event)}\n\n"
+    assert format_sse_event(event, 7) == f"id: 7\ndata: {dumps(event)}\n\n"
+    assert json.loads(dumps(event)) == event
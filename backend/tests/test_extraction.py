@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.models.workflow import ActionType, ExtractionRule, Plan, PlanStep, WorkflowRequest
+from app.services.agents import workflow_agent
+from app.services.agents.workflow_agent import extract_data_node, initial_state
+from app.services.extraction import apply_extraction_rules, compile_path
+
+
+RESPONSE = {
+    "data": {
+        "token": "abc",
+        "users": [
+            {"id": 1, "name": "Ada", "roles": ["admin"]},
+            {"id": 2, "name": "Bob", "roles": []},
+        ],
+        "weird.key": {"x": 1},
+    }
+}
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("$.data.token", ["abc"]),
+        ("data.token", ["abc"]),
+        ("$['data']['token']", ["abc"]),
+        ("$.data['weird.key'].x", [1]),
+        ("$.data.users[0].name", ["Ada"]),
+        ("$.data.users[-1].id", [2]),
+        ("data.users.1.name", ["Bob"]),
+        ("$.data.users[0].roles[0]", ["admin"]),
+    ],
+)
+def test_paths(path, expected):
+    assert compile_path(path).find(RESPONSE) == expected
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("$.data.users[*].id", [1, 2]),
+        ("$.data.users.*.name", ["Ada", "Bob"]),
+        ("$.data.users[*].roles[*]", ["admin"]),
+        ("$.data['weird.key'].*", [1]),
+    ],
+)
+def test_wildcards(path, expected):
+    compiled = compile_path(path)
+    assert compiled.is_multi
+    assert compiled.find(RESPONSE) == expected
+
+
+@pytest.mark.parametrize(
+    "path",
+    ["$.data.missing", "$.data.users[5].id", "$.data.token.length", "$.data.users.name", "$.nope[*]"],
+)
+def test_missing_keys_match_nothing(path):
+    assert compile_path(path).find(RESPONSE) == []
+
+
+@pytest.mark.parametrize(
+    "path",
+    ["$.data.users[?(@.id == 1)].name", "$..id", "$.data.users[0:1]", "$.data[token"],
+)
+def test_filters_and_other_unsupported_syntax_are_rejected(path):
+    with pytest.raises(ValueError):
+        compile_path(path)
+
+
+def test_apply_extraction_rules():
+    rules = [
+        ExtractionRule(variable="auth_token", path="$.data.token"),
+        ExtractionRule(variable="user_ids", path="$.data.users[*].id"),
+        ExtractionRule(variable="admin", path="$.data.users[?(@.roles)].name"),
+        ExtractionRule(variable="page", path="$.meta.page"),
+    ]
+    # the filter is skipped and the missing key left out
+    assert apply_extraction_rules(rules, RESPONSE) == {"auth_token": "abc", "user_ids": [1, 2]}
+
+
+def _state(rules):
+    plan = Plan(
+        steps=[
+            PlanStep(description="Log in", action_type=ActionType.API_CALL),
+            PlanStep(
+                description="Extract the token",
+                action_type=ActionType.DATA_EXTRACTION,
+                extraction_rules=rules,
+            ),
+            PlanStep(description="Get my profile", action_type=ActionType.API_CALL),
+        ]
+    )
+    return {
+        **initial_state(WorkflowRequest(prompt="Log in and get my profile")),
+        "plan": plan,
+        "step_index": 1,
+        "request_history": [
+            {"step_index": 0, "api_details": {}, "response_data": RESPONSE, "error": None}
+        ],
+    }
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = []
+
+    async def invoke(chain, inputs):
+        calls.append(inputs)
+        return SimpleNamespace(content='{"data": {"auth_token": "from-llm"}}')
+
+    monkeypatch.setattr(workflow_agent.chain_registry, "get", lambda name: name)
+    monkeypatch.setattr(workflow_agent.llm_limiter, "invoke", invoke)
+    return calls
+
+
+@pytest.mark.anyio
+async def test_matching_rules_skip_the_llm(llm_calls):
+    update = await extract_data_node(
+        _state([ExtractionRule(variable="auth_token", path="$.data.token")])
+    )
+    assert update["extracted_data"] == {"auth_token": "abc"}
+    assert llm_calls == []
+
+
+@pytest.mark.parametrize(
+    "rules",
+    [
+        None,
+        [ExtractionRule(variable="auth_token", path="$.data.session.token")],
+        [ExtractionRule(variable="auth_token", path="$.data.users[?(@.id)].token")],
+    ],
+)
+@pytest.mark.anyio
+async def test_rules_matching_nothing_fall_back_to_the_llm(llm_calls, rules):
+    update = await extract_data_node(_state(rules))
+    assert update["extracted_data"] == {"auth_token": "from-llm"}
+    assert len(llm_calls) == 1
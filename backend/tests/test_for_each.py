@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.models.workflow import ActionType, ApiDetails, Plan, PlanStep, WorkflowRequest
+from app.services import http_client
+from app.services.agents import workflow_agent
+from app.services.agents.workflow_agent import for_each_node, initial_state
+from app.services.http_cache import HttpCache
+
+
+URL = "https://api.example.com/users/{item}"
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    """Answers every request with a cacheable response after 20ms."""
+    sent = []
+
+    async def request(method, url, **kwargs):
+        sent.append(url)
+        await asyncio.sleep(0.02)
+        return httpx.Response(
+            200,
+            headers={"Cache-Control": "max-age=60"},
+            content=b'{"ok": true}',
+            request=httpx.Request(method, url),
+        )
+
+    monkeypatch.setattr(http_client.http_client_pool, "request", request)
+    monkeypatch.setattr(
+        http_client, "http_cache", HttpCache(max_bytes=1 << 20, max_entry_bytes=1 << 16)
+    )
+    monkeypatch.setattr(http_client.settings, "HTTP_CACHE_ENABLED", True)
+    monkeypatch.setattr(workflow_agent, "get_stream_writer", lambda: lambda event: None)
+    return sent
+
+
+def _state(user_ids):
+    plan = Plan(
+        steps=[
+            PlanStep(
+                description="Fetch every user",
+                action_type=ActionType.FOR_EACH,
+                iterate_over="user_ids",
+                api_template=ApiDetails(url=URL, method="GET"),
+            )
+        ]
+    )
+    return {
+        **initial_state(WorkflowRequest(prompt="Fetch every user")),
+        "plan": plan,
+        "step_index": 0,
+        "extracted_data": {"user_ids": user_ids},
+    }
+
+
+@pytest.mark.anyio
+async def test_the_timing_adds_up_every_element(origin):
+    # the first user is cached before the step runs
+    await http_client.execute_api_request(
+        {"url": URL.format(item=1), "method": "GET"}
+    )
+
+    update = await for_each_node(_state([1, 2, 3]))
+
+    assert update["error"] is None
+    assert len(origin) == 3
+    [timing] = update["timings"]
+    assert timing["http_requests"] == 2
+    assert timing["http_cache_hits"] == 1
+    assert timing["http_ms"] >= 40
+    assert timing["response_bytes"] == 2 * len(b'{"ok": true}')
+    assert timing["http_status"] == 200
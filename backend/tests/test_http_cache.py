@@ -0,0 +1,118 @@
+import httpx
+import pytest
+
+from app.services import http_client
+from app.services.http_cache import HttpCache, normalize_headers
+
+
+URL = "https://api.example.com/users"
+
+
+def _response(status=200, headers=None, content=b'{"users": []}'):
+    return httpx.Response(
+        status, headers=headers or {}, content=content, request=httpx.Request("GET", URL)
+    )
+
+
+def _cache():
+    return HttpCache(max_bytes=1 << 20, max_entry_bytes=1 << 16)
+
+
+@pytest.mark.parametrize(
+    "alice, bob",
+    [
+        ({"Authorization": "Bearer alice"}, {"Authorization": "Bearer bob"}),
+        ({"x-api-key": "ALICE"}, {"x-api-key": "BOB"}),
+        ({"Cookie": "sid=1"}, {"Cookie": "sid=2"}),
+        ({"X-Auth-Token": "a"}, {"X-Auth-Token": "b"}),
+        ({"x-api-key": "ALICE"}, {}),
+    ],
+)
+@pytest.mark.anyio
+async def test_responses_are_not_served_to_other_credentials(alice, bob):
+    cache = _cache()
+    await cache.store("GET", URL, normalize_headers(alice), _response(headers={"Cache-Control": "max-age=60"}))
+
+    assert await cache.lookup("GET", URL, normalize_headers(alice)) is not None
+    assert await cache.lookup("GET", URL, normalize_headers(bob)) is None
+
+
+@pytest.mark.parametrize(
+    "cache_control",
+    ["private, max-age=60", "no-store", "max-age=60, private=\"set-cookie\""],
+)
+@pytest.mark.anyio
+async def test_private_and_no_store_responses_are_not_stored(cache_control):
+    cache = _cache()
+    stored = await cache.store("GET", URL, {}, _response(headers={"Cache-Control": cache_control}))
+    assert stored is None
+    assert await cache.lookup("GET", URL, {}) is None
+
+
+@pytest.mark.anyio
+async def test_vary_keeps_variants_apart():
+    cache = _cache()
+    headers = {"Cache-Control": "max-age=60", "Vary": "Accept-Language"}
+    await cache.store("GET", URL, {"accept-language": "en"}, _response(headers=headers))
+
+    assert await cache.lookup("GET", URL, {"accept-language": "en"}) is not None
+    assert await cache.lookup("GET", URL, {"accept-language": "fr"}) is None
+
+
+@pytest.mark.anyio
+async def test_freshness():
+    cache = _cache()
+    fresh = await cache.store("GET", URL, {}, _response(headers={"Cache-Control": "max-age=60"}))
+    assert fresh.is_fresh()
+
+    stale = await cache.store(
+        "GET", URL, {}, _response(headers={"Cache-Control": "max-age=60", "Age": "120"})
+    )
+    assert not stale.is_fresh()
+    # never fresh and nothing to revalidate it with
+    assert await cache.store("GET", URL, {}, _response(headers={"Cache-Control": "no-cache"})) is None
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    """Replaces the network with a list of responses, recording the requests sent."""
+    origin = {"responses": [], "sent": []}
+
+    async def send(api_details, method):
+        origin["sent"].append(normalize_headers(api_details.get("headers")))
+        return origin["responses"].pop(0), None
+
+    monkeypatch.setattr(http_client, "_send_with_policy", send)
+    monkeypatch.setattr(http_client, "http_cache", _cache())
+    monkeypatch.setattr(http_client.settings, "HTTP_CACHE_ENABLED", True)
+    return origin
+
+
+@pytest.mark.anyio
+async def test_fresh_responses_are_served_without_a_request(origin):
+    origin["responses"].append(_response(headers={"Cache-Control": "max-age=60"}))
+    details = {"url": URL, "headers": {"x-api-key": "ALICE"}}
+
+    first = await http_client._send_api_request(details, "GET", True)
+    second = await http_client._send_api_request(details, "GET", True)
+    assert first == second == ({"users": []}, None)
+    assert len(origin["sent"]) == 1
+
+
+@pytest.mark.anyio
+async def test_stale_responses_are_revalidated(origin):
+    origin["responses"] += [
+        _response(headers={"Cache-Control": "max-age=0", "ETag": '"v1"'}),
+        _response(304, headers={"Cache-Control": "max-age=0", "ETag": '"v1"'}, content=b""),
+        _response(500, content=b"down"),
+    ]
+    details = {"url": URL, "headers": {}}
+
+    await http_client._send_api_request(details, "GET", True)
+    revalidated = await http_client._send_api_request(details, "GET", True)
+    assert revalidated == ({"users": []}, None)
+    assert origin["sent"][1]["if-none-match"] == '"v1"'
+
+    # a stale response is not served when revalidation fails
+    _, error = await http_client._send_api_request(details, "GET", True)
+    assert error is not None
@@ -0,0 +1,90 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services import http_client
+from app.services.http_resilience import CircuitBreaker
+
+
+URL = "https://flaky.example.com/items"
+
+
+def _open_breaker(reset_seconds=0.0):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=reset_seconds)
+    breaker.record(success=False)
+    breaker.record(success=False)
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    breaker.record(success=False)
+    breaker.record(success=True)
+    breaker.record(success=False)
+    assert breaker.allow()
+    breaker.record(success=False)
+    assert breaker.is_open and not breaker.allow()
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = _open_breaker()
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record(success=False)
+    assert breaker.is_open and breaker.allow()
+    breaker.record(success=True)
+    assert not breaker.is_open and breaker.allow() and breaker.allow()
+
+
+def test_threshold_of_zero_disables_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=0, reset_seconds=60)
+    for _ in range(10):
+        breaker.record(success=False)
+    assert breaker.allow()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = _open_breaker(reset_seconds=0.0)
+    monkeypatch.setattr(http_client.host_health, "breaker", lambda host: breaker)
+    return breaker
+
+
+@pytest.mark.anyio
+async def test_cancelled_trial_is_released(monkeypatch, breaker):
+    async def hang(api_details, host, method):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(http_client, "_hedged_request", hang)
+    call = asyncio.create_task(http_client._send_with_policy({"url": URL}, "GET"))
+    await asyncio.sleep(0.01)
+    assert not breaker.allow()
+
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    assert breaker.is_open and breaker.allow()
+
+
+@pytest.mark.anyio
+async def test_trial_failing_without_a_response_is_released(monkeypatch, breaker):
+    async def invalid(api_details, host, method):
+        raise httpx.InvalidURL("No host in URL")
+
+    monkeypatch.setattr(http_client, "_hedged_request", invalid)
+    with pytest.raises(httpx.InvalidURL):
+        await http_client._send_with_policy({"url": URL}, "GET")
+    assert breaker.allow()
+
+
+@pytest.mark.anyio
+async def test_successful_trial_closes_the_circuit(monkeypatch, breaker):
+    async def ok(api_details, host, method):
+        return httpx.Response(200, request=httpx.Request("GET", URL)), None
+
+    monkeypatch.setattr(http_client, "_hedged_request", ok)
+    response, error = await http_client._send_with_policy({"url": URL}, "GET")
+    assert response.status_code == 200 and error is None
+    assert not breaker.is_open
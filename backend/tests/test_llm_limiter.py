@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.llm_limiter import LlmLimiter, Priority, TokenBucket
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(60, now=bucket._updated) == 0.0
+
+    bucket.take(60, now=bucket._updated)
+    assert bucket.wait_time(1, now=bucket._updated) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=bucket._updated + 0.5) == pytest.approx(0.5)
+    # more than a minute's worth waits for a full bucket
+    assert bucket.wait_time(600, now=bucket._updated) == pytest.approx(59.5)
+
+
+def test_disabled_bucket_never_waits():
+    bucket = TokenBucket(per_minute=0)
+    bucket.take(10**9, now=0.0)
+    assert bucket.wait_time(10**9, now=0.0) == 0.0
+
+
+async def _admissions(limiter, calls):
+    """Queues calls behind a held slot, then returns the order they are sent in."""
+    admitted = []
+    release = asyncio.Event()
+
+    async def call(name, priority, tokens=0):
+        async with limiter.slot(priority, tokens):
+            admitted.append(name)
+            await release.wait()
+
+    holder = asyncio.create_task(call("holder", Priority.STEP))
+    await asyncio.sleep(0)
+    tasks = []
+    for name, priority in calls:
+        tasks.append(asyncio.create_task(call(name, priority)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return admitted[1:]
+
+
+@pytest.mark.anyio
+async def test_running_workflows_go_before_new_plans():
+    limiter = LlmLimiter(max_concurrency=1, batch_share=0.5)
+    order = await _admissions(
+        limiter,
+        [
+            ("speculative", Priority.SPECULATIVE),
+            ("plan-1", Priority.PLAN),
+            ("step-1", Priority.STEP),
+            ("plan-2", Priority.PLAN),
+            ("step-2", Priority.STEP),
+        ],
+    )
+    assert order == ["step-1", "step-2", "plan-1", "plan-2", "speculative"]
+
+
+@pytest.mark.anyio
+async def test_concurrency_limit():
+    limiter = LlmLimiter(max_concurrency=2, batch_share=0.5)
+    in_flight = peak = 0
+
+    async def call():
+        nonlocal in_flight, peak
+        async with limiter.slot():
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+
+
+@pytest.mark.anyio
+async def test_calls_wait_for_the_token_bucket():
+    # 1000 tokens a second, with a minute's worth in the bucket
+    limiter = LlmLimiter(max_concurrency=10, batch_share=0.5, tokens_per_minute=60_000)
+    async with limiter.slot(tokens=60_000):
+        pass
+
+    started = time.monotonic()
+    sent = []
+
+    async def call(name, priority, tokens):
+        async with limiter.slot(priority, tokens):
+            sent.append((name, time.monotonic() - started))
+
+    await asyncio.gather(
+        call("plan", Priority.PLAN, 50),
+        call("step", Priority.STEP, 100),
+    )
+    # the step waits for its 100 tokens first, the plan for 50 more
+    assert [name for name, _ in sent] == ["step", "plan"]
+    assert sent[0][1] == pytest.approx(0.1, abs=0.05)
+    assert sent[1][1] == pytest.approx(0.15, abs=0.05)
+
+
+@pytest.mark.anyio
+async def test_calls_wait_for_the_request_bucket_and_hold_off():
+    # one request a second, after a burst of 60
+    limiter = LlmLimiter(max_concurrency=100, batch_share=0.5, requests_per_minute=60)
+    for _ in range(60):
+        async with limiter.slot():
+            pass
+
+    # 0.9 of a request back in the bucket: the next call waits a tenth of a second
+    limiter._requests.take(-0.9, time.monotonic())
+    started = time.monotonic()
+    async with limiter.slot():
+        pass
+    assert time.monotonic() - started == pytest.approx(0.1, abs=0.05)
+
+    # requests to spare, but the provider asked us to hold off
+    limiter._requests.take(-10, time.monotonic())
+    limiter.hold_off(0.1)
+    started = time.monotonic()
+    async with limiter.slot():
+        pass
+    assert time.monotonic() - started == pytest.approx(0.1, abs=0.05)
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiter_leaves_the_queue():
+    limiter = LlmLimiter(max_concurrency=1, batch_share=0.5)
+    release = asyncio.Event()
+
+    async def hold():
+        async with limiter.slot():
+            await release.wait()
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(limiter.slot(Priority.PLAN).__aenter__())
+    await asyncio.sleep(0)
+    assert limiter._waiting[Priority.PLAN] == 1
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter._waiting[Priority.PLAN] == 0
+    release.set()
+    await holder
+    assert limiter._in_flight == 0
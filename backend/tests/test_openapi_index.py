@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from app.services.openapi_index import OpenApiIndexStore, SpecError
+
+
+SPEC = json.dumps(
+    {
+        "openapi": "3.0.0",
+        "servers": [{"url": "https://api.example.com"}],
+        "paths": {
+            "/users": {"get": {"operationId": "listUsers", "summary": "List users"}},
+            "/orders/{id}": {"get": {"operationId": "getOrder", "summary": "Get an order"}},
+        },
+    }
+)
+
+
+@pytest.mark.anyio
+async def test_in_memory_store_writes_no_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = OpenApiIndexStore()
+    registration = await store.register("team", SPEC)
+
+    assert registration.operations == 2
+    assert [op.operation_id for op in await store.search("team", "user list", k=1)] == ["listUsers"]
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.anyio
+async def test_persisted_index_is_loaded_by_another_store(tmp_path):
+    db_path = str(tmp_path / "openapi_index.db")
+    await OpenApiIndexStore(db_path).register("team", SPEC)
+
+    index = await OpenApiIndexStore(db_path).get("team")
+    assert index is not None and len(index.operations) == 2
+
+
+def test_store_opens_its_database_on_first_use(tmp_path):
+    OpenApiIndexStore(str(tmp_path / "openapi_index.db"))
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize(
+    "paths",
+    [
+        {"/users": {"get": {"parameters": {"name": "id"}}}},
+        {"/users": {"get": {"tags": [1, 2]}}},
+        {"/users": {"get": {"responses": {"200": {"content": ["application/json"]}}}}},
+        {"/users": {"get": {"summary": ["List users"]}}},
+    ],
+)
+@pytest.mark.anyio
+async def test_malformed_specs_are_spec_errors(tmp_path, paths):
+    spec = json.dumps({"openapi": "3.0.0", "paths": paths})
+    with pytest.raises(SpecError):
+        await OpenApiIndexStore().register("team", spec)
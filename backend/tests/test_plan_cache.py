@@ -0,0 +1,73 @@
+import pytest
+
+from app.models.workflow import ActionType, ApiDetails, HttpMethod, Plan, PlanStep
+from app.services.plan_cache import (
+    PlanCache,
+    bind_plan,
+    normalize_prompt,
+    parameterize_plan,
+)
+
+
+def _plan(description: str, url: str = "https://api.example.com/products/1") -> Plan:
+    return Plan(
+        steps=[
+            PlanStep(
+                description=description,
+                action_type=ActionType.API_CALL,
+                api_template=ApiDetails(
+                    url=url,
+                    method=HttpMethod.GET,
+                    headers={"Accept": "application/json"},
+                ),
+            )
+        ]
+    )
+
+
+def test_normalize_prompt_lifts_quoted_literals():
+    normalized, params = normalize_prompt("Log in as 'bob'  and fetch \"orders\"")
+    assert normalized == "log in as <<p0>> and fetch <<p1>>"
+    assert params == ["bob", "orders"]
+
+
+def test_parameterize_and_bind_round_trip():
+    plan = _plan("Fetch the profile of alice", "https://api.example.com/users/alice")
+    template, pinned = parameterize_plan(plan, ["alice"])
+    assert pinned == {}
+    assert template.steps[0].api_template.url == "https://api.example.com/users/<<p0>>"
+
+    bound = bind_plan(template, ["bob"])
+    assert bound.steps[0].description == "Fetch the profile of bob"
+    assert bound.steps[0].api_template.url == "https://api.example.com/users/bob"
+
+
+@pytest.mark.parametrize(
+    "literal", ["description", "steps", "api_call", "url", "null", "GET", "method"]
+)
+def test_literals_colliding_with_field_names_only_touch_values(literal):
+    plan = _plan(f"Fetch the {literal} of product 1")
+    template, pinned = parameterize_plan(plan, [literal])
+    assert pinned == {}
+    step = template.steps[0]
+    assert step.description == "Fetch the <<p0>> of product 1"
+    assert step.action_type == ActionType.API_CALL
+    assert step.api_template.method == HttpMethod.GET
+    assert bind_plan(template, [literal]) == plan
+
+
+def test_literals_missing_from_the_plan_are_pinned():
+    template, pinned = parameterize_plan(_plan("Fetch product 1"), ["ab", "shoes"])
+    assert pinned == {0: "ab", 1: "shoes"}
+    assert template == _plan("Fetch product 1")
+
+
+@pytest.mark.anyio
+async def test_put_with_a_colliding_literal_serves_the_plan_back():
+    cache = PlanCache(max_entries=10, ttl_seconds=60)
+    prompt = "Fetch the 'description' of product 1"
+    plan = _plan("Fetch the description of product 1")
+    await cache.put(prompt, plan)
+    assert await cache.get(prompt) == plan
+    rebound = await cache.get("Fetch the 'summary' of product 1")
+    assert rebound.steps[0].description == "Fetch the summary of product 1"
@@ -0,0 +1,181 @@
+import json
+import os
+
+import pytest
+
+from app.models.workflow import (
+    ActionType,
+    ExtractionRule,
+    HttpMethod,
+    Plan,
+    PlanStep,
+    Recipe,
+)
+from app.services import recipes
+from app.services.body_store import body_store
+from app.services.recipes import compile_recipe, replay_recipe
+
+PLAN = Plan(
+    steps=[
+        PlanStep(description="Look up the user named method", action_type=ActionType.API_CALL),
+        PlanStep(
+            description="Extract the user's id",
+            action_type=ActionType.DATA_EXTRACTION,
+            extraction_rules=[ExtractionRule(variable="user_id", path="$.user.id")],
+        ),
+        PlanStep(description="Fetch the user's orders", action_type=ActionType.API_CALL),
+    ]
+)
+
+
+def _entry(step_index, template, response_data):
+    return {
+        "step_index": step_index,
+        "api_details": template,
+        "api_details_template": template,
+        "response_data": response_data,
+        "extraction_rules": [],
+        "error": None,
+    }
+
+
+def _history(user_response):
+    return [
+        _entry(
+            0,
+            {"url": "https://api.example.com/users?name=method", "method": "GET",
+             "headers": {"method": "method"}},
+            user_response,
+        ),
+        _entry(
+            2,
+            {"url": "https://api.example.com/users/{user_id}/orders", "method": "GET"},
+            {"orders": []},
+        ),
+    ]
+
+
+@pytest.mark.anyio
+async def test_literals_are_only_replaced_in_values():
+    recipe = await compile_recipe(
+        "Get the orders of 'method'", PLAN, _history({"user": {"id": 7}}), {"user_id": 7}
+    )
+    template = recipe.steps[0].api_details
+    assert template.method == HttpMethod.GET
+    assert template.url == "https://api.example.com/users?name={p0}"
+    assert template.headers == {"method": "{p0}"}
+    # the recipe survives a round trip through its JSON
+    assert Recipe.model_validate_json(recipe.model_dump_json()) == recipe
+
+
+@pytest.mark.anyio
+async def test_data_extraction_rules_are_kept_and_replayed(monkeypatch):
+    recipe = await compile_recipe(
+        "Get the orders of 'method'", PLAN, _history({"user": {"id": 7}}), {"user_id": 7}
+    )
+    assert recipe.steps[1].extraction_rules == PLAN.steps[1].extraction_rules
+
+    calls = []
+
+    async def execute_api_request(api_details):
+        calls.append(api_details["url"])
+        if "orders" in api_details["url"]:
+            return {"orders": [1]}, None
+        return {"user": {"id": 9}}, None
+
+    monkeypatch.setattr(recipes, "execute_api_request", execute_api_request)
+    replayed = await replay_recipe(recipe, {"p0": "alice"})
+    assert replayed.error is None
+    assert replayed.extracted_data == {"user_id": 9}
+    assert calls == [
+        "https://api.example.com/users?name=alice",
+        "https://api.example.com/users/9/orders",
+    ]
+
+
+@pytest.mark.anyio
+async def test_values_are_located_in_spilled_bodies():
+    body = json.dumps({"data": [{"id": 41}, {"id": 42}]}).encode()
+    body_id = "ab" * 32
+    with open(os.path.join(body_store.directory, body_id), "wb") as stored:
+        stored.write(body)
+    body_ref = {
+        "body_ref": body_id,
+        "content_type": "application/json",
+        "size": len(body),
+        "preview": "",
+    }
+    plan = Plan(
+        steps=[
+            PlanStep(description="List the items", action_type=ActionType.API_CALL),
+            PlanStep(description="Fetch the second item", action_type=ActionType.API_CALL),
+        ]
+    )
+    history = [
+        _entry(0, {"url": "https://api.example.com/items", "method": "GET"}, body_ref),
+        _entry(1, {"url": "https://api.example.com/items/{item_id}", "method": "GET"}, {}),
+    ]
+    recipe = await compile_recipe("Fetch the second item", plan, history, {"item_id": 42})
+    assert recipe.steps[0].extraction_rules == [
+        ExtractionRule(variable="item_id", path="$.data[1].id")
+    ]
+
+
+def _two_steps(response):
+    plan = Plan(
+        steps=[
+            PlanStep(description="List the items", action_type=ActionType.API_CALL),
+            PlanStep(description="Fetch an item", action_type=ActionType.API_CALL),
+        ]
+    )
+    history = [
+        _entry(0, {"url": "https://api.example.com/items", "method": "GET"}, response),
+        _entry(1, {"url": "https://api.example.com/items/{item_id}", "method": "GET"}, {}),
+    ]
+    return plan, history
+
+
+@pytest.mark.parametrize(
+    "response, value, path",
+    [
+        # True == 1 in Python, but a flag is not an id
+        ({"active": True, "item": {"id": 1}}, 1, "$.item.id"),
+        ({"count": 1, "item": {"enabled": True}}, True, "$.item.enabled"),
+        # stringified ids still match
+        ({"item": {"id": 42}}, "42", "$.item.id"),
+        ({"item": {"id": "42"}}, 42, "$.item.id"),
+    ],
+)
+@pytest.mark.anyio
+async def test_values_are_matched_by_type_and_value(response, value, path):
+    plan, history = _two_steps(response)
+    recipe = await compile_recipe("Fetch an item", plan, history, {"item_id": value})
+    assert recipe.steps[0].extraction_rules == [ExtractionRule(variable="item_id", path=path)]
+
+
+@pytest.mark.anyio
+async def test_values_found_at_several_paths_are_not_guessed():
+    plan, history = _two_steps({"data": [{"id": 7, "owner": 7}]})
+    with pytest.raises(ValueError, match="single path"):
+        await compile_recipe("Fetch an item", plan, history, {"item_id": 7})
+
+
+def _recipe(recipe_id):
+    return Recipe(recipe_id=recipe_id, prompt="p", plan=Plan(steps=[]), steps=[])
+
+
+@pytest.mark.anyio
+async def test_the_store_evicts_the_least_recently_used(tmp_path):
+    store = recipes.RecipeStore(max_entries=2)
+    for recipe_id in ("a", "b"):
+        await store.put(_recipe(recipe_id))
+    assert await store.get("a") is not None
+    await store.put(_recipe("c"))
+    assert await store.get("b") is None
+    assert [await store.get(recipe_id) is not None for recipe_id in "ac"] == [True, True]
+
+    persisted = recipes.RecipeStore(max_entries=1, db_path=str(tmp_path / "recipes.db"))
+    await persisted.put(_recipe("a"))
+    await persisted.put(_recipe("b"))
+    assert len(persisted._recipes) == 1
+    assert (await persisted.get("a")).recipe_id == "a"
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from app.models.workflow import RunStatus, WorkflowRequest
+from app.services import run_queue as run_queue_module
+from app.services.run_queue import RunQueue, RunQueueFull
+from app.services.run_registry import RunRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = RunRegistry()
+    monkeypatch.setattr(run_queue_module, "run_registry", registry)
+    return registry
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    saved = []
+
+    async def save(run_id, status, request, state):
+        saved.append((run_id, status))
+
+    monkeypatch.setattr(run_queue_module.run_store, "save", save)
+    return saved
+
+
+@pytest.fixture
+def started(monkeypatch, registry):
+    started = []
+
+    def start_workflow_run(request, run_id, cancel_when_abandoned):
+        async def events():
+            yield {"event": "start", "data": {}}
+            await asyncio.sleep(10)
+
+        started.append(run_id)
+        return registry.start(run_id, events(), cancel_when_abandoned)
+
+    monkeypatch.setattr(run_queue_module, "start_workflow_run", start_workflow_run)
+    return started
+
+
+REQUEST = WorkflowRequest(prompt="List the users of the demo API")
+
+
+@pytest.mark.anyio
+async def test_submissions_beyond_max_size_are_rejected(registry, saved, started):
+    queue = RunQueue(workers=1, max_size=2)
+    first, position = await queue.submit(REQUEST)
+    second, _ = await queue.submit(REQUEST)
+    assert position == 1 and queue.position(second) == 2
+    with pytest.raises(RunQueueFull):
+        await queue.submit(REQUEST)
+    assert saved == [(first, RunStatus.QUEUED), (second, RunStatus.QUEUED)]
+
+    # once a worker takes the first run, there is room again
+    await asyncio.sleep(0.01)
+    assert started == [first] and queue.position(first) is None
+    assert queue.position(second) == 1
+    third, position = await queue.submit(REQUEST)
+    assert position == 2
+    await queue.aclose()
+
+
+@pytest.mark.anyio
+async def test_cancel_waiting_and_executing_runs(registry, saved, started):
+    queue = RunQueue(workers=1, max_size=10)
+    executing, _ = await queue.submit(REQUEST)
+    waiting, _ = await queue.submit(REQUEST)
+    await asyncio.sleep(0.01)
+    assert started == [executing]
+
+    assert await queue.cancel(waiting)
+    assert queue.position(waiting) is None
+    assert saved[-1] == (waiting, RunStatus.CANCELLED)
+    assert registry.get(waiting).events[-1]["event"] == "cancelled"
+
+    assert await queue.cancel(executing)
+    await asyncio.sleep(0.01)
+    assert registry.get(executing).events[-1]["event"] == "cancelled"
+    # the worker is free again, and the cancelled run was never started
+    assert started == [executing]
+    assert not await queue.cancel("unknown")
+    await queue.aclose()
+
+
+@pytest.mark.anyio
+async def test_aclose_cancels_waiting_runs(registry, saved, started):
+    queue = RunQueue(workers=1, max_size=10)
+    executing, _ = await queue.submit(REQUEST)
+    waiting, _ = await queue.submit(REQUEST)
+    await asyncio.sleep(0.01)
+
+    await queue.aclose()
+    assert registry.get(executing).task.cancelled()
+    assert (waiting, RunStatus.CANCELLED) in saved
+
+
+@pytest.mark.anyio
+async def test_failed_submission_releases_its_slot_and_reservation(registry, monkeypatch):
+    async def save(run_id, status, request, state):
+        raise TypeError("Object of type bytes is not JSON serializable")
+
+    monkeypatch.setattr(run_queue_module.run_store, "save", save)
+    queue = RunQueue(workers=1, max_size=1)
+    with pytest.raises(TypeError):
+        await queue.submit(REQUEST)
+
+    assert queue._admitted == 0
+    assert registry._runs == {}
+    await queue.aclose()
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from app.services import workflow_service
+from app.services.run_registry import RunAlreadyActive, RunRegistry
+from app.services.workflow_service import WorkflowService
+
+
+async def _events(count, delay=0.0):
+    for index in range(count):
+        await asyncio.sleep(delay)
+        yield {"event": "step", "data": {"index": index}}
+
+
+@pytest.mark.anyio
+async def test_reserved_run_cannot_be_reserved_again():
+    registry = RunRegistry()
+    registry.reserve("run")
+    with pytest.raises(RunAlreadyActive):
+        registry.reserve("run")
+
+    registry.release("run")
+    assert registry.get("run") is None
+    registry.reserve("run")
+
+
+@pytest.mark.anyio
+async def test_aclose_cancels_and_awaits_running_runs():
+    registry = RunRegistry()
+    run = registry.start("run", _events(100, delay=10))
+    await asyncio.sleep(0)
+
+    await registry.aclose()
+    assert run.done and run.task.cancelled()
+    assert run.events[-1]["event"] == "cancelled"
+
+
+@pytest.mark.anyio
+async def test_concurrent_resumes_start_the_run_once(monkeypatch):
+    registry = RunRegistry()
+    started = []
+
+    async def load(run_id):
+        await asyncio.sleep(0.01)
+        return {"request": None, "state": {"run_id": run_id}}
+
+    def start_workflow_run(request, resume_from):
+        started.append(resume_from["run_id"])
+        return registry.start(resume_from["run_id"], _events(1))
+
+    monkeypatch.setattr(workflow_service, "run_registry", registry)
+    monkeypatch.setattr(workflow_service.run_store, "load", load)
+    monkeypatch.setattr(workflow_service, "restore_state", lambda state: state)
+    monkeypatch.setattr(workflow_service, "start_workflow_run", start_workflow_run)
+
+    results = await asyncio.gather(
+        WorkflowService.resume_run("run"),
+        WorkflowService.resume_run("run"),
+        return_exceptions=True,
+    )
+    assert started == ["run"]
+    assert sum(isinstance(result, RunAlreadyActive) for result in results) == 1
+
+
+@pytest.mark.anyio
+async def test_resume_of_an_unknown_run_releases_it(monkeypatch):
+    registry = RunRegistry()
+
+    async def load(run_id):
+        return None
+
+    monkeypatch.setattr(workflow_service, "run_registry", registry)
+    monkeypatch.setattr(workflow_service.run_store, "load", load)
+
+    assert await WorkflowService.resume_run("run") is None
+    assert not registry.is_running("run")
+
+
+@pytest.mark.anyio
+async def test_follow_batches_coalesces_events_and_resumes_after_an_index():
+    registry = RunRegistry()
+    run = registry.reserve("run")
+    for index in range(3):
+        await run.publish({"event": "step", "data": {"index": index}})
+
+    batches = run.follow_batches(after=1)
+    assert [event["data"]["index"] for event in await anext(batches)] == [1, 2]
+
+    await run.publish({"event": "step", "data": {"index": 3}})
+    await run.finish()
+    assert [batch async for batch in batches] == [[{"event": "step", "data": {"index": 3}}]]
+
+
+@pytest.mark.anyio
+async def test_follow_batches_yields_empty_batches_while_idle():
+    registry = RunRegistry()
+    run = registry.start("run", _events(2, delay=0.05))
+    batches = [batch async for batch in run.follow_batches(idle_timeout=0.01)]
+
+    assert [] in batches
+    assert [event for batch in batches for event in batch] == run.events
+    assert len(run.events) == 2
+
+
+@pytest.mark.anyio
+async def test_cancel_stops_the_run_and_followers_see_it():
+    registry = RunRegistry()
+    run = registry.start("run", _events(100, delay=0.01))
+    followed = []
+
+    async def follow():
+        async for event in run.follow():
+            followed.append(event)
+
+    follower = asyncio.create_task(follow())
+    await asyncio.sleep(0.035)
+    assert registry.cancel("run")
+    await follower
+
+    assert followed[-1]["event"] == "cancelled"
+    assert 0 < len(followed) < 100
+    assert not registry.is_running("run")
+    assert not registry.cancel("run")
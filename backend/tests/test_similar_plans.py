@@ -0,0 +1,61 @@
+from app.models.workflow import ActionType, Plan, PlanStep
+from app.services.similar_plans import SimilarPlanIndex, values
+
+
+def test_add_and_reuse_with_a_literal_colliding_with_a_field_name():
+    index = SimilarPlanIndex(max_entries=10, ttl_seconds=60)
+    plan = Plan(
+        steps=[
+            PlanStep(
+                description="Fetch the steps of recipe 7",
+                action_type=ActionType.API_CALL,
+            )
+        ]
+    )
+    index.add("Fetch the 'steps' of recipe 7 from the cookbook API", plan)
+
+    similar = index.find("Fetch the 'ingredients' of recipe 7 from the cookbook API")
+    assert similar is not None
+    assert similar.plan.steps[0].description == "Fetch the ingredients of recipe 7"
+    assert similar.plan.steps[0].action_type == ActionType.API_CALL
+
+
+def _orders_plan(customer_id):
+    return Plan(
+        steps=[
+            PlanStep(
+                description=f"GET /customers/{customer_id}/orders",
+                action_type=ActionType.API_CALL,
+            )
+        ]
+    )
+
+
+def test_plan_for_other_unquoted_values_is_only_suggested():
+    index = SimilarPlanIndex(max_entries=10, ttl_seconds=60)
+    index.add(
+        "Log in as 'bob' and fetch the order history of customer 1234 from the shop "
+        "API, then list the items and the shipping status of each order",
+        _orders_plan(1234),
+    )
+
+    similar, reusable = index.lookup(
+        "Log in as 'bob' and fetch the order history of customer 9876 from the shop "
+        "API, then list the items and the shipping status of each order"
+    )
+    assert similar is not None and similar.similarity >= 0.75
+    assert not similar.same_values and not reusable
+    assert similar.plan.steps[0].description == "GET /customers/1234/orders"
+
+    same, reusable = index.lookup(
+        "Sign in as 'bob' and get the order history of customer 1234 from the shop "
+        "API, then list the items and the shipping status of each order"
+    )
+    assert same is not None and same.same_values and reusable
+
+
+def test_values_of_a_prompt():
+    assert values(
+        "Email ada@example.com the report of order A-17 from https://api.example.com/v2 "
+        "for 'ID 42'"
+    ) == ("a-17", "ada@example.com", "https://api.example.com/v2")
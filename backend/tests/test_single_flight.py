@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from app.services.single_flight import SingleFlight, call_key
+
+
+@pytest.mark.anyio
+async def test_concurrent_identical_calls_share_one_invocation():
+    flight = SingleFlight("test")
+    invocations = 0
+
+    async def fetch():
+        nonlocal invocations
+        invocations += 1
+        await asyncio.sleep(0.01)
+        return {"users": [1, 2]}
+
+    results = await asyncio.gather(*(flight.do("users", fetch) for _ in range(5)))
+    assert invocations == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert all(result == {"users": [1, 2]} for result, _ in results)
+    # joined callers get their own copy
+    results[1][0]["users"].append(3)
+    assert results[0][0] == results[2][0] == {"users": [1, 2]}
+
+    # once it finished, the next call runs again, as do calls for other keys
+    await flight.do("users", fetch)
+    await flight.do("groups", fetch)
+    assert invocations == 3
+
+
+@pytest.mark.anyio
+async def test_exception_reaches_every_waiter():
+    flight = SingleFlight("test")
+    invocations = 0
+
+    async def fail():
+        nonlocal invocations
+        invocations += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(
+        *(flight.do("key", fail) for _ in range(3)), return_exceptions=True
+    )
+    assert invocations == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+@pytest.mark.anyio
+async def test_a_waiter_leaving_does_not_cancel_the_call_for_the_others():
+    flight = SingleFlight("test")
+    started = asyncio.Event()
+    cancelled = False
+
+    async def slow():
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        return "done"
+
+    leaving = asyncio.create_task(flight.do("key", slow))
+    staying = asyncio.create_task(flight.do("key", slow))
+    await started.wait()
+
+    leaving.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leaving
+    assert await staying == ("done", True)
+    assert not cancelled
+
+
+@pytest.mark.anyio
+async def test_the_call_is_cancelled_once_every_waiter_left():
+    flight = SingleFlight("test")
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def slow():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    waiters = [asyncio.create_task(flight.do("key", slow)) for _ in range(2)]
+    await started.wait()
+    for waiter in waiters:
+        waiter.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert flight._calls == {}
+
+
+def test_call_key_ignores_key_order():
+    assert call_key("GET", {"a": 1, "b": 2}) == call_key("GET", {"b": 2, "a": 1})
+    assert call_key("GET", {"a": 1}) != call_key("POST", {"a": 1})
@@ -0,0 +1,85 @@
+import asyncio
+import gc
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from app.models.workflow import ApiDetails, HttpMethod
+from app.services.agents.speculation import Speculator
+from app.services.instrumentation import instrument_node, token_usage_callback
+
+
+@pytest.mark.anyio
+async def test_taken_speculation_needs_its_placeholders():
+    speculator = Speculator()
+
+    async def generate():
+        return ApiDetails(url="https://api.example.com/users/{user_id}", method=HttpMethod.GET)
+
+    speculator.start("run", 1, generate)
+    speculator.start("run", 2, generate)
+    assert (await speculator.take("run", 1, {"user_id"})).url.endswith("{user_id}")
+    assert await speculator.take("run", 2, set()) is None
+    assert await speculator.take("run", 3, {"user_id"}) is None
+
+
+@pytest.mark.anyio
+async def test_failures_never_taken_are_not_reported_as_unretrieved():
+    unhandled = []
+    loop = asyncio.get_running_loop()
+    loop.set_exception_handler(lambda _, context: unhandled.append(context))
+    speculator = Speculator()
+
+    async def generate():
+        raise RuntimeError("the LLM call failed")
+
+    speculator.start("run", 1, generate)
+    speculator.start("run", 2, generate)
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    speculator.discard_run("run")
+    # and one whose run never discarded it
+    Speculator().start("other", 1, generate)
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    gc.collect()
+    await asyncio.sleep(0)
+    loop.set_exception_handler(None)
+
+    assert unhandled == []
+
+
+@pytest.mark.anyio
+async def test_llm_usage_is_counted_in_the_step_taking_the_speculation():
+    speculator = Speculator()
+    step_done = asyncio.Event()
+
+    async def generate():
+        await step_done.wait()
+        message = AIMessage(
+            content="",
+            usage_metadata={"input_tokens": 120, "output_tokens": 30, "total_tokens": 150},
+        )
+        token_usage_callback.on_llm_end(
+            LLMResult(generations=[[ChatGeneration(message=message)]])
+        )
+        return ApiDetails(url="https://api.example.com/users/{user_id}", method=HttpMethod.GET)
+
+    @instrument_node("make_api_call")
+    async def starting_step(state):
+        speculator.start("run", 1, generate)
+        return {}
+
+    @instrument_node("make_api_call")
+    async def taking_step(state):
+        await speculator.take("run", 1, {"user_id"})
+        return {}
+
+    [started] = (await starting_step({"step_index": 0}))["timings"]
+    step_done.set()
+    [taken] = (await taking_step({"step_index": 1}))["timings"]
+
+    assert started["llm_calls"] == 0 and started["llm_input_tokens"] == 0
+    assert taken["llm_calls"] == 1
+    assert (taken["llm_input_tokens"], taken["llm_output_tokens"]) == (120, 30)
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+from app.models.workflow import ActionType, Plan, PlanningMode, PlanStep, WorkflowRequest
+from app.services.agents import workflow_agent
+from app.services.agents.step_scheduler import (
+    ready_steps,
+    step_dependencies,
+    unblocked_by,
+)
+from app.services.agents.workflow_agent import initial_state, iter_workflow_events
+
+
+def _call(description, consumes=None, produces=None):
+    return PlanStep(
+        description=description,
+        action_type=ActionType.API_CALL,
+        consumes=consumes,
+        produces=produces,
+    )
+
+
+def _extract(description):
+    return PlanStep(description=description, action_type=ActionType.DATA_EXTRACTION)
+
+
+# 0 logs in; 1 extracts the token; 2 and 3 both only need the token; 4 needs
+# what 2 produced; 5 declares nothing and so waits for everything before it
+PLAN = Plan(
+    steps=[
+        _call("Log in", consumes=[], produces=["auth_token"]),
+        _extract("Extract the token"),
+        _call("List users", consumes=["auth_token"], produces=["user_ids"]),
+        _call("List groups", consumes=["auth_token"]),
+        _call("Fetch the first user", consumes=["user_ids"]),
+        _call("Log out"),
+    ]
+)
+
+
+def test_step_dependencies():
+    assert step_dependencies(PLAN) == [set(), {0}, {1}, {1}, {2}, {0, 1, 2, 3, 4}]
+
+
+def test_ready_steps_follow_completions():
+    assert ready_steps(PLAN, []) == [0]
+    assert ready_steps(PLAN, [0]) == [1]
+    assert ready_steps(PLAN, [0, 1]) == [2, 3]
+    assert ready_steps(PLAN, [0, 1, 3]) == [2]
+    assert ready_steps(PLAN, [0, 1, 2, 3]) == [4]
+    assert ready_steps(PLAN, range(6)) == []
+
+
+def test_unblocked_by_counts_the_extraction_steps_that_follow():
+    assert unblocked_by(PLAN, 0, []) == [2, 3]
+    assert unblocked_by(PLAN, 2, [0, 1]) == [4]
+    # step 5 still waits for step 3
+    assert unblocked_by(PLAN, 4, [0, 1, 2]) == []
+    assert unblocked_by(PLAN, 4, [0, 1, 2, 3]) == [5]
+
+
+@pytest.mark.anyio
+async def test_steps_run_along_the_critical_path(monkeypatch):
+    # 0 is slow; 1 is fast and unblocks 2. Run in lock-step levels, 2 would
+    # wait for 0 and the run would take 0.3 + 0.2 seconds.
+    plan = Plan(
+        steps=[
+            _call("Slow report", consumes=[]),
+            _call("Fast lookup", consumes=[], produces=["user_id"]),
+            _call("Fetch the user", consumes=["user_id"]),
+        ]
+    )
+    latencies = {0: 0.3, 1: 0.02, 2: 0.2}
+    started = {}
+
+    async def make_api_call(state):
+        index = state["step_index"]
+        started[index] = time.perf_counter()
+        await asyncio.sleep(latencies[index])
+        return {
+            "completed_steps": [index],
+            "request_history": [
+                {"step_index": index, "api_details": {}, "response_data": {}, "error": None}
+            ],
+        }
+
+    monkeypatch.setitem(workflow_agent._STEP_FUNCTIONS, "make_api_call", make_api_call)
+    request = WorkflowRequest(prompt="Fetch a report and a user")
+    state = {
+        **initial_state(request),
+        "plan": plan,
+        "planning_mode": PlanningMode.STEPWISE,
+    }
+
+    began = time.perf_counter()
+    events = [event async for event in iter_workflow_events(request, resume_from=state)]
+    elapsed = time.perf_counter() - began
+
+    completed = [e for e in events if e["event"] == "api_call_completed"]
+    assert [e["data"]["step_title"][:6] for e in completed] == ["Step 2", "Step 3", "Step 1"]
+    assert started[2] - started[1] < 0.1
+    assert elapsed < 0.45
+    assert events[-1]["event"] == "end"
@@ -0,0 +1,70 @@
+import pytest
+
+from app.services.templates import (
+    compile_template,
+    format_recursively,
+    template_placeholders,
+)
+
+
+VALUES = {
+    "name": "Ada",
+    "count": 3,
+    "price": 2.5,
+    "item": {"id": 7, "tags": ["a", "b"]},
+    "items": [{"id": 1}, {"id": 2}],
+}
+
+
+@pytest.mark.parametrize(
+    "template",
+    [
+        "Hello {name}",
+        "{name}-{count}",
+        "/orders/{item[id]}/tags/{item[tags][1]}",
+        "{items[0][id]},{items[1][id]}",
+        "{count:>4}|{price:.2f}|{name:^7}",
+        "{name!r} {count!s} {name!a}",
+        "{{literal}} {name}",
+        "{{{name}}}",
+        "}} {{ {count}",
+        "no placeholders",
+        "{{name}}",
+        "",
+    ],
+)
+def test_text_renders_as_str_format(template):
+    assert format_recursively(template, VALUES) == template.format(**VALUES)
+
+
+def test_escaped_braces_are_not_placeholders():
+    assert format_recursively("{{literal}} {x}", {"x": 1}) == "{literal} 1"
+    assert template_placeholders("{{literal}} {x}") == {"x"}
+
+
+def test_whole_value_placeholder_keeps_the_type():
+    assert format_recursively("{count}", VALUES) == 3
+    assert format_recursively({"ids": "{items}"}, VALUES) == {"ids": VALUES["items"]}
+
+
+def test_missing_placeholders_are_kept():
+    assert format_recursively("{name} {missing}", VALUES) == "Ada {missing}"
+    assert format_recursively("{missing[id]:>3}", VALUES) == "{missing[id]:>3}"
+
+
+def test_json_braces_are_kept():
+    template = '{"query": "{name}", "nested": {"a": 1}}'
+    assert format_recursively(template, VALUES) == '{"query": "Ada", "nested": {"a": 1}}'
+
+
+def test_renders_do_not_share_containers():
+    template = {"body": {"lines": [{"sku": "x"}], "who": "{name}"}, "meta": {"a": [1]}}
+    compiled = compile_template(template)
+    first = compiled.render(VALUES)
+    first["body"]["lines"][0]["sku"] = "changed"
+    first["meta"]["a"].append(2)
+
+    second = compiled.render(VALUES)
+    assert second == {"body": {"lines": [{"sku": "x"}], "who": "Ada"}, "meta": {"a": [1]}}
+    assert template == {"body": {"lines": [{"sku": "x"}], "who": "{name}"}, "meta": {"a": [1]}}
+    assert format_recursively({"a": {"b": []}}, {}) is not format_recursively({"a": {"b": []}}, {})
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.main import app
+from app.models.workflow import BatchWorkflowRequest, WorkflowRequest
+from app.services import workflow_batch
+from app.services.llm_limiter import LlmLimiter
+from app.services.workflow_batch import run_workflow_batch
+
+
+PROMPT = "List the users of the demo API"
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = LlmLimiter(max_concurrency=4, batch_share=0.5)
+    monkeypatch.setattr(workflow_batch, "llm_limiter", limiter)
+    return limiter
+
+
+@pytest.fixture
+def workflows(monkeypatch, limiter):
+    """Replaces workflow runs with one LLM call each, tracking the calls in flight."""
+    calls = {"in_flight": 0, "peak": 0}
+
+    async def iter_workflow_events(request):
+        yield {"event": "start", "data": {"prompt": request.prompt}}
+        async with limiter.slot():
+            calls["in_flight"] += 1
+            calls["peak"] = max(calls["peak"], calls["in_flight"])
+            await asyncio.sleep(0.02)
+            calls["in_flight"] -= 1
+        if request.prompt.startswith("fail"):
+            yield {"event": "error", "data": {"detail": "boom"}}
+        yield {"event": "end", "data": {}}
+
+    monkeypatch.setattr(workflow_batch, "iter_workflow_events", iter_workflow_events)
+    return calls
+
+
+def _batch(count, **kwargs):
+    return BatchWorkflowRequest(
+        workflows=[WorkflowRequest(prompt=f"{PROMPT} {index}") for index in range(count)],
+        **kwargs,
+    )
+
+
+@pytest.mark.anyio
+async def test_events_are_tagged_and_summarized(workflows):
+    request = BatchWorkflowRequest(
+        workflows=[WorkflowRequest(prompt=PROMPT), WorkflowRequest(prompt=f"fail: {PROMPT}")]
+    )
+    events = [event async for event in run_workflow_batch(request)]
+
+    assert {(e["workflow_id"], e["event"]) for e in events[:-1]} == {
+        ("0", "start"), ("0", "end"), ("1", "start"), ("1", "error"), ("1", "end"),
+    }
+    summary = events[-1]["data"]
+    assert events[-1]["event"] == "batch_summary"
+    assert (summary["total"], summary["completed"], summary["failed"]) == (2, 1, 1)
+    assert [w["status"] for w in summary["workflows"]] == ["completed", "failed"]
+
+
+@pytest.mark.anyio
+async def test_batches_share_one_slice_of_the_llm_budget(workflows, limiter):
+    async def interactive_call():
+        await asyncio.sleep(0.005)
+        async with limiter.slot():
+            return limiter._in_flight
+
+    async def drain(request):
+        return [event async for event in run_workflow_batch(request)]
+
+    *_, in_flight = await asyncio.gather(
+        drain(_batch(4)), drain(_batch(4)), interactive_call()
+    )
+    # two batches together hold half of the 4 slots, leaving room for the run
+    assert workflows["peak"] == 2
+    assert in_flight <= 3
+
+
+@pytest.mark.anyio
+async def test_heartbeats_while_workflows_are_silent(workflows):
+    events = [event async for event in run_workflow_batch(_batch(1), heartbeat_seconds=0.005)]
+    assert None in events
+    assert events[-1]["event"] == "batch_summary"
+
+
+@pytest.mark.anyio
+async def test_batch_endpoint_streams_ndjson(workflows, monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.BATCH_MAX_WORKFLOWS", 3)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        url = "/api/v1/workflow/execute-batch"
+        response = await client.post(url, json=_batch(2, format="ndjson").model_dump(mode="json"))
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[-1]["event"] == "batch_summary"
+        assert lines[-1]["data"]["completed"] == 2
+
+        too_many = await client.post(url, json=_batch(4).model_dump(mode="json"))
+        assert too_many.status_code == 400
+
+        short = {"workflows": [{"prompt": "hi"}]}
+        assert (await client.post(url, json=short)).status_code == 400
@@ -12,6 +12,7 @@ import {
 } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
+import { applyPatch } from "@/lib/json-patch";
 import {
   CheckCircle,
   Clock,
@@ -73,6 +74,8 @@ export default function ApiFlowTester() {
   const [error, setError] = useState<string | null>(null);
   const [expandedSteps, setExpandedSteps] = useState<Set<number>>(new Set());
   const eventSourceRef = useRef<EventSource | null>(null);
+  // data extracted so far; data_extracted events only carry patches to it
+  const extractedDataRef = useRef<any>({});
 
   const curatedPrompts: CuratedPrompt[] = [
     {
@@ -150,6 +153,7 @@ export default function ApiFlowTester() {
     setCurrentStepIndex(-1);
     setExecutionComplete(false);
     setExpandedSteps(new Set());
+    extractedDataRef.current = {};
 
     try {
       if (eventSourceRef.current) {
@@ -171,6 +175,7 @@ export default function ApiFlowTester() {
 
       const reader = response.body?.getReader();
       const decoder = new TextDecoder();
+      let buffered = "";
 
       if (!reader) {
         throw new Error("No reader available");
@@ -179,8 +184,10 @@ export default function ApiFlowTester() {
       while (true) {
         const { done, value } = await reader.read();
         if (done) break;
-        const chunk = decoder.decode(value);
-        const lines = chunk.split("\n");
+        // several events can arrive in one read, and an event can span reads
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop() ?? "";
 
         for (const line of lines) {
           if (line.startsWith("data: ")) {
@@ -238,7 +245,12 @@ export default function ApiFlowTester() {
         });
         break;
 
-      case "data_extracted":
+      case "data_extracted": {
+        extractedDataRef.current = applyPatch(
+          extractedDataRef.current,
+          data.extracted_data_patch
+        );
+        const extractedData = extractedDataRef.current;
         setWorkflowSteps((prev) => {
           const updated = [...prev];
           const stepIndex = prev.findIndex((step) =>
@@ -247,13 +259,14 @@ export default function ApiFlowTester() {
           if (stepIndex !== -1) {
             updated[stepIndex] = {
               ...updated[stepIndex],
-              extractedData: data.extracted_data,
+              extractedData,
               status: "completed",
             };
           }
           return updated;
         });
         break;
+      }
 
       case "error":
         setError(data.detail);
@@ -0,0 +1,34 @@
+export interface PatchOperation {
+  op: "add" | "remove" | "replace";
+  path: string;
+  value?: any;
+}
+
+const unescape = (token: string) =>
+  token.replace(/~1/g, "/").replace(/~0/g, "~");
+
+// Applies the JSON Patch operations the backend streams in `data_extracted`
+// events, returning a new document and leaving `document` untouched.
+export function applyPatch(document: any, operations: PatchOperation[]): any {
+  let result = structuredClone(document ?? {});
+  for (const { op, path, value } of operations) {
+    if (path === "") {
+      result = op === "remove" ? {} : structuredClone(value);
+      continue;
+    }
+    const tokens = path.slice(1).split("/").map(unescape);
+    const key = tokens.pop()!;
+    const parent = tokens.reduce((node, token) => node[token], result);
+    if (Array.isArray(parent)) {
+      const index = key === "-" ? parent.length : Number(key);
+      if (op === "remove") parent.splice(index, 1);
+      else if (op === "add") parent.splice(index, 0, value);
+      else parent[index] = value;
+    } else if (op === "remove") {
+      delete parent[key];
+    } else {
+      parent[key] = value;
+    }
+  }
+  return result;
+}